@@ -0,0 +1,75 @@
+# Helpers for summarizing, storing and comparing benchmark results.
+import json
+import math
+import os
+import platform
+import subprocess
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(sorted_values, p):
+    '''
+    Nearest-rank percentile of an already sorted list.
+    '''
+    index = max(0, min(len(sorted_values) - 1, math.ceil(p / 100. * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def summarize(latencies, duration=None):
+    '''
+    Count, throughput and latency percentiles (in seconds) of a list of latencies.
+    '''
+    latencies = sorted(latencies)
+    if not latencies:
+        return dict(count=0)
+
+    summary = dict(count=len(latencies), max=latencies[-1], **{f'p{p}': percentile(latencies, p) for p in PERCENTILES})
+    if duration:
+        summary['throughput'] = len(latencies) / duration
+    return summary
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+def write_results(name, config, results, path=None):
+    '''
+    Store benchmark results as JSON, tagged with the current git commit.
+    '''
+    commit = git_commit()
+    path = path or os.path.join(RESULTS_DIR, f'{name}_{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    with open(path, 'w') as file:
+        json.dump(dict(benchmark=name, commit=commit, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       python=platform.python_version(), config=config, results=results), file, indent=2)
+    return path
+
+def compare_results(baseline_path, path):
+    '''
+    Print the relative change of all numeric results between two result files.
+    '''
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    with open(path) as file:
+        current = json.load(file)
+
+    print(f'{baseline["commit"]} -> {current["commit"]}')
+    for key, old, new in _flatten(baseline['results'], current['results']):
+        change = f'{100. * (new - old) / old:+8.1f} %' if old else '     n/a'
+        print(f'{key:<60} {old:>14.6g} {new:>14.6g} {change}')
+
+def _flatten(old, new, prefix=''):
+    for key, old_value in old.items():
+        if key not in new:
+            continue
+        name = f'{prefix}.{key}' if prefix else key
+        if isinstance(old_value, dict):
+            yield from _flatten(old_value, new[key], name)
+        elif isinstance(old_value, (int, float)) and isinstance(new[key], (int, float)):
+            yield name, old_value, new[key]
@@ -0,0 +1,95 @@
+# Time per operation of the VTN while Prometheus and Redis hang, without vs. with circuit breaker, and recovery.
+import argparse
+import logging
+import os
+import sys
+import time
+
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stand_ins import FakePrometheus, HangingServer, use_fake_redis
+from vtn_common.time_series_database import TimeSeriesDatabase
+from vtn_common.ven_info_backup import VENInfoBackup
+from vtn_common.ven_records import VENRecord
+
+def time_operations(operation, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        operation()
+    return (time.perf_counter() - start) / n
+
+def run_prometheus(args):
+    TimeSeriesDatabase.QUERY_TIMEOUT = args.timeout
+    hanging = HangingServer().start()
+    tsdb = TimeSeriesDatabase(vtn_id='VTN', db_host_url=hanging.url, db_client_port=args.client_port)
+    names = [f'VTN:REPORT:VEN_{i}:resource_0:power' for i in range(args.metrics)]
+    breaker = tsdb._prometheus_breaker
+
+    # Without circuit breaker, every operation waits for the deadline.
+    breaker.failure_threshold = float('inf')
+    yield 'prometheus down, no breaker', time_operations(lambda: tsdb.get_latest_values(names), args.slow_operations)
+
+    breaker.failure_threshold = breaker.FAILURE_THRESHOLD
+    breaker.reset_timeout = args.reset_timeout
+    time_operations(lambda: tsdb.get_latest_values(names), breaker.failure_threshold)
+    yield 'prometheus down, breaker', time_operations(lambda: tsdb.get_latest_values(names), args.operations)
+
+    # Prometheus is back on the same port: the half-open probe closes the breaker.
+    hanging.stop()
+    prometheus = FakePrometheus(port=hanging.port).start()
+    prometheus.values.update({name: 1. for name in names})
+    time.sleep(args.reset_timeout)
+    found = len(tsdb.get_latest_values(names))
+    yield f'prometheus recovered ({breaker.state}, {found} values)', \
+        time_operations(lambda: tsdb.get_latest_values(names), args.operations)
+    prometheus.stop()
+
+def run_redis(args):
+    VENInfoBackup.REDIS_TIMEOUT = args.timeout
+    use_fake_redis()
+    backup = VENInfoBackup(host='localhost', port=6379)
+    ven_info = {f'VEN_ID_{i}': VENRecord(ven_id=f'VEN_ID_{i}', ven_name=f'VEN_{i}', registration_id=f'REG_ID_{i}')
+                for i in range(args.vens)}
+    breaker = backup._redis_breaker
+
+    # Redis hangs after the VEN info has been loaded at startup.
+    hanging = HangingServer().start()
+    healthy_redis_api = backup._redis_api
+    backup._redis_api = redis.Redis(host=hanging.host, port=hanging.port, socket_timeout=args.timeout,
+                                    socket_connect_timeout=args.timeout, retry=Retry(NoBackoff(), 0))
+
+    breaker.failure_threshold = float('inf')
+    yield 'redis down, no breaker', time_operations(lambda: backup.update(ven_info), args.slow_operations)
+
+    breaker.failure_threshold = breaker.FAILURE_THRESHOLD
+    breaker.reset_timeout = args.reset_timeout
+    time_operations(lambda: backup.update(ven_info), breaker.failure_threshold)
+    yield 'redis down, breaker', time_operations(lambda: backup.update(ven_info), args.operations)
+
+    # Redis is back: the pending VEN info is written by the half-open probe.
+    hanging.stop()
+    backup._redis_api = healthy_redis_api
+    time.sleep(args.reset_timeout)
+    flushed = backup.flush()
+    yield f'redis recovered ({breaker.state}, flushed: {flushed})', \
+        time_operations(lambda: backup.update(ven_info), args.operations)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the circuit breakers (hanging Prometheus and Redis).')
+    parser.add_argument('--operations', type=int, default=1000, help='number of operations (breaker)')
+    parser.add_argument('--slow-operations', type=int, default=5, help='number of operations (no breaker)')
+    parser.add_argument('--timeout', type=float, default=0.5, help='deadline of a query / command [s]')
+    parser.add_argument('--reset-timeout', type=float, default=1., help='reset timeout of the breakers [s]')
+    parser.add_argument('--metrics', type=int, default=100, help='number of metrics read per operation')
+    parser.add_argument('--vens', type=int, default=100, help='number of VENs in the VEN info')
+    parser.add_argument('--client-port', type=int, default=8499, help='port of the Prometheus client')
+    args = parser.parse_args()
+    logging.getLogger('openleadr').setLevel(logging.CRITICAL)
+
+    print(f'deadline = {args.timeout} s, reset timeout = {args.reset_timeout} s')
+    for run in (run_prometheus, run_redis):
+        for name, duration in run(args):
+            print(f'{name:>44}: {1e6 * duration:12.1f} us/operation')
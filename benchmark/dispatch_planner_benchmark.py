@@ -0,0 +1,65 @@
+# Benchmark of the dispatch planner (event values for a whole VEN fleet).
+import argparse
+import logging
+import os
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import numpy as np
+from vtn_common.dispatch_planner import DispatchPlanner
+from vtn_common.logger import LOGGER
+from vtn_common.time_series_database import TimeSeriesDatabase
+from stand_ins import FakePrometheus
+
+VTN_ID = 'VTN_BENCHMARK'
+EVENT_TYPE = 'LOAD_DISPATCH'
+PROMETHEUS_CLIENT_PORT = 8096
+
+def best_of(repeat, function, *args):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the dispatch planner.')
+    parser.add_argument('--vens', type=int, default=5000, help='number of VENs')
+    parser.add_argument('--resources', type=int, default=2, help='number of resources per VEN')
+    parser.add_argument('--forecasts', type=float, default=0.5, help='share of resources with a flex forecast')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repetitions (the best one counts)')
+    args = parser.parse_args()
+    LOGGER.setLevel(logging.WARNING)
+
+    prometheus = FakePrometheus().start()
+    time_series_db = TimeSeriesDatabase(vtn_id=VTN_ID, db_host_url=prometheus.url,
+                                        db_client_port=PROMETHEUS_CLIENT_PORT)
+    planner = DispatchPlanner(vtn_id=VTN_ID, time_series_db=time_series_db, event_type=EVENT_TYPE,
+                              clip_range=(0., 1.5), with_current_values=True)
+
+    targets = [(f'VEN_{i:05d}', f'resource_{r:03d}') for i in range(args.vens) for r in range(args.resources)]
+    for ven_id, resource_id in targets[:int(args.forecasts * len(targets))]:
+        prometheus.values[f'{VTN_ID}:FLEX:{ven_id}:{resource_id}'] = 1.5
+
+    forecasts = np.where(np.arange(len(targets)) < args.forecasts * len(targets), 1.5, np.nan)
+    current_values = np.full(len(targets), np.nan)
+
+    plan = planner.plan(targets)
+    assert int(args.forecasts * len(targets)) == np.count_nonzero(plan.from_forecast)
+
+    print(f'{len(targets)} resources ({args.vens} VENs)')
+    print(f'compute plan:        {1e3 * best_of(args.repeat, planner.compute, targets, forecasts, current_values):9.2f} ms')
+    print(f'load and plan:       {1e3 * best_of(args.repeat, planner.plan, targets):9.2f} ms')
+
+    # The event series written by the VTN itself are read from the local store instead of Prometheus.
+    for ven_id, resource_id in targets:
+        time_series_db.init_time_series(ven_id)
+        time_series_db.add_time_series(ven_id, resource_id, 'REAL_POWER', EVENT_TYPE)
+    print(f'load, own events:    {1e3 * best_of(args.repeat, planner.plan, targets):9.2f} ms')
+    print(f'iterate plan:        {1e3 * best_of(args.repeat, list, planner.compute(targets, forecasts)):9.2f} ms')
+
+    prometheus.stop()
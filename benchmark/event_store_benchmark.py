@@ -0,0 +1,67 @@
+# Events kept by a poll-mode VTN during a long periodic event task, without vs. with the event store.
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from openleadr import OpenADRServer
+from openleadr.messaging import create_message
+from openleadr.objects import Target
+from openleadr.utils import order_events
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vtn_common.event_store import EventStore
+
+VEN_ID = 'VEN_ID_BENCHMARK'
+
+def distribute_events(vtn, ven_id):
+    """
+    Time for ordering and serializing the events of a VEN (as for a poll).
+    """
+    start = time.perf_counter()
+    events = order_events(vtn.services['event_service'].events.get(ven_id, []))
+    message = create_message('oadrDistributeEvent', request_id='RQ', vtn_id='VTN', events=events)
+    return time.perf_counter() - start, len(message)
+
+def run_benchmark(with_event_store, args):
+    vtn = OpenADRServer(vtn_id='VTN', http_host='localhost')
+    event_store = EventStore(vtn.services['event_service']) if with_event_store else None
+
+    # Periodic events as added by 'add_new_event' (10-minute events starting 5 minutes out).
+    now = datetime.now(timezone.utc)
+    expiry_time = 0.
+    for _ in range(args.events):
+        for resource in range(args.resources):
+            event_id = vtn.add_event(ven_id=VEN_ID, target=Target(ven_id=VEN_ID, resource_id=f'resource_{resource}'),
+                                     signal_name='LOAD_DISPATCH', signal_type='setpoint',
+                                     intervals=[{'dtstart': now + timedelta(minutes=5),
+                                                 'duration': timedelta(minutes=10), 'signal_payload': 1.}],
+                                     market_context='oadr://my_market', callback=on_event_response)
+            if event_store is not None:
+                event_store.add(VEN_ID, event_id)
+        now += timedelta(seconds=args.period)
+        if event_store is not None:
+            start = time.perf_counter()
+            event_store.expire(now)
+            expiry_time += time.perf_counter() - start
+
+    duration, size = distribute_events(vtn, VEN_ID)
+    return len(vtn.services['event_service'].events[VEN_ID]), duration, size, expiry_time
+
+async def on_event_response(ven_id, event_id, opt_type):
+    pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the event store.')
+    parser.add_argument('--events', type=int, default=2000, help='number of events per resource')
+    parser.add_argument('--resources', type=int, default=2, help='number of resources of the VEN')
+    parser.add_argument('--period', type=float, default=60., help='period of the events [s]')
+    args = parser.parse_args()
+    logging.getLogger('openleadr').setLevel(logging.WARNING)
+
+    print(f'{args.events} events per resource, {args.resources} resources, every {args.period} s')
+    for name, with_event_store in (('without store', False), ('with store', True)):
+        events, duration, size, expiry_time = run_benchmark(with_event_store, args)
+        print(f'{name:>14}: {events:6d} events kept, distribute = {1e3 * duration:8.2f} ms ({size} bytes), '
+              f'expiry = {1e6 * expiry_time / (args.events * args.resources):5.1f} us/event')
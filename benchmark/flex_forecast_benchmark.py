@@ -0,0 +1,48 @@
+# Cycle time of the flex forecast service (CPU-heavy forecasts per resource): single process vs. process pool.
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flex-trialog'))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import flex_trialog
+
+def cpu_forecast(ven_id, resource_id, work):
+    """
+    Forecast emulating a CPU-heavy model (work: number of iterations).
+    """
+    x = 0.
+    for i in range(work):
+        x = (x + i * 1e-3) % 10.
+    return round(x, 2)
+
+def run_cycle(executor, chunk_size, work):
+    start = time.perf_counter()
+    flex_trialog.retrieve_flex_forecasts(executor, chunk_size, partial(cpu_forecast, work=work))
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the flex forecast computation.')
+    parser.add_argument('--resources', type=int, default=20000, help='number of resources')
+    parser.add_argument('--resources-per-ven', type=int, default=2, help='number of resources per VEN')
+    parser.add_argument('--work', type=int, default=2000, help='iterations per forecast (CPU load)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[100, 1000, 5000], help='resources per chunk')
+    args = parser.parse_args()
+    flex_trialog.LOGGER.setLevel(logging.WARNING)
+
+    flex_trialog.VEN_INFO = {f'VEN_ID_{i}': {'resource_ids': [f'resource_{j}' for j in range(args.resources_per_ven)]}
+                             for i in range(args.resources // args.resources_per_ven)}
+    flex_trialog.update_prometheus_client()
+
+    print(f'{args.resources} resources, {args.work} iterations per forecast, {args.workers} workers')
+    print(f'{"single process":>24}: cycle = {run_cycle(None, args.resources, args.work):7.3f} s')
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=flex_trialog.init_worker) as executor:
+        # Start the workers before measuring.
+        run_cycle(executor, max(1, args.resources // args.workers), 0)
+        for chunk_size in args.chunk_sizes:
+            print(f'{f"pool, chunks of {chunk_size}":>24}: cycle = {run_cycle(executor, chunk_size, args.work):7.3f} s')
@@ -0,0 +1,59 @@
+# Import time (cold start) of the entry points that use vtn_common, each measured in a fresh interpreter.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry point -> code that imports it (the container scripts are run without their '__main__' block).
+ENTRY_POINTS = {
+    'terminal': 'from vtn_common.vtn_terminal import *',
+    'vtn_common': 'import vtn_common',
+    'monitor': 'from vtn_common import VTNMonitor',
+    'poll_server': 'from vtn_common import VTNPollServer',
+    'push_server': 'from vtn_common import VTNPushServerWithPreregistration',
+    'vtn_poll': f'import runpy; runpy.run_path({os.path.join(REPO_DIR, "vtn_poll", "main.py")!r})',
+    'vtn_push': f'import runpy; runpy.run_path({os.path.join(REPO_DIR, "vtn_push", "main.py")!r})',
+}
+
+# Dependencies that are slow to import.
+HEAVY_MODULES = ('aiomonitor', 'openleadr', 'openleadr_push_mode', 'prometheus_api_client', 'numpy', 'pandas',
+                 'redis', 'lxml.etree')
+
+MEASURE = '''
+import json, sys, time
+sys.path.insert(0, {repo_dir!r})
+start = time.perf_counter()
+{code}
+import_time = time.perf_counter() - start
+# Modules that are only registered for a lazy import have not been executed yet.
+loaded = [name for name in {heavy_modules!r}
+          if name in sys.modules and not type(sys.modules[name]).__name__.startswith('_Lazy')]
+print(json.dumps(dict(import_time=import_time, modules=len(sys.modules), loaded=loaded)))
+'''
+
+def measure(code):
+    script = MEASURE.format(repo_dir=REPO_DIR, code=code, heavy_modules=HEAVY_MODULES)
+    process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True)
+    if 0 != process.returncode:
+        return dict(error=process.stderr.strip().splitlines()[-1])
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the import time of the vtn_common entry points.')
+    parser.add_argument('--repeat', type=int, default=5, help='number of fresh interpreters per entry point')
+    parser.add_argument('--entry-point', action='append', choices=list(ENTRY_POINTS),
+                        help='entry point to measure (default: all, can be repeated)')
+    args = parser.parse_args()
+
+    for name in args.entry_point or ENTRY_POINTS:
+        results = [measure(ENTRY_POINTS[name]) for _ in range(args.repeat)]
+        if 'error' in results[0]:
+            print(f'{name:>12}: {results[0]["error"]}')
+            continue
+        import_time = statistics.median(result['import_time'] for result in results)
+        print(f'{name:>12}: {1e3 * import_time:7.1f} ms, {results[0]["modules"]:4d} modules, '
+              f'loaded: {", ".join(results[0]["loaded"]) or "-"}')
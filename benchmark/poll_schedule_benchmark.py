@@ -0,0 +1,61 @@
+# Smoothness of the poll rate after a registration storm: the same poll frequency for all VENs vs. the poll schedule.
+import argparse
+import os
+import random
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vtn_common.poll_schedule import PollSchedule
+
+BUCKET_WIDTH = 0.1
+
+def simulate_polls(schedule, vens, storm, duration, rng):
+    """
+    Simulate OpenLEADR VEN clients: all VENs register within the storm period,
+    poll once right after the registration and then with their poll frequency.
+    """
+    poll_times = []
+    for i in range(vens):
+        ven_name = f'VEN_{i:06d}'
+        registered = rng.uniform(0., storm)
+        poll_freq = schedule.poll_freq(ven_name, vens)
+        first_poll = registered + schedule.registration_delay(ven_name, poll_freq) + \
+            rng.uniform(0.05, 0.15)
+
+        period = poll_freq.total_seconds()
+        poll_times.extend(first_poll + k * period for k in range(int((duration - first_poll) / period) + 1))
+    return poll_times
+
+def smoothness(poll_times, duration, warm_up):
+    counts = [0] * int((duration - warm_up) / BUCKET_WIDTH)
+    for poll_time in poll_times:
+        if warm_up <= poll_time < duration:
+            counts[min(len(counts) - 1, int((poll_time - warm_up) / BUCKET_WIDTH))] += 1
+
+    mean = sum(counts) / len(counts)
+    cv = (sum((count - mean)**2 for count in counts) / len(counts))**0.5 / mean
+    return mean / BUCKET_WIDTH, max(counts) / BUCKET_WIDTH, cv
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the poll schedule (simulated VEN fleet).')
+    parser.add_argument('--vens', type=int, default=1000, help='number of VENs')
+    parser.add_argument('--poll-freq', type=float, default=5., help='requested poll frequency [s]')
+    parser.add_argument('--storm', type=float, default=1., help='period in which all VENs register [s]')
+    parser.add_argument('--duration', type=float, default=300., help='simulated duration [s]')
+    parser.add_argument('--warm-up', type=float, default=30., help='period excluded from the results [s]')
+    parser.add_argument('--max-poll-rate', type=float, default=None, help='maximum number of polls per second')
+    args = parser.parse_args()
+
+    requested_poll_freq = timedelta(seconds=args.poll_freq)
+    schedules = {
+        'same': PollSchedule(requested_poll_freq, jitter=0., phase_spreading=False),
+        'jitter': PollSchedule(requested_poll_freq, phase_spreading=False),
+        'jitter+phase': PollSchedule(requested_poll_freq, max_poll_rate=args.max_poll_rate),
+    }
+
+    print(f'{args.vens} VENs, registered within {args.storm} s, buckets of {1e3 * BUCKET_WIDTH:.0f} ms')
+    for name, schedule in schedules.items():
+        poll_times = simulate_polls(schedule, args.vens, args.storm, args.duration, random.Random(0))
+        mean_rate, peak_rate, cv = smoothness(poll_times, args.duration, args.warm_up)
+        print(f'{name:>14}: mean = {mean_rate:7.1f} polls/s, peak = {peak_rate:7.1f} polls/s, cv = {cv:5.2f}')
@@ -0,0 +1,201 @@
+# Event dispatch latency of the POLL MODE VTN under a synthetic report flood: with vs. without priority lanes.
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from aiohttp import ClientSession, TCPConnector
+from openleadr.messaging import create_message
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from vtn_common.logger import LOGGER
+from benchmark_results import summarize, write_results, compare_results
+from stand_ins import FakePrometheus, use_fake_redis
+from vtn_benchmark_suite import (MEASUREMENT, VTN_HOST, VTN_ID, VTN_PORT, VTN_PROMETHEUS_CLIENT_PORT, HEADERS,
+                                 VTN_URL, post_message, update_report_message)
+
+async def flood(messages, flooders, duration):
+    '''
+    Send the reports back-to-back with several concurrent senders, return the
+    number of responses per HTTP status.
+    '''
+    statuses = {}
+    stop_time = time.perf_counter() + duration
+    async with ClientSession(connector=TCPConnector(limit=flooders)) as session:
+        async def send(flooder):
+            number = flooder
+            while time.perf_counter() < stop_time:
+                try:
+                    async with session.post(f'{VTN_URL}/EiReport', data=messages[number % len(messages)],
+                                            headers=HEADERS) as response:
+                        await response.read()
+                        status = response.status
+                except Exception:
+                    status = 0
+                statuses[status] = statuses.get(status, 0) + 1
+                number += flooders
+
+        await asyncio.gather(*[send(flooder) for flooder in range(flooders)])
+    return statuses
+
+def run_flood(messages, flooders, duration, queue):
+    queue.put(asyncio.run(flood(messages, flooders, duration)))
+
+async def benchmark(args, prometheus):
+    from vtn_common.vtn_poll_server import VTNPollServer
+    from vtn_common.patch_report_request import patch_report_request
+    from vtn_common.patch_update_report import patch_update_report
+    from vtn_common.message_fast_path import patch_message_fast_path
+    from vtn_common.priority_lanes import patch_priority_lanes
+
+    VTNPollServer.TIME_SERIES_DB_HOST_URL = prometheus.url
+    VTNPollServer.TIME_SERIES_DB_CLIENT_PORT = VTN_PROMETHEUS_CLIENT_PORT
+    VTNPollServer.POLL_PHASE_SPREADING = False
+
+    vtn_server = VTNPollServer(vtn_id=VTN_ID, http_host=VTN_HOST, http_port=VTN_PORT,
+                               requested_poll_freq=timedelta(seconds=5))
+    patch_update_report(vtn=vtn_server, vtn_id=VTN_ID)
+    patch_message_fast_path(vtn=vtn_server)
+    if args.lanes:
+        patch_priority_lanes(vtn=vtn_server)
+    await vtn_server.run()
+    patch_report_request(vtn_server)
+
+    ven_names = [f'BENCH_VEN_{i:05d}' for i in range(args.vens)]
+    r_ids = [f'r_{resource:03d}' for resource in range(args.resources)]
+    session = ClientSession()
+
+    # Register the VENs and set up the report callbacks as the report registration would do.
+    ven_ids = []
+    for ven_name in ven_names:
+        message = create_message('oadrCreatePartyRegistration', request_id=f'RQ_{ven_name}', ven_name=ven_name,
+                                 http_pull_model=True, xml_signature=False, report_only=False,
+                                 profile_name='2.0b', transport_name='simpleHttp')
+        _, payload = await post_message(session, 'EiRegisterParty', message)
+        ven_ids.append(payload['ven_id'])
+    for ven_id in ven_ids:
+        for r_id in r_ids:
+            vtn_server._create_report_callback(ven_id=ven_id, resource_id=f'resource_{r_id}', measurement=MEASUREMENT,
+                                               report_request_id=f'RR_{ven_id}', r_id=r_id)
+            prometheus.values[f'{VTN_ID}:FLEX:{ven_id}:resource_{r_id}'] = 1.5
+
+    # Report flood from separate processes (the flood clients do not load the VTN's event loop).
+    messages = [update_report_message(ven_id, f'RR_{ven_id}', r_ids, args.intervals) for ven_id in ven_ids]
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    flood_processes = [context.Process(target=run_flood, args=(messages[process::args.flood_processes],
+                                                                args.flooders // args.flood_processes,
+                                                                args.duration, queue))
+                       for process in range(args.flood_processes)]
+    for process in flood_processes:
+        process.start()
+    # Wait until the flood has started.
+    await asyncio.sleep(1.)
+    stop_time = time.perf_counter() + args.duration - 1.
+
+    # Event dispatch: create an event for a VEN and deliver it with the VEN's next poll.
+    dispatch_latencies = []
+
+    async def dispatch():
+        number = 0
+        while time.perf_counter() < stop_time:
+            ven_id = ven_ids[number % len(ven_ids)]
+            start = time.perf_counter()
+            await vtn_server.add_new_event(ven_id=ven_id, event_task_id=None, period=None, delay=0)
+            response_type, _ = await post_message(session, 'OadrPoll', create_message('oadrPoll', ven_id=ven_id))
+            if 'oadrDistributeEvent' == response_type:
+                dispatch_latencies.append(time.perf_counter() - start)
+            number += 1
+            await asyncio.sleep(args.dispatch_period)
+
+    await dispatch()
+    statuses = {}
+    for _ in flood_processes:
+        for status, count in (await asyncio.get_running_loop().run_in_executor(None, queue.get)).items():
+            statuses[status] = statuses.get(status, 0) + count
+    for process in flood_processes:
+        process.join()
+
+    results = {
+        'event_dispatch': summarize(dispatch_latencies, args.duration - 1.),
+        'report_flood': dict(reports_per_second=statuses.get(200, 0) / args.duration,
+                             statuses={str(status): count for status, count in sorted(statuses.items())}),
+    }
+    if args.lanes:
+        results['lanes'] = vtn_server.priority_lanes.status()
+
+    await session.close()
+    await vtn_server.stop()
+    return results
+
+def run_variant(args):
+    '''
+    Run the benchmark for one variant (with or without lanes) in the current process.
+    '''
+    LOGGER.setLevel(logging.WARNING)
+    use_fake_redis()
+    prometheus = FakePrometheus().start()
+    try:
+        return asyncio.new_event_loop().run_until_complete(benchmark(args, prometheus))
+    finally:
+        prometheus.stop()
+
+def print_results(results):
+    print(f'{"variant":<16} {"dispatches":>10} {"p50 [ms]":>10} {"p99 [ms]":>10} {"max [ms]":>10} '
+          f'{"reports/s":>10}  report statuses')
+    for variant, result in results.items():
+        dispatch = result['event_dispatch']
+        print(f'{variant:<16} {dispatch["count"]:>10} ' +
+              ' '.join(f'{1e3 * dispatch.get(p, float("nan")):>10.1f}' for p in ('p50', 'p99', 'max')) +
+              f' {result["report_flood"]["reports_per_second"]:>10.1f}  {result["report_flood"]["statuses"]}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the priority lanes under a report flood.')
+    parser.add_argument('--vens', type=int, default=100, help='number of VENs')
+    parser.add_argument('--resources', type=int, default=2, help='number of resources per VEN')
+    parser.add_argument('--intervals', type=int, default=20, help='number of intervals per report')
+    parser.add_argument('--flooders', type=int, default=200, help='number of concurrent report senders')
+    parser.add_argument('--flood-processes', type=int, default=2, help='number of processes sending the reports')
+    parser.add_argument('--duration', type=float, default=20., help='duration of the flood [s]')
+    parser.add_argument('--dispatch-period', type=float, default=0.2, help='time between event dispatches [s]')
+    parser.add_argument('--lanes', type=int, choices=[0, 1], default=None, help='run only this variant')
+    parser.add_argument('--output', default=None, help='path of the JSON result file')
+    # Internal: result file of a worker process (single variant).
+    parser.add_argument('--worker-output', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+    elif args.worker_output:
+        # Worker process for a single variant.
+        with open(args.worker_output, 'w') as file:
+            json.dump(run_variant(args), file)
+    else:
+        # Run each variant in a separate process (OpenLEADR keeps class-level state).
+        results = {}
+        for lanes in [args.lanes] if args.lanes is not None else [0, 1]:
+            variant = 'priority lanes' if lanes else 'no lanes'
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output = os.path.join(tmp_dir, 'results.json')
+                command = [sys.executable, __file__, '--lanes', str(lanes), '--worker-output', output] + \
+                    [f'--{key.replace("_", "-")}={value}' for key, value in vars(args).items()
+                     if key not in ('lanes', 'output', 'worker_output', 'compare')]
+                if 0 != subprocess.run(command).returncode:
+                    print(f'Benchmark for variant "{variant}" failed, skipping.')
+                    continue
+                with open(output) as file:
+                    results[variant] = json.load(file)
+
+        print_results(results)
+        config = {key: value for key, value in vars(args).items()
+                  if key not in ('lanes', 'output', 'worker_output', 'compare')}
+        print('Results written to', write_results('priority_lanes', config, results, path=args.output))
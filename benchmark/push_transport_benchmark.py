@@ -0,0 +1,124 @@
+# Benchmark of the push path of the PUSH MODE VTN: a new client session per push vs. the VTN's pooled push_event.
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from aiohttp import ClientSession
+from aiohttp.web import Application, AppRunner, TCPSite, Response, post
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from vtn_common.logger import LOGGER
+from vtn_common.runtime_profile import RuntimeProfile
+from benchmark_results import summarize
+
+VEN_HOST = 'localhost'
+FIRST_VEN_PORT = 8200
+VEN_PATH = '/OpenADR2/Simple/2.0b'
+VTN_ID = 'VTN_BENCHMARK'
+HEADERS = {'Content-Type': 'application/xml'}
+
+async def start_ven_listeners(number_of_vens):
+    '''
+    Minimal push-mode VEN listeners (one port per VEN) that acknowledge every message.
+    '''
+    async def handle(request):
+        await request.read()
+        return Response(text='', content_type='application/xml')
+
+    app = Application()
+    app.add_routes([post(VEN_PATH + '/EiEvent', handle)])
+    runner = AppRunner(app, access_log=None)
+    await runner.setup()
+    for i in range(number_of_vens):
+        await TCPSite(runner, VEN_HOST, FIRST_VEN_PORT + i).start()
+    return runner
+
+def create_vtn(urls, profile):
+    '''
+    PUSH MODE VTN with the VENs pre-registered at the given URLs (the server is not started).
+    '''
+    from vtn_common.vtn_push_server_with_preregistration import VTNPushServerWithPreregistration
+
+    preregistration_list = {f'VEN_{i:05d}': dict(ven_id=f'VEN_ID_{i:05d}', registration_id=f'REG_{i:05d}',
+                                                 url=url, reports=[])
+                            for i, url in enumerate(urls)}
+    vtn = VTNPushServerWithPreregistration(vtn_id=VTN_ID, ven_preregistration_list=preregistration_list)
+    vtn.runtime_profile = vtn.push_transport.runtime_profile = profile
+    return vtn
+
+def push_arguments(ven_id):
+    # Arguments of the VTN's event pushes (see 'VTNPushServerWithPreregistration._push_planned_event').
+    return dict(ven_id=ven_id, priority=1, signal_name='LOAD_DISPATCH', signal_type='delta',
+                measurement_name='REAL_POWER', scale='k',
+                intervals=[{'dtstart': datetime.now(timezone.utc) + timedelta(minutes=5),
+                            'duration': timedelta(minutes=10), 'signal_payload': 1.}],
+                market_context='oadr://my_market', current_value=0., response_required='never')
+
+async def push_with_new_session(vtn, url, ven_id, latencies):
+    # As the push-mode library does: render the event, push it with a new client session (and connection).
+    start = time.perf_counter()
+    message = vtn.services['event_service']._create_message(
+        'oadrDistributeEvent', request_id=f'RQ_{ven_id}', vtn_id=VTN_ID,
+        events=[vtn._create_event(**push_arguments(ven_id))])
+    async with ClientSession() as session:
+        async with session.post(url, data=message, headers=HEADERS) as response:
+            await response.read()
+    latencies.append(time.perf_counter() - start)
+
+async def push_with_vtn(vtn, ven_id, latencies):
+    start = time.perf_counter()
+    if await vtn.push_event(**push_arguments(ven_id)) is not None:
+        latencies.append(time.perf_counter() - start)
+
+async def run_benchmark(args):
+    urls = args.url or [f'http://{VEN_HOST}:{FIRST_VEN_PORT + i}{VEN_PATH}' for i in range(args.vens)]
+    listeners = None if args.url else await start_ven_listeners(len(urls))
+
+    vtn = create_vtn(urls, RuntimeProfile(args.profile))
+    ven_ids = [info['ven_id'] for info in vtn.ven_preregistration_list.values()]
+
+    results = {}
+    for name in ('new_session', 'vtn_push_path'):
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(args.rounds):
+            # Every round pushes one event to every VEN (one push per resource).
+            if 'vtn_push_path' == name:
+                pushes = [push_with_vtn(vtn, ven_id, latencies) for ven_id in ven_ids for _ in range(args.resources)]
+            else:
+                pushes = [push_with_new_session(vtn, url.rstrip('/') + '/EiEvent', ven_id, latencies)
+                          for ven_id, url in zip(ven_ids, urls) for _ in range(args.resources)]
+            await asyncio.gather(*pushes)
+        results[name] = summarize(latencies, time.perf_counter() - start)
+        results[name]['failed'] = args.rounds * args.resources * len(urls) - len(latencies)
+
+    results['vtn_push_path']['pool'] = vtn.push_transport.pool_statistics()
+    await vtn.push_transport.close()
+    if listeners:
+        await listeners.cleanup()
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the push path of the PUSH MODE VTN.')
+    parser.add_argument('--vens', type=int, default=100, help='number of local VEN listeners')
+    parser.add_argument('--resources', type=int, default=2, help='number of pushes per VEN and round')
+    parser.add_argument('--rounds', type=int, default=5, help='number of rounds')
+    parser.add_argument('--profile', default='tuned', help='runtime profile (connection pool settings)')
+    parser.add_argument('--url', action='append', help='push to the VEN with this base URL instead of local '
+                        'listeners, e.g., the listener of test/ven_hpt_test.py (can be repeated)')
+    args = parser.parse_args()
+
+    LOGGER.setLevel(logging.WARNING)
+    results = asyncio.new_event_loop().run_until_complete(run_benchmark(args))
+    for name, summary in results.items():
+        pool = summary.pop('pool', None)
+        print(f'{name:>14}: {summary["throughput"]:8.1f} pushes/s, p50 = {1e3 * summary["p50"]:7.2f} ms, '
+              f'p99 = {1e3 * summary["p99"]:7.2f} ms, failed = {summary["failed"]}')
+        if pool:
+            pool.pop('hosts')
+            print(f'{"":>14}  {pool}')
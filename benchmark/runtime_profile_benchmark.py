@@ -0,0 +1,62 @@
+# Throughput benchmark comparing the VTN runtime profiles under synthetic VEN load.
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from aiohttp import ClientSession
+from openleadr import OpenADRServer
+from openleadr.messaging import create_message
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vtn_common.runtime_profile import RuntimeProfile, patch_runtime_profile
+
+VTN_ID = 'VTN_BENCHMARK'
+VTN_HOST = 'localhost'
+VTN_PORT = 8099
+VTN_URL = f'http://{VTN_HOST}:{VTN_PORT}/OpenADR2/Simple/2.0b/OadrPoll'
+
+NUMBER_OF_VENS = 200
+REQUESTS_PER_VEN = 50
+
+async def ven_poll_loop(session, ven_id, latencies):
+    '''
+    Simulate a poll-mode VEN that polls the VTN as fast as possible.
+    '''
+    message = create_message('oadrPoll', ven_id=ven_id)
+    headers = {'Content-Type': 'application/xml'}
+    for _ in range(REQUESTS_PER_VEN):
+        start = time.perf_counter()
+        async with session.post(VTN_URL, data=message, headers=headers) as response:
+            await response.read()
+        latencies.append(time.perf_counter() - start)
+
+async def run_benchmark(profile):
+    vtn_server = OpenADRServer(vtn_id=VTN_ID, http_host=VTN_HOST, http_port=VTN_PORT)
+    patch_runtime_profile(vtn=vtn_server, profile=profile)
+    await vtn_server.run()
+
+    session = ClientSession(connector=profile.create_connector())
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[ven_poll_loop(session, f'VEN_{i:05d}', latencies) for i in range(NUMBER_OF_VENS)])
+    duration = time.perf_counter() - start
+
+    await session.close()
+    await vtn_server.stop()
+
+    latencies.sort()
+    print(f'{profile.name:>10}: {len(latencies) / duration:10.1f} req/s, '
+          f'p50 = {1e3 * latencies[len(latencies) // 2]:7.2f} ms, '
+          f'p99 = {1e3 * latencies[int(len(latencies) * 0.99)]:7.2f} ms')
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        profile = RuntimeProfile(sys.argv[1])
+        profile.install_event_loop_policy()
+        asyncio.new_event_loop().run_until_complete(run_benchmark(profile))
+    else:
+        # Run each profile in a separate process (the event loop policy is global).
+        print(f'{NUMBER_OF_VENS} VENs x {REQUESTS_PER_VEN} oadrPoll requests')
+        for name in RuntimeProfile.PROFILES:
+            subprocess.run([sys.executable, __file__, name], check=True)
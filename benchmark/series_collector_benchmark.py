@@ -0,0 +1,65 @@
+# Report and event time series exported to Prometheus: a Gauge per series (before) vs. the custom collector (after).
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from prometheus_client import CollectorRegistry, Gauge, generate_latest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vtn_common.series_collector import SeriesCollector
+
+def series_names(vens, resources):
+    return [f'VTN_ID_REPORT_VEN_ID_{i:06d}_resource_{r:03d}_POWER' for i in range(vens) for r in range(resources)]
+
+def gauges(registry, names):
+    series = []
+    for name in names:
+        gauge = Gauge(name, 'POWER', registry=registry)
+        gauge.set(0)
+        series.append(gauge)
+    return series
+
+def collector(registry, names):
+    series_collector = SeriesCollector(registry=registry)
+    return [series_collector.add_series(name, 'POWER') for name in names]
+
+def run_benchmark(name, create_series, names, updates, scrapes):
+    registry = CollectorRegistry()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    series = create_series(registry, names)
+    setup_time = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # Updates in random series order (as the reports of the VENs arrive).
+    rng = random.Random(0)
+    order = [rng.randrange(len(series)) for _ in range(updates)]
+    start = time.perf_counter()
+    for index in order:
+        series[index].set(index)
+    update_time = (time.perf_counter() - start) / updates
+
+    start = time.perf_counter()
+    for _ in range(scrapes):
+        exposition = generate_latest(registry)
+    scrape_time = (time.perf_counter() - start) / scrapes
+
+    print(f'{name:>10}: setup = {setup_time:6.2f} s, memory = {memory / len(series):6.0f} bytes/series, '
+          f'update = {1e9 * update_time:5.0f} ns, scrape = {1e3 * scrape_time:7.1f} ms ({len(exposition)} bytes)')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the Prometheus export of the time series.')
+    parser.add_argument('--vens', type=int, default=5000, help='number of VENs')
+    parser.add_argument('--resources', type=int, default=2, help='number of resources per VEN')
+    parser.add_argument('--updates', type=int, default=1000000, help='number of updates')
+    parser.add_argument('--scrapes', type=int, default=5, help='number of scrapes')
+    args = parser.parse_args()
+
+    names = series_names(args.vens, args.resources)
+    print(f'{len(names)} series')
+    run_benchmark('gauges', gauges, names, args.updates, args.scrapes)
+    run_benchmark('collector', collector, names, args.updates, args.scrapes)
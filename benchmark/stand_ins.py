@@ -0,0 +1,109 @@
+# Local stand-ins for the external services used by the VTN servers (Prometheus and Redis).
+import json
+import re
+import socket
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FAKE_PROMETHEUS_HOST = 'localhost'
+FAKE_PROMETHEUS_PORT = 9099
+
+class FakePrometheusHandler(BaseHTTPRequestHandler):
+    '''
+    Answers instant queries ('/api/v1/query') with the values stored in the server.
+    Supported are queries of a metric name or a set of names ('{__name__=~"a|b"}').
+    '''
+
+    NAME_SELECTOR_PATTERN = re.compile(r'^\{__name__=~"([^"]*)"\}$')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query).get('query', [''])[0]
+
+        if url.path.endswith('/query'):
+            match = self.NAME_SELECTOR_PATTERN.match(query)
+            names = match.group(1).split('|') if match else [query]
+            result = [{'metric': {'__name__': name}, 'value': [0, str(self.server.values[name])]}
+                      for name in names if self.server.values.get(name) is not None]
+            body = json.dumps({'status': 'success', 'data': {'resultType': 'vector', 'result': result}})
+        else:
+            body = json.dumps({'status': 'success', 'data': []})
+
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakePrometheus:
+    '''
+    Fake Prometheus HTTP API, running in a separate thread (the Prometheus API
+    client used by the VTN servers is blocking).
+    '''
+
+    def __init__(self, host=FAKE_PROMETHEUS_HOST, port=FAKE_PROMETHEUS_PORT):
+        self._server = ThreadingHTTPServer((host, port), FakePrometheusHandler)
+        self._server.values = {}
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self.url = f'http://{host}:{port}'
+
+    @property
+    def values(self):
+        return self._server.values
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+class HangingServer:
+    '''
+    TCP server that accepts connections but never answers (an unavailable
+    Prometheus or Redis server), running in a separate thread.
+    '''
+
+    def __init__(self, host='localhost', port=0):
+        self._socket = socket.create_server((host, port))
+        self._connections = []
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self.host, self.port = host, self._socket.getsockname()[1]
+        self.url = f'http://{host}:{self.port}'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # Shutdown interrupts the pending accept (the port can be reused).
+        self._socket.shutdown(socket.SHUT_RDWR)
+        self._socket.close()
+        for connection in self._connections:
+            connection.close()
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            self._connections.append(connection)
+
+def use_fake_redis():
+    '''
+    Replace the Redis client used by the VTN servers with fakeredis.
+    '''
+    import fakeredis
+    from vtn_common import ven_info_backup
+
+    server = fakeredis.FakeServer()
+    ven_info_backup.redis = SimpleNamespace(Redis=lambda host, port, **kwargs: fakeredis.FakeRedis(server=server))
+    return server
@@ -0,0 +1,157 @@
+# Replay of a captured VTN session (see vtn_common/traffic_capture.py) against a local VTN, time-compressed.
+import argparse
+import asyncio
+import os
+import sys
+import time
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark_results import summarize, write_results, compare_results
+from vtn_common.raw_message import find_response_code
+from vtn_common.traffic_capture import INBOUND_REQUEST, OUTBOUND_REQUEST, OUTBOUND_RESPONSE, read_capture
+
+HEADERS = {'Content-Type': 'application/xml'}
+
+def load_exchanges(path):
+    """
+    Return the captured requests of the VENs (ordered by time), each with
+    its recorded response (None if the response was not captured), and the
+    number of requests sent by the VTN per service (not replayed).
+    """
+    exchanges = []
+    pending = {}
+    outbound_requests = {}
+    for message in read_capture(path):
+        if OUTBOUND_REQUEST == message.direction:
+            service = message.path.rsplit('/', 1)[-1]
+            outbound_requests[service] = outbound_requests.get(service, 0) + 1
+        elif INBOUND_REQUEST == message.direction:
+            exchange = pending[message.exchange_id] = [message, None]
+            exchanges.append(exchange)
+        elif OUTBOUND_RESPONSE == message.direction:
+            exchange = pending.pop(message.exchange_id, None)
+            if exchange is not None:
+                exchange[1] = message
+    exchanges.sort(key=lambda exchange: exchange[0].time)
+    return exchanges, outbound_requests
+
+async def replay(exchanges, args):
+    """
+    Send the captured requests with the recorded timing (divided by the speed-up),
+    return the latency, status, OpenADR response code and send delay of each
+    request (by service), with the recorded status and response code.
+    """
+    results = []
+    connector = TCPConnector(limit=args.connections)
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=args.timeout)) as session:
+        async def send(request, recorded_response, delay):
+            start = time.perf_counter()
+            try:
+                async with session.post(args.url + request.path, data=request.body, headers=HEADERS) as response:
+                    body = await response.read()
+                    status = response.status
+            except Exception:
+                body, status = b'', 0
+            results.append((request.path.rsplit('/', 1)[-1], time.perf_counter() - start, status,
+                            recorded_response.status if recorded_response else None, delay,
+                            find_response_code(body),
+                            find_response_code(recorded_response.body) if recorded_response else None))
+
+        tasks = []
+        first_time = exchanges[0][0].time
+        start = time.perf_counter()
+        for request, recorded_response in exchanges:
+            # Send the request at its (compressed) offset in the session.
+            due = (request.time - first_time) / args.speed
+            now = time.perf_counter() - start
+            if due > now:
+                await asyncio.sleep(due - now)
+            tasks.append(asyncio.create_task(send(request, recorded_response, max(0., now - due))))
+        await asyncio.gather(*tasks)
+        return results, time.perf_counter() - start
+
+def evaluate(exchanges, results, duration, speed):
+    """
+    Compare the replayed with the recorded session. Responses mismatch if their
+    HTTP status or their OpenADR response code differs from the recorded one;
+    the comparison is only meaningful if the local VTN has the state of the
+    recorded one (e.g., the report request IDs of oadrUpdateReport and the
+    event IDs of oadrCreatedEvent are issued by the VTN, requests referring to
+    unknown IDs are answered with another response code).
+    """
+    recorded_duration = max(exchanges[-1][0].time - exchanges[0][0].time, 1e-9)
+    services = {}
+    for request, recorded_response in exchanges:
+        if recorded_response is not None:
+            services.setdefault(request.path.rsplit('/', 1)[-1], [[], []])[0].append(
+                recorded_response.time - request.time)
+    for service, latency, *_ in results:
+        services.setdefault(service, [[], []])[1].append(latency)
+
+    evaluation = {
+        'throughput': dict(recorded=len(exchanges) / recorded_duration,
+                           target=speed * len(exchanges) / recorded_duration, replayed=len(results) / duration),
+        'send_delay': summarize([delay for _, _, _, _, delay, *_ in results]),
+        'status_mismatches': sum(1 for _, _, status, recorded_status, *_ in results
+                                 if recorded_status is not None and status != recorded_status),
+        'response_code_mismatches': sum(1 for *_, response_code, recorded_response_code in results
+                                        if recorded_response_code is not None
+                                        and response_code != recorded_response_code),
+        'errors': sum(1 for _, _, status, *_ in results if 0 == status),
+        'services': {service: dict(recorded=summarize(recorded), replayed=summarize(replayed))
+                     for service, (recorded, replayed) in sorted(services.items())},
+    }
+    return evaluation
+
+def print_evaluation(evaluation):
+    throughput = evaluation['throughput']
+    print(f'throughput [requests/s]: recorded = {throughput["recorded"]:.1f}, target = {throughput["target"]:.1f}, '
+          f'replayed = {throughput["replayed"]:.1f}')
+    print(f'send delay p99 = {1e3 * evaluation["send_delay"].get("p99", 0.):.1f} ms, '
+          f'status mismatches = {evaluation["status_mismatches"]}, '
+          f'response code mismatches = {evaluation["response_code_mismatches"]}, errors = {evaluation["errors"]}')
+    if evaluation.get('outbound_requests'):
+        print('requests sent by the VTN (recorded, not replayed): ' +
+              ', '.join(f'{service} = {count}' for service, count in sorted(evaluation['outbound_requests'].items())))
+    print('latency [ms] (recorded: VTN handling, replayed: client round trip)')
+    print(f'{"service":<24} {"count":>8} {"rec. p50":>10} {"rec. p99":>10} {"rep. p50":>10} {"rep. p99":>10}')
+    for service, summaries in evaluation['services'].items():
+        recorded, replayed = summaries['recorded'], summaries['replayed']
+        print(f'{service:<24} {replayed["count"]:>8} ' + ' '.join(
+            f'{1e3 * summary.get(p, float("nan")):>10.2f}' for summary in (recorded, replayed) for p in ('p50', 'p99')))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a captured VTN session against a local VTN.')
+    parser.add_argument('capture', nargs='?', help='capture file (VTN_TRAFFIC_CAPTURE of the VTN server)')
+    parser.add_argument('--url', default='http://localhost:8082', help='base URL of the VTN (without path)')
+    parser.add_argument('--speed', type=float, default=1., help='speed-up of the replay (e.g., 1 to 100)')
+    parser.add_argument('--limit', type=int, default=None, help='replay only the first requests')
+    parser.add_argument('--connections', type=int, default=100, help='number of concurrent HTTP connections')
+    parser.add_argument('--timeout', type=float, default=30., help='timeout of a request [s]')
+    parser.add_argument('--output', default=None, help='path of the JSON result file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        sys.exit()
+    if not args.capture:
+        parser.error('the capture file is required')
+    if args.speed <= 0.:
+        parser.error('the speed-up must be positive')
+
+    exchanges, outbound_requests = load_exchanges(args.capture)
+    exchanges = exchanges[:args.limit]
+    if not exchanges:
+        sys.exit(f'No requests in {args.capture}')
+    print(f'{len(exchanges)} requests, {exchanges[-1][0].time - exchanges[0][0].time:.1f} s recorded, '
+          f'replayed at {args.speed:g}x')
+
+    results, duration = asyncio.run(replay(exchanges, args))
+    evaluation = evaluate(exchanges, results, duration, args.speed)
+    evaluation['outbound_requests'] = outbound_requests
+    print_evaluation(evaluation)
+
+    config = {key: value for key, value in vars(args).items() if key not in ('output', 'compare')}
+    print('Results written to', write_results('traffic_replay', config, evaluation, path=args.output))
@@ -0,0 +1,56 @@
+# Encode / decode time and size of VEN info snapshots: json (format before the codec) vs. the VEN info codecs.
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vtn_common.ven_info_codec import decode_ven_info, encode_ven_info
+from vtn_common.ven_records import ReportBinding, VENRecord
+
+MEASUREMENTS = ('power', 'energy')
+
+def create_ven_info(resources, resources_per_ven):
+    ven_info = {}
+    for i in range(resources // resources_per_ven):
+        ven_id = f'VEN_ID_{i:06d}'
+        resource_ids = [f'resource_{j}' for j in range(resources_per_ven)]
+        report_callbacks = {f'REPORT_REQUEST_ID_{i:06d}': {
+            f'r_id_{j}_{measurement}': ReportBinding(resource_id=resource_id, measurement=measurement)
+            for j, resource_id in enumerate(resource_ids) for measurement in MEASUREMENTS}}
+        ven_info[ven_id] = VENRecord(ven_id=ven_id, ven_name=f'VEN_{i:06d}', registration_id=f'REG_ID_{i:06d}',
+                                     resource_ids=resource_ids, report_callbacks=report_callbacks)
+    return ven_info
+
+def best_time(function, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        durations.append(time.perf_counter() - start)
+    return min(durations), result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the VEN info codecs.')
+    parser.add_argument('--resources', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='number of resources of the snapshots')
+    parser.add_argument('--resources-per-ven', type=int, default=2, help='number of resources per VEN')
+    parser.add_argument('--repeat', type=int, default=5, help='number of repetitions (best time is shown)')
+    args = parser.parse_args()
+
+    codecs = {
+        'json (before)': (lambda ven_info: json.dumps({ven_id: record.to_dict() for ven_id, record in ven_info.items()}),
+                          json.loads),
+        'codec json': (lambda ven_info: encode_ven_info(ven_info, 'json'), decode_ven_info),
+        'codec msgpack': (lambda ven_info: encode_ven_info(ven_info, 'msgpack'), decode_ven_info),
+    }
+
+    for resources in args.resources:
+        ven_info = create_ven_info(resources, args.resources_per_ven)
+        print(f'{resources} resources ({len(ven_info)} VENs)')
+        for name, (encode, decode) in codecs.items():
+            encode_time, snapshot = best_time(lambda: encode(ven_info), args.repeat)
+            decode_time, _ = best_time(lambda: decode(snapshot), args.repeat)
+            print(f'{name:>16}: encode = {1e3 * encode_time:8.2f} ms, decode = {1e3 * decode_time:8.2f} ms, '
+                  f'size = {len(snapshot) / 1024:9.1f} KiB')
@@ -0,0 +1,79 @@
+# Memory per VEN of the VTN's VEN state: nested dicts and partials (before) vs. records (after).
+import argparse
+import os
+import sys
+import tracemalloc
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from vtn_common.ven_records import ReportBinding, ReportCallback, VENRecord
+
+# The gauges are the same in both layouts, a single placeholder is used instead.
+TIME_SERIES = object()
+
+async def on_update_report(data, ven_id, resource_id, measurement, time_series):
+    pass
+
+def ven_state_nested_dicts(vens, resources, measurement):
+    ven_info, reports_time_series, events_time_series, report_callbacks = {}, {}, {}, {}
+    for i in range(vens):
+        ven_id = f'VEN_ID_{i:06d}'
+        info = ven_info[ven_id] = dict(ven_id=ven_id, ven_name=f'VEN_{i:06d}', registration_id=f'REG_ID_{i:06d}',
+                                       resource_ids=[], report_callbacks={})
+        reports_time_series[ven_id] = {}
+        events_time_series[ven_id] = {}
+        report_request_id = f'RR_{ven_id}'
+        info['report_callbacks'][report_request_id] = {}
+
+        for r in range(resources):
+            resource_id, r_id = f'resource_{r:03d}', f'r_{r:03d}'
+            reports_time_series[ven_id][resource_id] = {measurement: TIME_SERIES}
+            events_time_series[ven_id][resource_id] = TIME_SERIES
+            report_callbacks[(report_request_id, r_id)] = partial(
+                on_update_report, ven_id=ven_id, resource_id=resource_id, measurement=measurement,
+                time_series=TIME_SERIES)
+            info['report_callbacks'][report_request_id][r_id] = dict(resource_id=resource_id, measurement=measurement)
+            info['resource_ids'].append(resource_id)
+
+    return ven_info, reports_time_series, events_time_series, report_callbacks
+
+def ven_state_records(vens, resources, measurement):
+    ven_info, reports_time_series, events_time_series, report_callbacks = {}, {}, {}, {}
+    for i in range(vens):
+        ven_id = f'VEN_ID_{i:06d}'
+        info = ven_info[ven_id] = VENRecord(ven_id=ven_id, ven_name=f'VEN_{i:06d}', registration_id=f'REG_ID_{i:06d}')
+        events_time_series[ven_id] = {}
+        report_request_id = f'RR_{ven_id}'
+        info.report_callbacks[report_request_id] = {}
+
+        for r in range(resources):
+            resource_id, r_id = f'resource_{r:03d}', f'r_{r:03d}'
+            reports_time_series[(ven_id, resource_id, measurement)] = TIME_SERIES
+            events_time_series[ven_id][resource_id] = TIME_SERIES
+            report_callbacks[(report_request_id, r_id)] = ReportCallback(
+                on_update_report, ven_id=ven_id, resource_id=resource_id, measurement=measurement,
+                time_series=TIME_SERIES)
+            info.report_callbacks[report_request_id][r_id] = ReportBinding(resource_id=resource_id,
+                                                                           measurement=measurement)
+            info.resource_ids.append(resource_id)
+
+    return ven_info, reports_time_series, events_time_series, report_callbacks
+
+def bytes_per_ven(build, vens, resources):
+    tracemalloc.start()
+    state = build(vens, resources, 'REAL_POWER')
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / vens
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory per VEN of the VTN\'s VEN state.')
+    parser.add_argument('--vens', type=int, default=10000, help='number of VENs')
+    parser.add_argument('--resources', type=int, default=4, help='number of resources per VEN')
+    args = parser.parse_args()
+
+    before = bytes_per_ven(ven_state_nested_dicts, args.vens, args.resources)
+    after = bytes_per_ven(ven_state_records, args.vens, args.resources)
+    print(f'{args.vens} VENs x {args.resources} resources')
+    print(f'nested dicts: {before:10.0f} bytes per VEN')
+    print(f'records:      {after:10.0f} bytes per VEN ({100. * (after - before) / before:+.1f} %)')
@@ -0,0 +1,261 @@
+# End-to-end benchmark suite for the VTN servers, using local stand-ins for Prometheus and Redis.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from aiohttp import ClientSession, TCPConnector
+from aiohttp.web import Application, AppRunner, TCPSite, Response, post
+from openleadr import objects
+from openleadr.messaging import create_message, parse_message
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCHMARK_DIR), 'test'))
+
+from vtn_common.logger import LOGGER
+from benchmark_results import summarize, write_results, compare_results
+from stand_ins import FakePrometheus, use_fake_redis
+
+VTN_ID = 'VTN_AIT'
+VTN_HOST = 'localhost'
+VTN_PORT = 8097
+VTN_URL = f'http://{VTN_HOST}:{VTN_PORT}/OpenADR2/Simple/2.0b'
+VTN_PROMETHEUS_CLIENT_PORT = 8098
+
+MEASUREMENT = 'REAL_POWER'
+HEADERS = {'Content-Type': 'application/xml'}
+
+async def post_message(session, service, message):
+    async with session.post(f'{VTN_URL}/{service}', data=message, headers=HEADERS) as response:
+        return parse_message(await response.read()) if response.status == 200 else (None, {})
+
+async def timed(coroutine, latencies):
+    start = time.perf_counter()
+    result = await coroutine
+    latencies.append(time.perf_counter() - start)
+    return result
+
+async def run_concurrently(coroutines, latencies):
+    start = time.perf_counter()
+    results = await asyncio.gather(*[timed(coroutine, latencies) for coroutine in coroutines])
+    return results, time.perf_counter() - start
+
+def update_report_message(ven_id, report_request_id, r_ids, intervals, number=0):
+    now = datetime.now(timezone.utc)
+    report_intervals = [objects.ReportInterval(dtstart=now - timedelta(seconds=i),
+                                               report_payload=objects.ReportPayload(r_id=r_id, value=40. + i))
+                        for i in range(intervals) for r_id in r_ids]
+    report = objects.Report(report_request_id=report_request_id, report_specifier_id=report_request_id,
+                            report_name='TELEMETRY_USAGE', created_date_time=now, dtstart=now,
+                            intervals=report_intervals)
+    return create_message('oadrUpdateReport', ven_id=ven_id, request_id=f'RQ_{ven_id}_{number}', reports=[report])
+
+def memory_per_ven(snapshot_before, number_of_vens):
+    current, _ = tracemalloc.get_traced_memory()
+    return (current - snapshot_before) / number_of_vens
+
+async def benchmark_poll_server(args, prometheus):
+    from vtn_common.vtn_poll_server import VTNPollServer
+    from vtn_common.patch_report_request import patch_report_request
+    from vtn_common.patch_update_report import patch_update_report
+    from vtn_common.message_fast_path import patch_message_fast_path
+    from vtn_common.instrumentation import patch_instrumentation
+
+    VTNPollServer.TIME_SERIES_DB_HOST_URL = prometheus.url
+    VTNPollServer.TIME_SERIES_DB_CLIENT_PORT = VTN_PROMETHEUS_CLIENT_PORT
+    # Measure the registration latency without the deliberate delay for spreading the polls.
+    VTNPollServer.POLL_PHASE_SPREADING = False
+
+    vtn_server = VTNPollServer(vtn_id=VTN_ID, http_host=VTN_HOST, http_port=VTN_PORT,
+                               requested_poll_freq=timedelta(seconds=5))
+    patch_update_report(vtn=vtn_server, vtn_id=VTN_ID)
+    patch_message_fast_path(vtn=vtn_server)
+    patch_instrumentation(vtn=vtn_server)
+    await vtn_server.run()
+    patch_report_request(vtn_server)
+
+    results = {}
+    ven_names = [f'BENCH_VEN_{i:05d}' for i in range(args.vens)]
+    r_ids = [f'r_{resource:03d}' for resource in range(args.resources)]
+    session = ClientSession(connector=TCPConnector(limit=args.connections))
+
+    # Registration storm: all VENs register at once.
+    memory_before, _ = tracemalloc.get_traced_memory()
+    latencies = []
+    messages = [create_message('oadrCreatePartyRegistration', request_id=f'RQ_{ven_name}', ven_name=ven_name,
+                               http_pull_model=True, xml_signature=False, report_only=False,
+                               profile_name='2.0b', transport_name='simpleHttp')
+                for ven_name in ven_names]
+    responses, duration = await run_concurrently([post_message(session, 'EiRegisterParty', message)
+                                                  for message in messages], latencies)
+    ven_ids = [payload.get('ven_id') for _, payload in responses]
+    results['registration_storm'] = summarize(latencies, duration)
+
+    # Set up the report callbacks as the report registration would do.
+    for ven_id in ven_ids:
+        for r_id in r_ids:
+            vtn_server._create_report_callback(ven_id=ven_id, resource_id=f'resource_{r_id}', measurement=MEASUREMENT,
+                                               report_request_id=f'RR_{ven_id}', r_id=r_id)
+    results['memory_per_ven'] = dict(bytes=memory_per_ven(memory_before, args.vens), resources=args.resources)
+
+    # Report ingestion: every VEN sends several multi-interval reports.
+    latencies = []
+    messages = [update_report_message(ven_id, f'RR_{ven_id}', r_ids, args.intervals, number)
+                for ven_id in ven_ids for number in range(args.reports)]
+    _, duration = await run_concurrently([post_message(session, 'EiReport', message) for message in messages],
+                                         latencies)
+    results['report_ingestion'] = summarize(latencies, duration)
+    results['report_ingestion']['values_per_second'] = len(messages) * len(r_ids) * args.intervals / duration
+
+    # Event dispatch: create an event per VEN and deliver it with the next poll.
+    for ven_id in ven_ids[::2]:
+        for r_id in r_ids:
+            prometheus.values[f'{VTN_ID}:FLEX:{ven_id}:resource_{r_id}'] = 1.5
+
+    async def dispatch_event(ven_id):
+        await vtn_server.add_new_event(ven_id=ven_id, event_task_id=None, period=None, delay=0)
+        response_type, _ = await post_message(session, 'OadrPoll', create_message('oadrPoll', ven_id=ven_id))
+        assert 'oadrDistributeEvent' == response_type, response_type
+
+    latencies = []
+    _, duration = await run_concurrently([dispatch_event(ven_id) for ven_id in ven_ids], latencies)
+    results['event_dispatch'] = summarize(latencies, duration)
+
+    await session.close()
+    await vtn_server.stop()
+    return results
+
+async def start_fake_vens(preregistration_list):
+    '''
+    Minimal push-mode VEN endpoints that acknowledge every message.
+    '''
+    async def handle(request):
+        message_type, payload = parse_message(await request.read())
+        response = create_message('oadrResponse', ven_id=payload.get('ven_id'),
+                                  response={'response_code': 200, 'response_description': 'OK',
+                                            'request_id': payload.get('request_id')})
+        return Response(text=response, content_type='application/xml')
+
+    app = Application()
+    app.add_routes([post('/OpenADR2/Simple/2.0b/{service}', handle)])
+    runner = AppRunner(app, access_log=None)
+    await runner.setup()
+    for ven_info in preregistration_list.values():
+        host, port = ven_info['url'].split('/')[2].split(':')
+        await TCPSite(runner, host, int(port)).start()
+    return runner
+
+async def benchmark_push_server(args, prometheus):
+    from vtn_common.vtn_push_server_with_preregistration import VTNPushServerWithPreregistration
+    from vtn_common.message_fast_path import patch_message_fast_path
+    from vtn_common.instrumentation import patch_instrumentation
+    from ven_fleet_load_generator import ven_preregistration_list
+
+    VTNPushServerWithPreregistration.TIME_SERIES_DB_HOST_URL = prometheus.url
+    VTNPushServerWithPreregistration.TIME_SERIES_DB_CLIENT_PORT = VTN_PROMETHEUS_CLIENT_PORT
+
+    results = {}
+    preregistration_list = ven_preregistration_list(args.vens, resources=args.resources)
+    fake_vens = await start_fake_vens(preregistration_list)
+
+    # Pre-registration of all VENs (includes report pre-registration).
+    memory_before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    vtn_server = VTNPushServerWithPreregistration(vtn_id=VTN_ID, auto_register_report=False,
+                                                  ven_preregistration_list=preregistration_list,
+                                                  http_host=VTN_HOST, http_port=VTN_PORT)
+    patch_message_fast_path(vtn=vtn_server)
+    patch_instrumentation(vtn=vtn_server)
+    await vtn_server.run()
+    results['preregistration'] = dict(duration=time.perf_counter() - start)
+    results['memory_per_ven'] = dict(bytes=memory_per_ven(memory_before, args.vens), resources=args.resources)
+
+    session = ClientSession(connector=TCPConnector(limit=args.connections))
+
+    # Report ingestion: every VEN sends several multi-interval reports.
+    latencies = []
+    messages = [update_report_message(ven_info['ven_id'], report['report_request_id'], [report['report_id']],
+                                      args.intervals, number)
+                for ven_info in preregistration_list.values() for report in ven_info['reports']
+                for number in range(args.reports)]
+    _, duration = await run_concurrently([post_message(session, 'EiReport', message) for message in messages],
+                                         latencies)
+    results['report_ingestion'] = summarize(latencies, duration)
+    results['report_ingestion']['values_per_second'] = len(messages) * args.intervals / duration
+
+    # Event dispatch: push an event to every VEN.
+    latencies = []
+    _, duration = await run_concurrently([vtn_server.add_new_event(ven_id=ven_info['ven_id'], event_task_id=None,
+                                                                   period=None, delay=0)
+                                          for ven_info in preregistration_list.values()], latencies)
+    results['event_dispatch'] = summarize(latencies, duration)
+
+    await session.close()
+    await vtn_server.stop()
+    await fake_vens.cleanup()
+    return results
+
+def run_mode(args):
+    '''
+    Run the benchmarks for one VTN server in the current process.
+    '''
+    LOGGER.setLevel(getattr(logging, args.log_level))
+    use_fake_redis()
+    prometheus = FakePrometheus().start()
+    tracemalloc.start()
+
+    benchmark = benchmark_poll_server if 'poll' == args.mode else benchmark_push_server
+    try:
+        return asyncio.new_event_loop().run_until_complete(benchmark(args, prometheus))
+    finally:
+        prometheus.stop()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='End-to-end benchmarks for the VTN servers.')
+    parser.add_argument('--mode', choices=['poll', 'push'], default=None, help='run only this VTN server')
+    parser.add_argument('--vens', type=int, default=500, help='number of VENs')
+    parser.add_argument('--resources', type=int, default=2, help='number of resources per VEN')
+    parser.add_argument('--reports', type=int, default=5, help='number of reports sent by each VEN')
+    parser.add_argument('--intervals', type=int, default=4, help='number of intervals per report')
+    parser.add_argument('--connections', type=int, default=100, help='number of concurrent HTTP connections')
+    parser.add_argument('--log-level', default='WARNING', help='log level of the VTN server')
+    parser.add_argument('--output', default=None, help='path of the JSON result file')
+    # Internal: result file of a worker process (single VTN server).
+    parser.add_argument('--worker-output', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='compare two result files')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+    elif args.worker_output:
+        # Worker process for a single VTN server.
+        with open(args.worker_output, 'w') as file:
+            json.dump(run_mode(args), file)
+    else:
+        # Run each VTN server in a separate process (OpenLEADR keeps class-level state).
+        results = {}
+        for mode in [args.mode] if args.mode else ['poll', 'push']:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output = os.path.join(tmp_dir, f'{mode}.json')
+                command = [sys.executable, __file__, '--mode', mode, '--worker-output', output] + \
+                    [f'--{key.replace("_", "-")}={value}' for key, value in vars(args).items()
+                     if key not in ('mode', 'output', 'worker_output', 'compare')]
+                if 0 != subprocess.run(command).returncode:
+                    print(f'Benchmark for {mode} mode failed, skipping.')
+                    continue
+                with open(output) as file:
+                    results[mode] = json.load(file)
+
+        print(json.dumps(results, indent=2))
+        config = {key: value for key, value in vars(args).items() if key not in ('output', 'worker_output', 'compare')}
+        print('Results written to', write_results('vtn_benchmark_suite', config, results, path=args.output))
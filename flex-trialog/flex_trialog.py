@@ -1,12 +1,15 @@
 # Retrieve flex forecast for VENs
-from prometheus_client import start_http_server, Gauge
+from prometheus_client import start_http_server, Counter, Gauge
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, repeat
 import re
 import redis
-import json
 import random
 import time
 import logging
+import os
 import sys
+from vtn_common.ven_info_codec import decode_ven_info
 
 random.seed(0)
 
@@ -26,8 +29,23 @@ REDIS_PORT = 6379
 REDIS_API = None
 REDIS_VEN_INFO_KEY = 'ven_info'
 
+# Period of retrieving the VEN info and the flex forecasts [s].
+REFRESH_PERIOD = 5.
+
+# The forecasts are computed in chunks of resources by a pool of worker processes
+# (0 workers: number of CPUs). A single chunk is computed in the main process.
+FORECAST_WORKERS = int(os.environ.get('FLEX_FORECAST_WORKERS', 0)) or os.cpu_count()
+FORECAST_CHUNK_SIZE = int(os.environ.get('FLEX_FORECAST_CHUNK_SIZE', 1000))
+
+FLEX_CYCLE_SECONDS = Gauge('flex_forecast_cycle_seconds', 'Duration of the last flex forecast cycle')
+FLEX_CYCLE_OVERRUNS = Counter('flex_forecast_cycle_overruns', 'Flex forecast cycles longer than the refresh period')
+FLEX_FORECAST_RESOURCES = Gauge('flex_forecast_resources', 'Resources with a flex forecast')
+
 VEN_INFO = {}
 
+# Snapshot of the VEN info retrieved last (it is decoded only if it has changed).
+VEN_INFO_SNAPSHOT = None
+
 def sanitize_prometheus_metric_name(str_name):
     return ''.join(
         [str_name[0] if re.match('[a-zA-Z_:]', str_name[0]) else '_' + str_name[0]] +
@@ -35,11 +53,13 @@ def sanitize_prometheus_metric_name(str_name):
         )
 
 def retrieve_ven_info():
-    global VEN_INFO
+    global VEN_INFO, VEN_INFO_SNAPSHOT
     redis_ven_info = REDIS_API.get(REDIS_VEN_INFO_KEY)
     if redis_ven_info:
-        VEN_INFO = json.loads(redis_ven_info)
-        LOGGER.debug(f'RETRIEVED VEN INFO:\n{VEN_INFO}')
+        if redis_ven_info != VEN_INFO_SNAPSHOT:
+            VEN_INFO = decode_ven_info(redis_ven_info)
+            VEN_INFO_SNAPSHOT = redis_ven_info
+            LOGGER.debug(f'RETRIEVED VEN INFO:\n{VEN_INFO}')
     else:
         LOGGER.debug('FAILED TO RETRIEVE VEN INFO')
 
@@ -61,24 +81,53 @@ def update_prometheus_client():
                 LOGGER.info(f'ADD NEW GAUGE FOR {flex_forecast_gauge_name}')
                 PROMETHEUS_GAUGES_FLEX[ven_id][resource_id] = flex_forecast_gauge
 
-def retrieve_flex_forecasts():
-    for ven_id, ven_info in VEN_INFO.items():
-        for resource_id in ven_info['resource_ids']:
-            flex_forecast_gauge = PROMETHEUS_GAUGES_FLEX[ven_id][resource_id]
-            flex_forecast = round(random.uniform(0., 10.), 2)
-            flex_forecast_gauge.set(flex_forecast)
+def compute_flex_forecast(ven_id, resource_id):
+    # Placeholder for the forecast of a resource (e.g., an EVSE pool).
+    return round(random.uniform(0., 10.), 2)
 
-try:
-     # Start Prometheus client.
-    start_http_server(PROMETHEUS_CLIENT_PORT)
+def compute_flex_forecasts(resources, forecast=compute_flex_forecast):
+    return [forecast(ven_id, resource_id) for ven_id, resource_id in resources]
 
-    REDIS_API = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+def init_worker():
+    # Worker processes must not share the random sequence of the main process.
+    random.seed(os.getpid())
 
-    while True:
-        retrieve_ven_info()
-        update_prometheus_client()
-        retrieve_flex_forecasts()
-        time.sleep(5)
+def retrieve_flex_forecasts(executor=None, chunk_size=FORECAST_CHUNK_SIZE, forecast=compute_flex_forecast):
+    resources = [(ven_id, resource_id) for ven_id, ven_info in VEN_INFO.items()
+                 for resource_id in ven_info['resource_ids']]
+    chunks = [resources[i:i + chunk_size] for i in range(0, len(resources), chunk_size)]
 
-except KeyboardInterrupt:
-    pass
+    if executor is None or len(chunks) <= 1:
+        flex_forecasts = [compute_flex_forecasts(chunk, forecast) for chunk in chunks]
+    else:
+        flex_forecasts = executor.map(compute_flex_forecasts, chunks, repeat(forecast))
+
+    # Publish all forecasts in one pass (a scrape sees the forecasts of a single cycle).
+    for (ven_id, resource_id), flex_forecast in zip(resources, list(chain.from_iterable(flex_forecasts))):
+        PROMETHEUS_GAUGES_FLEX[ven_id][resource_id].set(flex_forecast)
+    FLEX_FORECAST_RESOURCES.set(len(resources))
+
+if __name__ == '__main__':
+    try:
+        # Start Prometheus client.
+        start_http_server(PROMETHEUS_CLIENT_PORT)
+
+        REDIS_API = redis.Redis(host=REDIS_HOST, port=REDIS_PORT)
+
+        with ProcessPoolExecutor(max_workers=FORECAST_WORKERS, initializer=init_worker) as executor:
+            while True:
+                start = time.perf_counter()
+                retrieve_ven_info()
+                update_prometheus_client()
+                retrieve_flex_forecasts(executor)
+
+                # The refresh period includes the cycle.
+                cycle_time = time.perf_counter() - start
+                FLEX_CYCLE_SECONDS.set(cycle_time)
+                if cycle_time > REFRESH_PERIOD:
+                    FLEX_CYCLE_OVERRUNS.inc()
+                    LOGGER.warning(f'FLEX FORECAST CYCLE TOOK {cycle_time:.1f} s')
+                time.sleep(max(0., REFRESH_PERIOD - cycle_time))
+
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,302 @@
+# Load generator simulating a fleet of poll-mode (TRIALOG-like) or push-mode (HPT-like) VEN clients.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from openleadr.enums import SI_SCALE_CODE
+
+from ven_trialog_test import OpenADRClientWithCreatedReport
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark'))
+from benchmark_results import percentile
+
+TEST_VTN_ID = 'VTN_AIT'
+TEST_VTN_URL_POLL = 'http://localhost:8082/OpenADR2/Simple/2.0b'
+TEST_VTN_URL_PUSH = 'http://localhost:8081/OpenADR2/Simple/2.0b'
+
+TEST_VEN_NAME_TEMPLATE = 'LOAD_VEN_{:05d}'
+TEST_VEN_HOST = 'localhost'
+TEST_VEN_BASE_PORT = 9000
+
+VEN_MEASUREMENT_TYPE = 'REAL_POWER'
+VEN_MEASUREMENT_SCALE = SI_SCALE_CODE['k']
+
+BASELINE = 40.
+
+PERCENTILES = (50, 90, 99)
+
+# Width of the time buckets for measuring the smoothness of the request rate [s].
+RATE_BUCKET_WIDTH = 0.1
+
+# OpenADR services used by the VEN clients, mapped to the reported metrics.
+SERVICE_METRICS = {
+    'EiRegisterParty': 'registration',
+    'OadrPoll': 'polling',
+    'EiReport': 'report delivery',
+    'EiEvent': 'event response',
+}
+
+class FleetStatistics:
+    '''
+    Latencies and errors collected from the simulated VEN clients.
+    '''
+
+    def __init__(self, latencies=None, errors=None, request_times=None):
+        self.latencies = defaultdict(list, latencies or {})
+        self.errors = defaultdict(int, errors or {})
+        self.request_times = defaultdict(list, request_times or {})
+
+    def add(self, metric, latency, request_time=None):
+        self.latencies[metric].append(latency)
+        if request_time is not None:
+            self.request_times[metric].append(request_time)
+
+    def add_error(self, metric):
+        self.errors[metric] += 1
+
+    def merge(self, other):
+        for metric, latencies in other.latencies.items():
+            self.latencies[metric].extend(latencies)
+        for metric, count in other.errors.items():
+            self.errors[metric] += count
+        for metric, request_times in other.request_times.items():
+            self.request_times[metric].extend(request_times)
+
+    def to_dict(self):
+        return dict(latencies=dict(self.latencies), errors=dict(self.errors), request_times=dict(self.request_times))
+
+    def summary(self, duration):
+        summary = {}
+        for metric, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            summary[metric] = dict(count=len(latencies), errors=self.errors.get(metric, 0),
+                                   throughput=len(latencies) / duration, max=latencies[-1],
+                                   **{f'p{p}': percentile(latencies, p) for p in PERCENTILES},
+                                   **rate_smoothness(self.request_times.get(metric, [])))
+        return summary
+
+def rate_smoothness(request_times, bucket_width=RATE_BUCKET_WIDTH):
+    '''
+    Peak request rate and coefficient of variation of the request rate (0 for
+    perfectly even requests), measured in short time buckets.
+    '''
+    if len(request_times) < 2:
+        return dict(peak_rate=0., rate_cv=0.)
+
+    start = min(request_times)
+    counts = [0] * (int((max(request_times) - start) / bucket_width) + 1)
+    for request_time in request_times:
+        counts[int((request_time - start) / bucket_width)] += 1
+
+    mean = sum(counts) / len(counts)
+    variance = sum((count - mean)**2 for count in counts) / len(counts)
+    return dict(peak_rate=max(counts) / bucket_width, rate_cv=variance**0.5 / mean)
+
+class FleetVENMixin:
+    '''
+    Adds latency measurements and configurable event opt-in behavior to a VEN client.
+    '''
+
+    def init_fleet_ven(self, statistics, opt_in_ratio):
+        self.statistics = statistics
+        self.opt_type = 'optIn' if random.random() < opt_in_ratio else 'optOut'
+        self.add_handler('on_event', self.handle_fleet_event)
+
+    async def _perform_request(self, service, message):
+        metric = SERVICE_METRICS.get(service, service)
+        request_time = time.time()
+        start = time.perf_counter()
+        try:
+            result = await super()._perform_request(service, message)
+        except Exception:
+            self.statistics.add_error(metric)
+            raise
+        self.statistics.add(metric, time.perf_counter() - start, request_time)
+        if result is None or result[0] is None:
+            self.statistics.add_error(metric)
+        return result
+
+    async def handle_fleet_event(self, event):
+        # Event delivery latency: time since the event has been created by the VTN.
+        created = event['event_descriptor'].get('created_date_time')
+        if isinstance(created, datetime):
+            self.statistics.add('event delivery', (datetime.now(timezone.utc) - created).total_seconds())
+        return self.opt_type
+
+class PollModeFleetVEN(FleetVENMixin, OpenADRClientWithCreatedReport):
+    pass
+
+def create_poll_mode_ven(index, args, statistics):
+    ven = PollModeFleetVEN(ven_name=TEST_VEN_NAME_TEMPLATE.format(index), vtn_url=args.vtn_url or TEST_VTN_URL_POLL)
+    ven.init_fleet_ven(statistics, args.opt_in_ratio)
+    ven.MAX_POLL_BACKOFF = args.max_poll_backoff
+
+    for resource in range(args.resources):
+        ven.add_report(callback=collect_report,
+                       resource_id=f'resource_{resource:03d}',
+                       measurement=VEN_MEASUREMENT_TYPE,
+                       scale=VEN_MEASUREMENT_SCALE,
+                       sampling_rate=timedelta(seconds=args.report_period),
+                       report_duration=timedelta(weeks=1))
+    return ven, ven.run()
+
+@lru_cache(maxsize=None)
+def push_mode_fleet_ven_class():
+    # Import push mode client only when needed.
+    from openleadr_push_mode import OpenADRClientPushMode
+
+    class PushModeFleetVEN(FleetVENMixin, OpenADRClientPushMode):
+        pass
+
+    return PushModeFleetVEN
+
+def create_push_mode_ven(index, args, statistics):
+    ven_name = TEST_VEN_NAME_TEMPLATE.format(index)
+    ven = push_mode_fleet_ven_class()(ven_name=ven_name, vtn_url=args.vtn_url or TEST_VTN_URL_PUSH,
+                                      http_host=TEST_VEN_HOST, http_port=TEST_VEN_BASE_PORT + index)
+    ven.pre_register_ven(ven_id=ven_preregistration_id(ven_name), vtn_id=TEST_VTN_ID)
+    ven.init_fleet_ven(statistics, args.opt_in_ratio)
+
+    report_ids = []
+    for resource in range(args.resources):
+        report_id = f'REPORT_ID_{index:05d}_{resource:03d}'
+        report_ids.append(report_id)
+        ven.add_report(callback=collect_report,
+                       resource_id=None,
+                       report_specifier_id=f'REPORT_SPECIFIER_ID_{index:05d}',
+                       r_id=report_id,
+                       measurement=VEN_MEASUREMENT_TYPE,
+                       scale=VEN_MEASUREMENT_SCALE,
+                       sampling_rate=timedelta(seconds=args.report_period),
+                       report_duration=timedelta(weeks=1))
+
+    async def start_ven():
+        await ven.run(auto_register=False, auto_register_reports=False)
+        await ven.pre_register_report(report_request_id=f'REPORT_REQUEST_{index:05d}',
+                                      report_specifier_id=f'REPORT_SPECIFIER_ID_{index:05d}',
+                                      report_ids=report_ids,
+                                      granularity=timedelta(seconds=args.report_period))
+    return ven, start_ven()
+
+def ven_preregistration_id(ven_name):
+    return 'VEN_ID_{}'.format(ven_name)
+
+def ven_preregistration_list(number_of_vens, resources=1, first=0):
+    '''
+    Pre-registration list for a push-mode VTN that matches the simulated push-mode VEN fleet.
+    '''
+    preregistration_list = {}
+    for index in range(first, first + number_of_vens):
+        ven_name = TEST_VEN_NAME_TEMPLATE.format(index)
+        preregistration_list[ven_name] = {
+            'ven_id': ven_preregistration_id(ven_name),
+            'registration_id': f'REGISTRATION_ID_{index:05d}',
+            'url': f'http://{TEST_VEN_HOST}:{TEST_VEN_BASE_PORT + index}/OpenADR2/Simple/2.0b',
+            'reports': [{
+                'report_request_id': f'REPORT_REQUEST_{index:05d}',
+                'report_specifier_id': f'REPORT_SPECIFIER_ID_{index:05d}',
+                'report_id': f'REPORT_ID_{index:05d}_{resource:03d}',
+                } for resource in range(resources)],
+            }
+    return preregistration_list
+
+async def collect_report():
+    return BASELINE + round(random.uniform(-0.1, 0.2), 2)
+
+async def run_fleet(args, first, number_of_vens):
+    '''
+    Run a part of the VEN fleet in the current event loop.
+    '''
+    statistics = FleetStatistics()
+    create_ven = create_push_mode_ven if 'push' == args.mode else create_poll_mode_ven
+
+    async def start_ven(index, start):
+        # Spread the start-up of the VENs over the ramp-up period.
+        await asyncio.sleep(args.ramp_up * (index - first) / number_of_vens)
+        try:
+            await start
+        except Exception:
+            statistics.add_error('start-up')
+
+    vens, start_tasks = [], []
+    for index in range(first, first + number_of_vens):
+        ven, start = create_ven(index, args, statistics)
+        vens.append(ven)
+        start_tasks.append(asyncio.create_task(start_ven(index, start)))
+
+    await asyncio.sleep(args.duration)
+
+    for task in start_tasks:
+        task.cancel()
+    for ven in vens:
+        try:
+            await ven.stop()
+        except Exception:
+            pass
+
+    return statistics.to_dict()
+
+def run_fleet_worker(args, first, number_of_vens):
+    logging.getLogger('openleadr').setLevel(logging.WARNING)
+    random.seed(first)
+    return asyncio.run(run_fleet(args, first, number_of_vens))
+
+def run_load_generator(args):
+    '''
+    Run the complete VEN fleet, optionally split across a process pool.
+    '''
+    chunk = -(-args.vens // args.processes)
+    parts = [(first, min(chunk, args.vens - first)) for first in range(0, args.vens, chunk)]
+
+    statistics = FleetStatistics()
+    start = time.perf_counter()
+    if args.processes > 1:
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            for result in pool.map(run_fleet_worker, *zip(*[(args, first, n) for first, n in parts])):
+                statistics.merge(FleetStatistics(**result))
+    else:
+        statistics.merge(FleetStatistics(**run_fleet_worker(args, 0, args.vens)))
+    duration = time.perf_counter() - start
+
+    return statistics.summary(duration)
+
+def print_summary(summary):
+    print(f'{"metric":<16} {"count":>8} {"errors":>7} {"req/s":>9} {"peak/s":>9} {"rate cv":>8} ' +
+          ' '.join(f'{f"p{p} [ms]":>10}' for p in PERCENTILES) + f' {"max [ms]":>10}')
+    for metric, values in summary.items():
+        print(f'{metric:<16} {values["count"]:>8} {values["errors"]:>7} {values["throughput"]:>9.1f} '
+              f'{values["peak_rate"]:>9.1f} {values["rate_cv"]:>8.2f} ' +
+              ' '.join(f'{1e3 * values[f"p{p}"]:>10.2f}' for p in PERCENTILES) + f' {1e3 * values["max"]:>10.2f}')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate a fleet of VEN clients against a local VTN.')
+    parser.add_argument('--mode', choices=['poll', 'push'], default='poll', help='VEN operation mode')
+    parser.add_argument('--vtn-url', default=None, help='VTN URL (default depends on mode)')
+    parser.add_argument('--vens', type=int, default=100, help='number of simulated VENs')
+    parser.add_argument('--resources', type=int, default=2, help='number of resources (reports) per VEN')
+    parser.add_argument('--report-period', type=float, default=15., help='offered report sampling period [s]')
+    parser.add_argument('--opt-in-ratio', type=float, default=1., help='share of VENs opting in to events')
+    parser.add_argument('--max-poll-backoff', type=int, default=1,
+                        help='after empty polls, poll at most every n-th poll cycle (1 = no backoff)')
+    parser.add_argument('--ramp-up', type=float, default=10., help='period for starting all VENs [s]')
+    parser.add_argument('--duration', type=float, default=60., help='duration of the load test [s]')
+    parser.add_argument('--processes', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--json', default=None, help='write the results to this JSON file')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    summary = run_load_generator(args)
+    print_summary(summary)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(dict(config=vars(args), results=summary), file, indent=2)
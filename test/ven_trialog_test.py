@@ -55,26 +55,56 @@ class OpenADRClientWithCreatedReport(OpenADRClient):
     a request of type "oadrCreateReport".
     """
 
+    # Maximum number of messages handled within a single poll cycle.
+    MAX_MESSAGES_PER_POLL_CYCLE = 10
+
+    # After consecutive empty responses, the VEN polls only every n-th poll cycle, with n doubling up to this
+    # value (i.e., at most MAX_POLL_BACKOFF - 1 cycles are skipped, 1 = no backoff).
+    MAX_POLL_BACKOFF = 4
+
     def __init__(self, **args):
         super().__init__(**args)
         self.logger_ = logging.getLogger('openleadr')
+        self._poll_backoff = 0
+        self._poll_backoff_skips = 0
 
     async def _poll(self):
         """
-        Changes for sending back messages of type "oadrCreatedReport"
-        only require a change in the polling method. It is mostly a
-        copy of the origonal method.
+        Poll for new messages until the VTN has no more messages pending
+        (or the maximum number of messages per poll cycle is reached). After
+        consecutive empty responses, poll cycles are skipped (adaptive backoff).
         """
-        self.logger_.debug("Now polling for new messages")
-        response_type, response_payload = await self.poll()
-        if response_type is None:
+        if self._poll_backoff_skips > 0:
+            self._poll_backoff_skips -= 1
             return
 
-        elif response_type == 'oadrResponse':
-            self.logger_.debug("Received empty response from the VTN.")
-            return
+        for _ in range(self.MAX_MESSAGES_PER_POLL_CYCLE):
+            self.logger_.debug("Now polling for new messages")
+            response_type, response_payload = await self.poll()
+            if response_type is None:
+                return
+
+            elif response_type == 'oadrResponse':
+                self.logger_.debug("Received empty response from the VTN.")
+                self._poll_backoff = min(self.MAX_POLL_BACKOFF, 2 * self._poll_backoff or 1)
+                self._poll_backoff_skips = self._poll_backoff - 1
+                return
+
+            self._poll_backoff = 0
+            self._poll_backoff_skips = 0
 
-        elif response_type == 'oadrRequestReregistration':
+            await self._handle_poll_response(response_type, response_payload)
+        else:
+            self.logger_.debug("Reached maximum number of messages per poll cycle, "
+                               "continuing with the next poll cycle.")
+
+    async def _handle_poll_response(self, response_type, response_payload):
+        """
+        Changes for sending back messages of type "oadrCreatedReport"
+        only require a change in the handling of poll responses. It is
+        mostly a copy of the original polling method.
+        """
+        if response_type == 'oadrRequestReregistration':
             self.logger_.info("The VTN required us to re-register. Calling the registration procedure.")
             await self.send_response(service='EiRegisterParty')
             await self.create_party_registration()
@@ -127,9 +157,6 @@ class OpenADRClientWithCreatedReport(OpenADRClient):
             self.logger_.warning(f"No handler implemented for incoming message "
                            f"of type {response_type}, ignoring.")
 
-        # Immediately poll again, because there might be more messages
-        await self._poll()
-
 if __name__ == '__main__':
     # Create the client object
     simple_client = OpenADRClientWithCreatedReport(
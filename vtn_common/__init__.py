@@ -1,6 +1,29 @@
-try:
-    from .vtn_monitor import VTNMonitor
-    from .vtn_poll_server import VTNPollServer
-    from .vtn_push_server_with_preregistration import VTNPushServerWithPreregistration
-except Exception as e:
-    print(str(e))
+import importlib
+
+# The classes are imported on first access, so that e.g. the terminal helpers
+# do not import aiomonitor, OpenLEADR or the other server's dependencies.
+_LAZY_ATTRIBUTES = {
+    'VTNMonitor': '.vtn_monitor',
+    'VTNPollServer': '.vtn_poll_server',
+    'VTNPushServerWithPreregistration': '.vtn_push_server_with_preregistration',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+    try:
+        module = importlib.import_module(module_name, __name__)
+    except AttributeError as e:
+        # Otherwise hidden behind "cannot import name" by 'from vtn_common import ...'.
+        raise ImportError(str(e)) from e
+
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,155 @@
+from .logger import *
+
+import math
+import time
+from aiohttp.web import middleware, Response
+from prometheus_client import Counter, Gauge
+
+ADMISSION_REJECTED = Counter('vtn_admission_rejected', 'Requests to the OpenADR services rejected per VEN limits',
+                             ['service', 'reason'])
+ADMISSION_TRACKED_VENS = Gauge('vtn_admission_tracked_vens', 'VEN clients tracked by the admission control')
+
+from .raw_message import find_ven_identifier
+
+class TokenBucket:
+    '''
+    Request budget and requests in progress of a single VEN client.
+    '''
+
+    __slots__ = ('tokens', 'updated', 'in_flight')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+        self.in_flight = 0
+
+class AdmissionControl:
+    '''
+    Per-VEN admission control for the OpenADR services: a token bucket limits
+    the request rate and a counter limits the concurrent requests of each VEN
+    client. Requests are rejected (HTTP 429) before their XML is parsed.
+    The VEN identifier in the message is not authenticated at this point, so
+    the buckets are kept per peer address and VEN identifier (a client cannot
+    use up the budget of another VEN), and a bucket per peer address limits
+    clients that make up identifiers.
+    '''
+
+    # Sustained requests per second and burst size per VEN (all services).
+    RATE = 1.
+    BURST = 30
+
+    # Sustained requests per second and burst size per peer address (all VENs
+    # behind that address, e.g., a NAT gateway or another shard).
+    PEER_RATE = 200.
+    PEER_BURST = 2000
+
+    # Maximum number of requests per VEN in progress at the same time.
+    MAX_CONCURRENT_REQUESTS = 4
+
+    # Idle VENs are dropped from the table if it gets larger than this.
+    MAX_TRACKED_VENS = 100000
+
+    def __init__(self, rate=None, burst=None, max_concurrent_requests=None, peer_rate=None, peer_burst=None):
+        self.rate = rate or self.RATE
+        self.burst = burst or self.BURST
+        self.max_concurrent_requests = max_concurrent_requests or self.MAX_CONCURRENT_REQUESTS
+        self.peer_rate = peer_rate or self.PEER_RATE
+        self.peer_burst = peer_burst or self.PEER_BURST
+        self._buckets = {}
+        self._peer_buckets = {}
+
+        # Rejected requests per peer address and VEN ID (only for tracked VENs),
+        # not exported to Prometheus to avoid high cardinality.
+        self.rejections = {}
+
+    def acquire(self, ven_id, peer=None, now=None):
+        """
+        Admit a request of a VEN client (from the given peer address). Return
+        None if admitted (call 'release' when done), otherwise the reason and
+        the seconds until the next token.
+        """
+        now = time.monotonic() if now is None else now
+        peer_bucket = self._bucket(self._peer_buckets, peer, self.peer_burst, self.peer_rate, now)
+        bucket = self._bucket(self._buckets, (peer, ven_id), self.burst, self.rate, now)
+        ADMISSION_TRACKED_VENS.set(len(self._buckets))
+
+        if bucket.in_flight >= self.max_concurrent_requests:
+            return 'concurrency', 1. / self.rate
+        if peer_bucket.tokens < 1.:
+            return 'peer_rate', (1. - peer_bucket.tokens) / self.peer_rate
+        if bucket.tokens < 1.:
+            return 'rate', (1. - bucket.tokens) / self.rate
+
+        peer_bucket.tokens -= 1.
+        bucket.tokens -= 1.
+        bucket.in_flight += 1
+        return None
+
+    def release(self, ven_id, peer=None):
+        bucket = self._buckets.get((peer, ven_id))
+        if bucket is not None:
+            bucket.in_flight -= 1
+
+    def _bucket(self, buckets, key, burst, rate, now):
+        bucket = buckets.get(key)
+        if bucket is None:
+            if len(buckets) >= self.MAX_TRACKED_VENS:
+                self._drop_idle_buckets(buckets, burst, rate, now)
+                if buckets is self._buckets:
+                    self.rejections = {key: count for key, count in self.rejections.items() if key in buckets}
+            bucket = buckets[key] = TokenBucket(burst, now)
+
+        bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        return bucket
+
+    def reject(self, ven_id, service_name, reason, peer=None):
+        ADMISSION_REJECTED.labels(service_name, reason).inc()
+        key = (peer, ven_id)
+        self.rejections[key] = self.rejections.get(key, 0) + 1
+
+    @staticmethod
+    def _drop_idle_buckets(buckets, burst, rate, now):
+        # Full buckets without requests in progress are the same as new ones.
+        for key, bucket in list(buckets.items()):
+            if 0 == bucket.in_flight and bucket.tokens + (now - bucket.updated) * rate >= burst:
+                del buckets[key]
+
+def patch_admission_control(vtn, rate=None, burst=None, max_concurrent_requests=None, peer_rate=None,
+                            peer_burst=None):
+    """
+    This function adds per-VEN rate and concurrency limits in front of the
+    VTN's OpenADR services. The VEN is identified by a cheap search of the raw
+    message, so that excess requests are rejected before parsing. Call it
+    after patches that replace the VTN's application (e.g., 'patch_update_report'),
+    but before 'patch_runtime_profile'.
+    """
+    vtn.admission_control = AdmissionControl(rate, burst, max_concurrent_requests, peer_rate, peer_burst)
+    service_names = {s.__service_name__ for s in vtn.services.values()}
+
+    @middleware
+    async def admission_control_middleware(request, handler):
+        service_name = request.path.rsplit('/', 1)[-1]
+        if service_name not in service_names:
+            return await handler(request)
+
+        # The raw message is cached by aiohttp, i.e., it is not read twice.
+        identifier = find_ven_identifier(await request.read())
+        if identifier is None:
+            return await handler(request)
+
+        _, ven_id = identifier
+        peer = request.remote
+        rejected = vtn.admission_control.acquire(ven_id, peer)
+        if rejected:
+            reason, retry_after = rejected
+            vtn.admission_control.reject(ven_id, service_name, reason, peer)
+            LOGGER.debug(f'REJECTED REQUEST OF {ven_id} TO {service_name} ({reason} limit)')
+            return Response(status=429, headers={'Retry-After': str(math.ceil(retry_after))})
+
+        try:
+            return await handler(request)
+        finally:
+            vtn.admission_control.release(ven_id, peer)
+
+    vtn.app.middlewares.append(admission_control_middleware)
@@ -0,0 +1,107 @@
+from .logger import *
+
+import time
+from prometheus_client import Counter, Gauge
+
+CIRCUIT_BREAKER_STATE = Gauge('vtn_circuit_breaker_state', 'State of the circuit breaker of an external dependency '
+                              '(0 = closed, 1 = half-open, 2 = open)', ['dependency'])
+CIRCUIT_BREAKER_FAILURES = Counter('vtn_circuit_breaker_failures', 'Failed calls to an external dependency',
+                                   ['dependency'])
+CIRCUIT_BREAKER_REJECTED = Counter('vtn_circuit_breaker_rejected',
+                                   'Calls to an external dependency rejected by its open circuit breaker',
+                                   ['dependency'])
+
+# All circuit breakers of this process (name -> circuit breaker), e.g., for the monitor.
+CIRCUIT_BREAKERS = {}
+
+class CircuitOpenError(Exception):
+    '''
+    Raised instead of calling a dependency whose circuit breaker is open.
+    '''
+
+class CircuitBreaker:
+    '''
+    Circuit breaker for an external dependency (e.g., Prometheus or Redis).
+    After a number of consecutive failures, calls fail fast (open) for a
+    while. Then a single call is let through to probe for recovery
+    (half-open), which either closes or re-opens the breaker.
+    '''
+
+    CLOSED = 'closed'
+    HALF_OPEN = 'half-open'
+    OPEN = 'open'
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    FAILURE_THRESHOLD = 3
+    RESET_TIMEOUT = 30.
+
+    # Maximum length of the last error shown (e.g., error messages incl. query URLs).
+    MAX_ERROR_LENGTH = 200
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or self.FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or self.RESET_TIMEOUT
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.statistics = dict(calls=0, failures=0, rejected=0)
+
+        CIRCUIT_BREAKER_STATE.labels(name).set(0)
+        CIRCUIT_BREAKERS[name] = self
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call the dependency, or raise CircuitOpenError if the breaker is open.
+        """
+        if not self.allow():
+            self.statistics['rejected'] += 1
+            CIRCUIT_BREAKER_REJECTED.labels(self.name).inc()
+            raise CircuitOpenError(f'circuit breaker for {self.name} is open')
+
+        self.statistics['calls'] += 1
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self.failure(e)
+            raise
+        self.success()
+        return result
+
+    def allow(self, now=None):
+        if self.CLOSED == self.state:
+            return True
+
+        # Let a single call through to probe for recovery.
+        now = time.monotonic() if now is None else now
+        if self.OPEN == self.state and now - self.opened_at >= self.reset_timeout:
+            self._set_state(self.HALF_OPEN)
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        if self.CLOSED != self.state:
+            LOGGER.info(f'{self.name.upper()} RECOVERED, CIRCUIT BREAKER CLOSED')
+            self._set_state(self.CLOSED)
+
+    def failure(self, error=None, now=None):
+        self.failures += 1
+        self.last_error = repr(error)[:self.MAX_ERROR_LENGTH]
+        self.statistics['failures'] += 1
+        CIRCUIT_BREAKER_FAILURES.labels(self.name).inc()
+
+        if self.HALF_OPEN == self.state or self.failures >= self.failure_threshold:
+            if self.OPEN != self.state:
+                LOGGER.error(f'{self.name.upper()} FAILED ({self.last_error}), CIRCUIT BREAKER OPEN')
+            self.opened_at = time.monotonic() if now is None else now
+            self._set_state(self.OPEN)
+
+    def status(self):
+        return dict(state=self.state, failures=self.failures, last_error=self.last_error, **self.statistics)
+
+    def _set_state(self, state):
+        self.state = state
+        CIRCUIT_BREAKER_STATE.labels(self.name).set(self.STATE_VALUES[state])
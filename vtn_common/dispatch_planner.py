@@ -0,0 +1,111 @@
+from .logger import *
+
+from .lazy_import import lazy_module
+
+# NumPy is imported on the first dispatch plan.
+np = lazy_module('numpy')
+
+class DispatchPlan:
+    '''
+    Event values for a set of VEN resources, computed by the dispatch planner.
+    '''
+
+    def __init__(self, targets, values, current_values, from_forecast):
+        self.targets = targets
+        self.values = values
+        self.current_values = current_values
+        self.from_forecast = from_forecast
+
+    def __len__(self):
+        return len(self.targets)
+
+    def __iter__(self):
+        """
+        Iterate over (ven_id, resource_id, value, current_value), current_value is None if unknown.
+        """
+        values = self.values.tolist()
+        current_values = self.current_values.tolist()
+        for (ven_id, resource_id), value, current_value in zip(self.targets, values, current_values):
+            yield ven_id, resource_id, value, (None if current_value != current_value else current_value)
+
+    @property
+    def deltas(self):
+        """
+        Difference between the planned and the current event values (unknown current values count as 0).
+        """
+        return self.values - np.nan_to_num(self.current_values)
+
+class DispatchPlanner:
+    '''
+    Computes the event values for many VEN resources at once: the flex forecasts
+    and current event values are loaded in bulk from the time series database,
+    missing forecasts are replaced by random values, and the values are scaled,
+    clipped and rounded as arrays.
+    '''
+
+    FALLBACK_RANGE = (0., 2.)
+    CLIP_RANGE = (None, None)
+    SCALE = 1.
+    DECIMALS = 2
+
+    def __init__(self, vtn_id, time_series_db, event_type, fallback_range=None, clip_range=None, scale=None,
+                 with_current_values=False, seed=0):
+        self.vtn_id = vtn_id
+        self.event_type = event_type
+        self.fallback_range = fallback_range or self.FALLBACK_RANGE
+        self.clip_range = clip_range or self.CLIP_RANGE
+        self.scale = scale or self.SCALE
+        self.with_current_values = with_current_values
+
+        self._time_series_db = time_series_db
+        self._random = np.random.default_rng(seed)
+
+    def plan(self, targets, value=None):
+        """
+        Plan the event values for a list of (ven_id, resource_id) targets. If
+        a value is given, it is used for all targets instead of the forecasts.
+        """
+        targets = list(targets)
+
+        forecasts = None
+        if not value:
+            forecasts = self._load([f'{self.vtn_id}:FLEX:{ven_id}:{resource_id}' for ven_id, resource_id in targets])
+
+        current_values = None
+        if self.with_current_values:
+            current_values = self._load([f'{self.vtn_id}:EVENT:{ven_id}:{resource_id}:{self.event_type}'
+                                         for ven_id, resource_id in targets])
+
+        return self.compute(targets, forecasts, current_values, value)
+
+    def compute(self, targets, forecasts=None, current_values=None, value=None):
+        """
+        Compute the plan from arrays of forecasts and current event values (NaN
+        if unknown, None if all are unknown).
+        """
+        size = len(targets)
+        forecasts = np.full(size, np.nan) if forecasts is None else forecasts
+        current_values = np.full(size, np.nan) if current_values is None else current_values
+
+        if value:
+            LOGGER.info('USER-DEFINED FLEX FORECAST VALUE')
+            return DispatchPlan(targets, np.full(size, float(value)), current_values, np.zeros(size, dtype=bool))
+
+        # Missing (or zero) forecasts are replaced by random values.
+        from_forecast = np.isfinite(forecasts) & (forecasts != 0.)
+        missing = np.count_nonzero(~from_forecast)
+        if missing:
+            LOGGER.info(f'NO FLEX FORECAST FOUND FOR {missing} OF {size} RESOURCES, USE RANDOM VALUES INSTEAD')
+
+        values = np.where(from_forecast, forecasts, self._random.uniform(*self.fallback_range, size))
+        values = values * self.scale
+        if self.clip_range != (None, None):
+            values = np.clip(values, *self.clip_range)
+        values = np.round(values, self.DECIMALS)
+
+        return DispatchPlan(targets, values, current_values, from_forecast)
+
+    def _load(self, time_series_names):
+        latest_values = self._time_series_db.get_latest_values(time_series_names)
+        return np.fromiter((latest_values.get(name, np.nan) for name in time_series_names),
+                           dtype=float, count=len(time_series_names))
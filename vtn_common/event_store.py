@@ -0,0 +1,148 @@
+from .logger import *
+
+import asyncio
+import heapq
+from datetime import datetime, timezone, timedelta
+from openleadr import enums
+from openleadr.utils import getmember
+from prometheus_client import Counter, Gauge
+
+EVENT_STORE_EVENTS = Gauge('vtn_event_store_events', 'Events kept by the VTN (not yet completed or cancelled)')
+EVENT_STORE_REMOVED = Counter('vtn_event_store_removed', 'Events removed from the VTN', ['reason'])
+
+# End time of events without a duration.
+NO_END = datetime.max.replace(tzinfo=timezone.utc)
+
+class EventStore:
+    '''
+    Garbage collection for the events of OpenLEADR's event service: an index
+    ordered by end time (heap) expires completed and cancelled events, and
+    the number of events per VEN is limited. Expired events are removed from
+    the event queues and from the callbacks of the event service.
+    '''
+
+    # Events are kept for a while after their end / cancellation, so that
+    # the VENs learn about the new status with their next polls.
+    COMPLETED_EVENT_RETENTION = timedelta(minutes=1)
+    CANCELLED_EVENT_RETENTION = timedelta(minutes=5)
+
+    # If a VEN has more events, the ones that end first are removed.
+    MAX_EVENTS_PER_VEN = 100
+
+    EXPIRY_PERIOD = 10.
+
+    def __init__(self, event_service, max_events_per_ven=None):
+        self._event_service = event_service
+        self.max_events_per_ven = max_events_per_ven or self.MAX_EVENTS_PER_VEN
+
+        # Event ID -> (VEN ID, event, expiry time), VEN ID -> {event ID: expiry time}
+        self._events = {}
+        self._ven_events = {}
+
+        # Heap of (expiry time, event ID), entries of removed or rescheduled events are skipped.
+        self._index = []
+
+    def __len__(self):
+        return len(self._events)
+
+    def add(self, ven_id, event_id, event=None):
+        """
+        Add an event that has been added to the event service.
+        """
+        event = event or self._find_event(ven_id, event_id)
+        if event is None:
+            return
+
+        active_period = getmember(event, 'active_period', None)
+        dtstart = getmember(active_period, 'dtstart', None) if active_period else None
+        duration = getmember(active_period, 'duration', None) if active_period else None
+        expiry = dtstart + duration + self.COMPLETED_EVENT_RETENTION if dtstart and duration else NO_END
+        self._schedule(ven_id, event_id, event, expiry)
+
+        # Limit the number of events per VEN.
+        ven_events = self._ven_events[ven_id]
+        while len(ven_events) > self.max_events_per_ven:
+            self._remove(min(ven_events, key=ven_events.get), 'limit')
+
+        EVENT_STORE_EVENTS.set(len(self._events))
+
+    def cancel(self, event_id, now=None):
+        """
+        Expire a cancelled event after the retention time.
+        """
+        if event_id in self._events:
+            ven_id, event, _ = self._events[event_id]
+            now = now or datetime.now(timezone.utc)
+            self._schedule(ven_id, event_id, event, now + self.CANCELLED_EVENT_RETENTION)
+
+    def expire(self, now=None):
+        """
+        Remove all events that have expired, return their number.
+        """
+        now = now or datetime.now(timezone.utc)
+        expired = 0
+        while self._index and self._index[0][0] <= now:
+            expiry, event_id = heapq.heappop(self._index)
+            entry = self._events.get(event_id)
+            if entry is None or entry[2] != expiry:
+                continue
+
+            cancelled = enums.EVENT_STATUS.CANCELLED == getmember(entry[1], 'event_descriptor.event_status', None)
+            self._remove(event_id, 'cancelled' if cancelled else 'completed')
+            expired += 1
+
+        # Rebuild the index if it mostly consists of skipped entries.
+        if len(self._index) > 2 * len(self._events) + 1000:
+            self._index = [(expiry, event_id) for event_id, (_, _, expiry) in self._events.items()]
+            heapq.heapify(self._index)
+
+        EVENT_STORE_EVENTS.set(len(self._events))
+        return expired
+
+    async def run_expiry(self):
+        """
+        Expire events periodically.
+        """
+        while True:
+            await asyncio.sleep(self.EXPIRY_PERIOD)
+            try:
+                expired = self.expire()
+                if expired:
+                    LOGGER.debug(f'REMOVED {expired} EXPIRED EVENTS')
+            except Exception as e:
+                LOGGER.error(f'Failed to expire events: {e}')
+
+    def _schedule(self, ven_id, event_id, event, expiry):
+        self._events[event_id] = (ven_id, event, expiry)
+        self._ven_events.setdefault(ven_id, {})[event_id] = expiry
+        heapq.heappush(self._index, (expiry, event_id))
+
+    def _remove(self, event_id, reason):
+        ven_id, event, _ = self._events.pop(event_id)
+        ven_events = self._ven_events[ven_id]
+        del ven_events[event_id]
+        if not ven_events:
+            del self._ven_events[ven_id]
+
+        # The event may already have been removed by the event service.
+        event_service = self._event_service
+        events = event_service.events.get(ven_id)
+        if events:
+            for i, queued_event in enumerate(events):
+                if queued_event is event:
+                    del events[i]
+                    break
+        event_service.event_callbacks.pop(event_id, None)
+        event_service.event_delivery_callbacks.pop(event_id, None)
+        completed_event_ids = event_service.completed_event_ids.get(ven_id)
+        if completed_event_ids and event_id in completed_event_ids:
+            completed_event_ids.remove(event_id)
+
+        EVENT_STORE_REMOVED.labels(reason).inc()
+
+    def _find_event(self, ven_id, event_id):
+        # The event that has just been added is the last one in the VEN's queue.
+        for event in reversed(self._event_service.events.get(ven_id, [])):
+            if event_id == getmember(event, 'event_descriptor.event_id', None):
+                return event
+        return None
@@ -0,0 +1,158 @@
+from .logger import *
+
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from aiohttp.web import middleware
+from prometheus_client import Gauge, Histogram
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10.)
+
+REQUEST_LATENCY = Histogram('vtn_request_latency_seconds',
+                            'Latency of HTTP requests to the OpenADR services (incl. parsing and signing)',
+                            ['service'], buckets=LATENCY_BUCKETS)
+REQUESTS_IN_FLIGHT = Gauge('vtn_requests_in_flight', 'HTTP requests to the OpenADR services in progress',
+                           ['service'])
+
+MESSAGE_LATENCY = Histogram('vtn_message_latency_seconds',
+                            'Latency of handling OpenADR messages per service and message type',
+                            ['service', 'message_type'], buckets=LATENCY_BUCKETS)
+
+HANDLER_LATENCY = Histogram('vtn_handler_latency_seconds', 'Latency of VTN handlers and callbacks',
+                            ['handler'], buckets=LATENCY_BUCKETS)
+HANDLERS_IN_FLIGHT = Gauge('vtn_handlers_in_flight', 'VTN handlers and callbacks in progress', ['handler'])
+
+# Includes the time until the VEN's next poll (POLL MODE VTN).
+EVENT_DISPATCH_LATENCY = Histogram('vtn_event_dispatch_latency_seconds',
+                                   'Time from creating an event to its delivery to the VEN (poll response or push)',
+                                   buckets=LATENCY_BUCKETS + (30., 60.))
+
+EVENT_LOOP_LAG = Gauge('vtn_event_loop_lag_seconds', 'Latest measured lag of the asyncio event loop')
+EVENT_LOOP_LAG_HISTOGRAM = Histogram('vtn_event_loop_lag_histogram_seconds', 'Lag of the asyncio event loop',
+                                     buckets=LATENCY_BUCKETS)
+
+EVENT_LOOP_LAG_PROBE_PERIOD = 0.5
+
+# Recent event loop lag samples (last 5 minutes).
+EVENT_LOOP_LAG_SAMPLES = deque(maxlen=600)
+_EVENT_LOOP_LAG_PROBE = None
+
+# Per-VEN counters, not exported to Prometheus to avoid high cardinality.
+# For each VEN ID: [messages, bytes received, bytes sent, handler time].
+VEN_STATISTICS = {}
+
+# Context of the request that is currently handled (filled by the service handlers).
+_REQUEST_CONTEXT = ContextVar('vtn_request_context', default=None)
+
+@contextmanager
+def track(handler):
+    """
+    Measure latency and in-flight count of a VTN handler or callback.
+    """
+    in_flight = HANDLERS_IN_FLIGHT.labels(handler)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        HANDLER_LATENCY.labels(handler).observe(time.perf_counter() - start)
+        in_flight.dec()
+
+async def probe_event_loop_lag(period=EVENT_LOOP_LAG_PROBE_PERIOD):
+    """
+    Periodically measure by how much the event loop is late in waking up a sleeping task.
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(period)
+        lag = max(0., loop.time() - start - period)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+        EVENT_LOOP_LAG_SAMPLES.append(lag)
+
+def start_event_loop_lag_probe(loop):
+    """
+    Start probing the event loop lag (only once per process).
+    """
+    global _EVENT_LOOP_LAG_PROBE
+    if not _EVENT_LOOP_LAG_PROBE or _EVENT_LOOP_LAG_PROBE.done():
+        _EVENT_LOOP_LAG_PROBE = loop.create_task(probe_event_loop_lag())
+    return _EVENT_LOOP_LAG_PROBE
+
+def _record_ven_statistics(ven_id, bytes_received, bytes_sent, handler_time):
+    statistics = VEN_STATISTICS.get(ven_id)
+    if statistics is None:
+        statistics = VEN_STATISTICS[ven_id] = [0, 0, 0, 0.]
+    statistics[0] += 1
+    statistics[1] += bytes_received
+    statistics[2] += bytes_sent
+    statistics[3] += handler_time
+
+def _instrument_handle_message(service):
+    handle_message = service.handle_message
+    service_name = service.__service_name__
+
+    async def handle_message_instrumented(message_type, message_payload):
+        start = time.perf_counter()
+        try:
+            return await handle_message(message_type, message_payload)
+        finally:
+            duration = time.perf_counter() - start
+            MESSAGE_LATENCY.labels(service_name, message_type).observe(duration)
+
+            context = _REQUEST_CONTEXT.get()
+            if context is not None:
+                context['ven_id'] = message_payload.get('ven_id')
+                context['handler_time'] = duration
+
+    service.handle_message = handle_message_instrumented
+
+def patch_instrumentation(vtn):
+    """
+    This function adds latency histograms and in-flight counters for all
+    OpenADR services of the VTN, plus a probe for the event loop lag. Call it
+    after patches that replace the VTN's services or application (e.g.,
+    'patch_update_report'), but before 'patch_runtime_profile'.
+    """
+    service_names = {s.__service_name__ for s in vtn.services.values()}
+
+    for service in vtn.services.values():
+        _instrument_handle_message(service)
+
+    @middleware
+    async def instrumentation_middleware(request, handler):
+        service_name = request.path.rsplit('/', 1)[-1]
+        if service_name not in service_names:
+            service_name = 'unknown'
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(service_name)
+        in_flight.inc()
+        context = {}
+        token = _REQUEST_CONTEXT.set(context)
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await handler(request)
+            return response
+        finally:
+            REQUEST_LATENCY.labels(service_name).observe(time.perf_counter() - start)
+            in_flight.dec()
+            _REQUEST_CONTEXT.reset(token)
+
+            if context.get('ven_id'):
+                bytes_sent = (response.content_length or 0) if response is not None else 0
+                _record_ven_statistics(context['ven_id'], request.content_length or 0, bytes_sent,
+                                       context['handler_time'])
+
+    # The instrumentation middleware is the outermost one.
+    vtn.app.middlewares.insert(0, instrumentation_middleware)
+
+    # Start probing the event loop lag as soon as the server is running.
+    run = vtn.run
+    async def run_patched():
+        await run()
+        start_event_loop_lag_probe(asyncio.get_event_loop())
+    vtn.run = run_patched
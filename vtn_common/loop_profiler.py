@@ -0,0 +1,154 @@
+from .logger import *
+
+import cProfile
+import heapq
+import io
+import itertools
+import pstats
+import time
+from asyncio.events import Handle
+
+class SlowCallbackTracker:
+    '''
+    Keeps track of the slowest callbacks (incl. coroutine steps) executed by
+    the asyncio event loop. Only callbacks that exceed a threshold are recorded,
+    which keeps the overhead low enough for production use. Note: callbacks of
+    uvloop's event loop cannot be tracked.
+    '''
+
+    THRESHOLD = 0.01
+    MAX_ENTRIES = 20
+
+    def __init__(self, threshold=None, max_entries=None):
+        self.threshold = threshold or self.THRESHOLD
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.count = 0
+        self._slowest = []
+        self._counter = itertools.count()
+        self._handle_run = None
+
+    @property
+    def running(self):
+        return self._handle_run is not None
+
+    def start(self):
+        if self.running:
+            return
+
+        handle_run = self._handle_run = Handle._run
+        tracker = self
+
+        def _run_tracked(handle):
+            start = time.perf_counter()
+            handle_run(handle)
+            duration = time.perf_counter() - start
+            if duration > tracker.threshold:
+                tracker._record(handle, duration)
+
+        Handle._run = _run_tracked
+
+    def stop(self):
+        if self.running:
+            Handle._run = self._handle_run
+            self._handle_run = None
+
+    def reset(self):
+        self.count = 0
+        self._slowest = []
+
+    def slowest(self):
+        """
+        Return the slowest callbacks as list of (duration, timestamp, description).
+        """
+        return [(duration, timestamp, description)
+                for duration, _, timestamp, description in sorted(self._slowest, reverse=True)]
+
+    def _record(self, handle, duration):
+        self.count += 1
+        entry = (duration, next(self._counter), time.time(), self._describe(handle))
+        if len(self._slowest) < self.max_entries:
+            heapq.heappush(self._slowest, entry)
+        else:
+            heapq.heappushpop(self._slowest, entry)
+
+    @staticmethod
+    def _describe(handle):
+        callback = handle._callback
+        task = getattr(callback, '__self__', None)
+
+        # Coroutine steps are described by the coroutine and its current position.
+        get_coro = getattr(task, 'get_coro', None)
+        if get_coro:
+            coro = get_coro()
+            frame = getattr(coro, 'cr_frame', None)
+            code = getattr(coro, 'cr_code', None)
+            if frame:
+                location = f'{frame.f_code.co_filename}:{frame.f_lineno}'
+            elif code:
+                location = f'{code.co_filename}:{code.co_firstlineno}, done'
+            else:
+                location = 'unknown'
+            return f'{getattr(coro, "__qualname__", coro)} ({location})'
+
+        return repr(callback)
+
+class TimedProfiler:
+    '''
+    Profiler that runs for a limited time only, using yappi (if available) or cProfile.
+    Start and stop it in the event loop's thread: cProfile profiles the thread
+    that enables it, and the stop is scheduled with the loop.
+    '''
+
+    TOP_FUNCTIONS = 20
+
+    def __init__(self):
+        self._profiler = None
+        self._stop_handle = None
+        self.report = None
+
+    @property
+    def running(self):
+        return self._profiler is not None
+
+    def start(self, loop, duration):
+        if self.running:
+            return False
+
+        try:
+            import yappi
+            yappi.clear_stats()
+            yappi.set_clock_type('cpu')
+            yappi.start()
+            self._profiler = yappi
+        except ImportError:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+        self._stop_handle = loop.call_later(duration, self.stop)
+        return True
+
+    def stop(self, top=None):
+        if not self.running:
+            return
+
+        if self._stop_handle:
+            self._stop_handle.cancel()
+            self._stop_handle = None
+
+        top = top or self.TOP_FUNCTIONS
+        out = io.StringIO()
+
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+            pstats.Stats(self._profiler, stream=out).sort_stats('tottime').print_stats(top)
+        else:
+            self._profiler.stop()
+            stats = self._profiler.get_func_stats().sort('tsub')
+            out.write(f'{"ncall":>10} {"tsub":>10} {"ttot":>10}  function\n')
+            for stat in list(stats)[:top]:
+                out.write(f'{stat.ncall:>10} {stat.tsub:>10.4f} {stat.ttot:>10.4f}  {stat.full_name}\n')
+            self._profiler.clear_stats()
+
+        self._profiler = None
+        self.report = out.getvalue()
+        LOGGER.info(f'PROFILER REPORT:\n{self.report}')
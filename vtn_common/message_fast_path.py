@@ -0,0 +1,163 @@
+from .logger import *
+
+from io import BytesIO
+from xml.sax.saxutils import escape
+from lxml import etree
+from openleadr import utils
+from openleadr.messaging import parse_message
+from openleadr.service import vtn_service
+
+REQUEST_ID_PLACEHOLDER = '__VTN_REQUEST_ID__'
+
+NS_EI = '{http://docs.oasis-open.org/ns/energyinterop/201110}'
+NS_OADR = '{http://openadr.org/oadr-2.0b/2012/07}'
+NS_XCAL = '{urn:ietf:params:xml:ns:icalendar-2.0}'
+NS_STRM = '{urn:ietf:params:xml:ns:icalendar-2.0:stream}'
+
+class MessageTemplateCache:
+    '''
+    Pre-rendered responses that are (nearly) constant per VEN. Only the
+    request ID of the VEN's request is patched into the cached message.
+    Signed messages cannot be cached (the signature covers the request ID).
+    '''
+
+    MESSAGE_TYPES = ('oadrUpdatedReport', 'oadrResponse')
+    MAX_ENTRIES = 100000
+
+    def __init__(self, create_message, max_entries=None):
+        self._create_message = create_message
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self._templates = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, message_type, **message_payload):
+        key = self._key(message_type, message_payload)
+        if key is None:
+            return self._create_message(message_type, **message_payload)
+
+        template = self._templates.get(key)
+        if template is None:
+            self.misses += 1
+            template = self._render(message_type, message_payload)
+            if len(self._templates) >= self.max_entries:
+                self._templates.clear()
+            self._templates[key] = template
+        else:
+            self.hits += 1
+
+        request_id = message_payload['response'].get('request_id')
+        if 1 == len(template):
+            return template[0]
+        return template[0] + escape(str(request_id)) + template[1]
+
+    def _key(self, message_type, message_payload):
+        """
+        Return the cache key, or None if the message is not cacheable.
+        """
+        if message_type not in self.MESSAGE_TYPES:
+            return None
+
+        response = message_payload.get('response')
+        if not response or 200 != response.get('response_code') or 'OK' != response.get('response_description'):
+            return None
+
+        # Any content other than the response, the IDs and the (unused) request ID prevents caching.
+        if set(message_payload) - {'response', 'vtn_id', 'ven_id', 'request_id'}:
+            return None
+
+        return message_type, message_payload.get('vtn_id'), message_payload.get('ven_id'), \
+            response.get('request_id') is None
+
+    def _render(self, message_type, message_payload):
+        response = dict(message_payload['response'])
+        if response.get('request_id') is not None:
+            response['request_id'] = REQUEST_ID_PLACEHOLDER
+        message = self._create_message(message_type, **dict(message_payload, response=response))
+        return tuple(message.split(REQUEST_ID_PLACEHOLDER, 1))
+
+def parse_update_report_streaming(content):
+    """
+    Parse an oadrUpdateReport message with iterparse: the report intervals are
+    extracted one by one (and dropped from the tree), the remaining small
+    message is parsed by OpenLEADR. This saves CPU time, not memory: OpenLEADR
+    validates the full message against the XML schema beforehand. Return None
+    if the message contains report intervals that are not supported, i.e.,
+    that need OpenLEADR's parser.
+    """
+    reports_intervals = []
+    intervals = None
+
+    for event, element in etree.iterparse(BytesIO(content), events=('start', 'end')):
+        if NS_STRM + 'intervals' == element.tag:
+            if 'start' == event:
+                intervals = []
+            else:
+                reports_intervals.append(intervals)
+                intervals = None
+        elif 'end' == event and NS_EI + 'interval' == element.tag and intervals is not None:
+            interval = _parse_report_interval(element)
+            if interval is None:
+                return None
+            intervals.append(interval)
+
+            # Keep the remaining message small for OpenLEADR's parser.
+            parent = element.getparent()
+            parent.remove(element)
+
+    message_type, message_payload = parse_message(etree.tostring(element.getroottree()))
+    reports = message_payload.get('reports', [])
+    if 'oadrUpdateReport' != message_type or len(reports) != len(reports_intervals):
+        return None
+
+    for report, intervals in zip(reports, reports_intervals):
+        report['intervals'] = intervals
+    return message_type, message_payload
+
+def _parse_report_interval(element):
+    dtstart = None
+    report_payloads = []
+
+    for child in element:
+        if NS_XCAL + 'dtstart' == child.tag:
+            dtstart = utils.parse_datetime(child.findtext(NS_XCAL + 'date-time'))
+        elif NS_OADR + 'oadrReportPayload' == child.tag:
+            if 2 != len(child):
+                return None
+            r_id = child.findtext(NS_EI + 'rID')
+            value = child.findtext(f'{NS_EI}payloadFloat/{NS_EI}value')
+            if r_id is None or value is None:
+                return None
+            report_payloads.append({'r_id': r_id, 'value': float(value)})
+        else:
+            return None
+
+    if dtstart is None or not report_payloads:
+        return None
+
+    return {'dtstart': dtstart,
+            'report_payload': report_payloads[0] if 1 == len(report_payloads) else report_payloads}
+
+def patch_message_fast_path(vtn, streaming_parse_threshold=16384):
+    """
+    This function adds fast paths for small, constant responses (cached per VEN)
+    and for parsing large oadrUpdateReport messages (iterparse). Call it after
+    patches that replace the VTN's services (e.g., 'patch_update_report').
+    """
+    create_message = vtn_service.VTNService._create_message
+    if create_message.keywords.get('cert') and create_message.keywords.get('key'):
+        LOGGER.info('MESSAGES ARE SIGNED, RESPONSE TEMPLATES ARE DISABLED')
+    else:
+        vtn.message_templates = MessageTemplateCache(create_message)
+        for service in vtn.services.values():
+            service._create_message = vtn.message_templates
+
+    # The VTN services look up 'parse_message' in the module 'vtn_service'.
+    def parse_message_fast(data):
+        if len(data) >= streaming_parse_threshold and b'oadrUpdateReport' in utils.ensure_bytes(data):
+            result = parse_update_report_streaming(utils.ensure_bytes(data))
+            if result is not None:
+                return result
+        return parse_message(data)
+
+    vtn_service.parse_message = parse_message_fast
@@ -1,18 +1,33 @@
 from .logger import *
 
+from .report_dedup import DedupCache, REPORT_DUPLICATES
+
 from openleadr.service import handler, service, ReportService
 from openleadr.utils import group_by, normalize_dict
 
-from asyncio import iscoroutine
+from asyncio import iscoroutine, get_running_loop, shield
 from aiohttp.web import post, Application
 
 @service('EiReport')
 class PatchedReportService(ReportService):
     """
     This report service can process reports with mutiple payloads within a 
-    single report interval.
+    single report interval. Retransmitted reports are acknowledged without
+    processing them again.
     """
 
+    # Number of recent report messages / report intervals remembered for deduplication.
+    MAX_DEDUP_MESSAGES = 100000
+    MAX_DEDUP_INTERVALS = 200000
+
+    def __init__(self, vtn_id):
+        super().__init__(vtn_id)
+        self.message_dedup = DedupCache(self.MAX_DEDUP_MESSAGES)
+        self.interval_dedup = DedupCache(self.MAX_DEDUP_INTERVALS)
+
+        # Message key -> future of the messages that are being processed.
+        self._in_flight = {}
+
     @handler('oadrUpdateReport')
     async def update_report_patched(self, payload):
         """
@@ -22,6 +37,45 @@ class PatchedReportService(ReportService):
         adds a few lines that make multi-payload intervals digestible for the
         rest of the code.
         """
+        # A retransmitted message (same request ID) is only acknowledged once the
+        # original message has been processed successfully.
+        ven_id = payload.get('ven_id')
+        message_key = (ven_id, payload.get('request_id'))
+        if message_key[1] is not None:
+            if message_key in self.message_dedup:
+                REPORT_DUPLICATES.labels('message').inc()
+                return 'oadrUpdatedReport', {}
+            in_flight = self._in_flight.get(message_key)
+            if in_flight is not None:
+                # Fails as well if the original message fails (the VEN retransmits it later).
+                await shield(in_flight)
+                REPORT_DUPLICATES.labels('message').inc()
+                return 'oadrUpdatedReport', {}
+            in_flight = self._in_flight[message_key] = get_running_loop().create_future()
+
+        try:
+            await self._update_report(ven_id, payload)
+        except Exception as e:
+            if message_key[1] is not None:
+                in_flight.set_exception(e)
+                # Mark the exception as retrieved (there may be no retransmission waiting for it).
+                in_flight.exception()
+            raise
+        else:
+            if message_key[1] is not None:
+                self.message_dedup.add(message_key)
+                in_flight.set_result(None)
+        finally:
+            if message_key[1] is not None:
+                if not in_flight.done():
+                    in_flight.cancel()
+                del self._in_flight[message_key]
+
+        response_type = 'oadrUpdatedReport'
+        response_payload = {}
+        return response_type, response_payload
+
+    async def _update_report(self, ven_id, payload):
         for report in payload['reports']:
             report_request_id = report['report_request_id']
             if not self.report_callbacks:
@@ -46,16 +100,21 @@ class PatchedReportService(ReportService):
             for r_id, values in group_by(intervals, 'report_payload.r_id').items():
                 # Find the callback that was registered.
                 if (report_request_id, r_id) in self.report_callbacks:
-                    # Collect the values
-                    values = [(ri['dtstart'], ri['report_payload']['value']) for ri in values]
+                    # Collect the values (except for intervals that have already been received)
+                    received = len(values)
+                    values = [(ri['dtstart'], ri['report_payload']['value']) for ri in values
+                              if (ven_id, report_request_id, r_id, ri['dtstart']) not in self.interval_dedup]
+                    if len(values) < received:
+                        REPORT_DUPLICATES.labels('interval').inc(received - len(values))
+                        if not values:
+                            continue
                     # Call the callback function to deliver the values
                     result = self.report_callbacks[(report_request_id, r_id)](values)
                     if iscoroutine(result):
                         result = await result
-
-        response_type = 'oadrUpdatedReport'
-        response_payload = {}
-        return response_type, response_payload
+                    # Remember the intervals only once they have been delivered.
+                    for dtstart, _ in values:
+                        self.interval_dedup.add((ven_id, report_request_id, r_id, dtstart))
 
 def patch_update_report(vtn, vtn_id):
     """
@@ -0,0 +1,55 @@
+import math
+from datetime import timedelta
+from hashlib import md5
+
+class PollSchedule:
+    '''
+    Poll frequency and registration delay per VEN client, so that VENs that
+    register at the same time (e.g., after a VTN restart) do not poll in
+    lock-step. Both are derived from the VEN name, i.e., they do not change on
+    re-registration.
+    '''
+
+    # The poll frequency is between the requested one and (1 + JITTER) times it.
+    JITTER = 0.4
+
+    # Maximum delay [s] of a registration response, well below the timeouts of
+    # VEN clients (the request is held open while it is delayed).
+    MAX_REGISTRATION_DELAY = 2.
+
+    def __init__(self, requested_poll_freq, jitter=None, phase_spreading=True, max_poll_rate=None):
+        self.requested_poll_freq = requested_poll_freq
+        self.jitter = self.JITTER if jitter is None else jitter
+        self.phase_spreading = phase_spreading
+
+        # Maximum number of polls per second (all VENs), None for no limit.
+        self.max_poll_rate = max_poll_rate
+
+    def poll_freq(self, ven_name, number_of_vens=0):
+        """
+        Return the poll frequency of a VEN. If the poll rate is limited, the
+        poll frequency is increased with the number of VENs.
+        """
+        base = self.requested_poll_freq.total_seconds()
+        if self.max_poll_rate:
+            base = max(base, number_of_vens / self.max_poll_rate)
+
+        # Whole seconds only (the poll frequency is sent as RFC 5545 duration).
+        seconds = round(base * (1. + self.jitter * self._fraction(ven_name, 'poll_freq')))
+        return timedelta(seconds=max(1, math.ceil(base), seconds))
+
+    def registration_delay(self, ven_name, poll_freq):
+        """
+        Return the time [s] the registration response should be delayed, so
+        that VENs registering at the same time start polling at different
+        times (within the poll period, but at most MAX_REGISTRATION_DELAY).
+        """
+        if not self.phase_spreading:
+            return 0.
+
+        return self._fraction(ven_name, 'phase') * min(poll_freq.total_seconds(), self.MAX_REGISTRATION_DELAY)
+
+    def _fraction(self, ven_name, salt):
+        # Deterministic value in [0, 1) per VEN name.
+        digest = md5(f'{salt}:{ven_name}'.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') / 2**64
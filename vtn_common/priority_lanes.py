@@ -0,0 +1,165 @@
+from .logger import *
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from aiohttp.web import middleware, Response
+from prometheus_client import Counter, Gauge, Histogram
+
+from .instrumentation import LATENCY_BUCKETS
+
+LANE_WAIT = Histogram('vtn_lane_wait_seconds', 'Time work waited for admission to its priority lane', ['lane'],
+                      buckets=LATENCY_BUCKETS)
+LANE_RUNNING = Gauge('vtn_lane_running', 'Work running in a priority lane', ['lane'])
+LANE_WAITING = Gauge('vtn_lane_waiting', 'Work waiting for admission to a priority lane', ['lane'])
+LANE_REJECTED = Counter('vtn_lane_rejected', 'Requests rejected because their priority lane was full', ['lane'])
+
+class Lane:
+    '''
+    Work lane with a priority (0 is the highest), a concurrency limit and a
+    bound for the work waiting for admission.
+    '''
+
+    def __init__(self, name, priority, max_concurrency, max_waiting):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+
+        self.running = 0
+        self.waiting = 0
+        self.deferred = 0
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        # Set while no work is running or waiting in the lane.
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    @property
+    def full(self):
+        return self.waiting >= self.max_waiting
+
+    def _update(self, running=0, waiting=0):
+        self.running += running
+        self.waiting += waiting
+        if self.running or self.waiting:
+            self.idle.clear()
+        else:
+            self.idle.set()
+        LANE_RUNNING.labels(self.name).set(self.running)
+        LANE_WAITING.labels(self.name).set(self.waiting)
+
+class PriorityLanes:
+    '''
+    Scheduling of the work of a VTN server (all in one asyncio event loop) in
+    lanes: work of a lane is admitted only while the lanes with higher priority
+    are idle (for at most MAX_DEFERRAL seconds, so that no lane starves) and
+    while the lane's concurrency limit is not reached.
+    '''
+
+    # Lane name -> (max. concurrency, max. waiting), ordered by priority. The high
+    # priority lane is for event creation and dispatch, the low priority lane for
+    # report ingestion and its post-processing (incl. the VEN info backup).
+    LANES = {
+        'high': (32, 10000),
+        'low': (4, 1000),
+    }
+
+    # Maximum time [s] work waits for the lanes with higher priority to become idle.
+    MAX_DEFERRAL = 1.
+
+    # Lanes of the requests to the OpenADR services (requests to other services are not scheduled).
+    # Polls are not scheduled: with many VENs they arrive continuously, so the high priority lane
+    # would hardly ever be idle and reports would always wait MAX_DEFERRAL.
+    SERVICE_LANES = {
+        'EiEvent': 'high',
+        'EiReport': 'low',
+    }
+
+    def __init__(self, lanes=None, max_deferral=None):
+        self.lanes = {name: Lane(name, priority, max_concurrency, max_waiting)
+                      for priority, (name, (max_concurrency, max_waiting)) in enumerate((lanes or self.LANES).items())}
+        self.max_deferral = self.MAX_DEFERRAL if max_deferral is None else max_deferral
+
+    @asynccontextmanager
+    async def lane(self, name):
+        """
+        Run work in a lane (waits for admission).
+        """
+        lane = self.lanes[name]
+        start = time.perf_counter()
+        lane._update(waiting=1)
+        try:
+            await lane._slots.acquire()
+            try:
+                if lane.priority:
+                    # Most work does not suspend once admitted (e.g., a report whose body is
+                    # already received), so let the event loop process pending I/O first:
+                    # this bounds the work of the lane per loop iteration by its concurrency
+                    # limit and lets new requests with higher priority enter their lane.
+                    await asyncio.sleep(0)
+                    await self._give_way(lane, start)
+            except BaseException:
+                lane._slots.release()
+                raise
+        finally:
+            lane._update(waiting=-1)
+
+        LANE_WAIT.labels(name).observe(time.perf_counter() - start)
+        lane._update(running=1)
+        try:
+            yield lane
+        finally:
+            lane._update(running=-1)
+            lane._slots.release()
+
+    async def _give_way(self, lane, start):
+        """
+        Wait until the lanes with higher priority are idle (for at most max_deferral).
+        """
+        for other in self.lanes.values():
+            if other.priority >= lane.priority or other.idle.is_set():
+                continue
+            remaining = self.max_deferral - (time.perf_counter() - start)
+            try:
+                if remaining <= 0.:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(other.idle.wait(), remaining)
+            except asyncio.TimeoutError:
+                lane.deferred += 1
+                return
+
+    def status(self):
+        return {name: dict(priority=lane.priority, running=lane.running, waiting=lane.waiting,
+                           max_concurrency=lane.max_concurrency, max_waiting=lane.max_waiting,
+                           deferred=lane.deferred)
+                for name, lane in self.lanes.items()}
+
+def patch_priority_lanes(vtn, service_lanes=None):
+    """
+    This function schedules the requests to the VTN's OpenADR services in
+    priority lanes, so that event dispatch (polls) is not delayed by report
+    ingestion. Requests whose lane is full are answered with HTTP status 503.
+    Call it after patches that replace the VTN's application (e.g.,
+    'patch_update_report'), but before 'patch_runtime_profile'.
+    """
+    if getattr(vtn, 'priority_lanes', None) is None:
+        vtn.priority_lanes = PriorityLanes()
+    lanes = vtn.priority_lanes
+    service_lanes = service_lanes or lanes.SERVICE_LANES
+
+    @middleware
+    async def priority_lanes_middleware(request, handler):
+        lane_name = service_lanes.get(request.path.rsplit('/', 1)[-1])
+        if lane_name is None:
+            return await handler(request)
+
+        if lanes.lanes[lane_name].full:
+            LANE_REJECTED.labels(lane_name).inc()
+            LOGGER.debug(f'REJECTED REQUEST TO {request.path} (lane {lane_name} is full)')
+            return Response(status=503, headers={'Retry-After': '1'})
+
+        async with lanes.lane(lane_name):
+            return await handler(request)
+
+    vtn.app.middlewares.append(priority_lanes_middleware)
@@ -0,0 +1,98 @@
+from .logger import *
+
+from aiohttp import ClientSession, TraceConfig
+
+class PushTransport:
+    '''
+    Outbound HTTP transport of the push-mode VTN: a single connection pool
+    (keep-alive per host, limited concurrent requests per host, DNS cache)
+    shared by all requests to the VENs (pushed events) and to other shards,
+    incl. statistics.
+    '''
+
+    STATISTICS = ('requests', 'request_errors', 'connections_created', 'connections_reused',
+                  'connections_queued', 'dns_cache_hits', 'dns_cache_misses')
+
+    def __init__(self, runtime_profile):
+        self.runtime_profile = runtime_profile
+        self.statistics = dict.fromkeys(self.STATISTICS, 0)
+
+        self._connector = None
+        self._session = None
+        self._trace_config = TraceConfig()
+        for signal, statistic in [('on_request_end', 'requests'),
+                                  ('on_request_exception', 'request_errors'),
+                                  ('on_connection_create_end', 'connections_created'),
+                                  ('on_connection_reuseconn', 'connections_reused'),
+                                  ('on_connection_queued_start', 'connections_queued'),
+                                  ('on_dns_cache_hit', 'dns_cache_hits'),
+                                  ('on_dns_cache_miss', 'dns_cache_misses')]:
+            getattr(self._trace_config, signal).append(self._count(statistic))
+        self._trace_configs = [self._trace_config]
+
+    @property
+    def connector(self):
+        if self._connector is None or self._connector.closed:
+            self._connector = self.runtime_profile.create_connector()
+        return self._connector
+
+    @property
+    def session(self):
+        """
+        Client session using the shared connection pool (created on demand).
+        """
+        if self._session is None or self._session.closed:
+            self._session = self.client_session()
+        return self._session
+
+    def client_session(self, *args, **kwargs):
+        """
+        Create a client session that uses the shared connection pool. Closing
+        the session does not close the pooled connections.
+        """
+        kwargs.pop('connector', None)
+        kwargs.pop('connector_owner', None)
+        kwargs['trace_configs'] = list(kwargs.get('trace_configs') or []) + self._trace_configs
+        return ClientSession(*args, connector=self.connector, connector_owner=False, **kwargs)
+
+    def add_trace_config(self, trace_config):
+        """
+        Add a trace config to the client sessions created from now on (the
+        shared session is created on the first request).
+        """
+        self._trace_configs.append(trace_config)
+
+    def pool_statistics(self):
+        """
+        Return the statistics of the requests and the state of the connection pool.
+        """
+        statistics = dict(self.statistics)
+        statistics.update(limit=self.runtime_profile.connector_limit,
+                          limit_per_host=self.runtime_profile.connector_limit_per_host,
+                          idle_connections=0, active_connections=0, hosts={})
+
+        connector = self._connector
+        if connector is None or connector.closed:
+            return statistics
+
+        # The pool state is not exposed by aiohttp's public API.
+        hosts = statistics['hosts']
+        for key, connections in getattr(connector, '_conns', {}).items():
+            hosts.setdefault(f'{key.host}:{key.port}', [0, 0])[0] += len(connections)
+        for key, connections in getattr(connector, '_acquired_per_host', {}).items():
+            hosts.setdefault(f'{key.host}:{key.port}', [0, 0])[1] += len(connections)
+
+        statistics['idle_connections'] = sum(idle for idle, _ in hosts.values())
+        statistics['active_connections'] = sum(active for _, active in hosts.values())
+        return statistics
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        if self._connector and not self._connector.closed:
+            await self._connector.close()
+
+    def _count(self, statistic):
+        async def on_signal(session, context, params):
+            self.statistics[statistic] += 1
+        return on_signal
@@ -0,0 +1,28 @@
+import re
+
+# Used for extracting the VEN ID (or VEN name, before the registration) from a raw OpenADR message.
+VEN_IDENTIFIER_PATTERN = re.compile(rb'<(?:\w+:)?(venID|venName)>\s*([^<\s]+)\s*</')
+
+def find_ven_identifier(content):
+    """
+    Return the first VEN identifier of a raw OpenADR message as tuple ('venID'
+    or 'venName', identifier), or None. The identifier is chosen by the client,
+    i.e., it is not authenticated.
+    """
+    match = VEN_IDENTIFIER_PATTERN.search(content)
+    if not match:
+        return None
+    return match.group(1).decode('ascii'), match.group(2).decode('utf-8')
+
+# Used for extracting the OpenADR response code (e.g., 200, 452) from a raw OpenADR response.
+RESPONSE_CODE_PATTERN = re.compile(rb'<(?:\w+:)?responseCode>\s*(\d+)\s*</')
+
+def find_response_code(content):
+    """
+    Return the first OpenADR response code of a raw OpenADR message as string,
+    or None.
+    """
+    match = RESPONSE_CODE_PATTERN.search(content)
+    if not match:
+        return None
+    return match.group(1).decode('ascii')
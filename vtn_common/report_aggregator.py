@@ -0,0 +1,186 @@
+from .logger import *
+
+import asyncio
+import math
+import time
+from array import array
+from contextlib import nullcontext
+from datetime import datetime
+from prometheus_client import Gauge
+
+REPORT_AGGREGATE = Gauge('vtn_report_aggregate', 'Aggregate of the values reported per VEN and resource',
+                         ['ven_id', 'resource_id', 'measurement', 'window', 'statistic'])
+FLEET_REPORT_AGGREGATE = Gauge('vtn_fleet_report_aggregate',
+                               "Aggregate of the values reported by all VENs ('total' is the sum of the "
+                               "per-resource means)", ['measurement', 'window', 'statistic'])
+
+class RingBuffer:
+    '''
+    Fixed-size ring of time buckets, each holding sum, min, max and count of
+    the values in the bucket. The buckets are stored in flat arrays, a slot
+    is reused as soon as its bucket is older than the ring.
+    '''
+
+    __slots__ = ('bucket_width', 'size', '_bucket', '_sum', '_min', '_max', '_count')
+
+    def __init__(self, bucket_width, size):
+        self.bucket_width = bucket_width
+        self.size = size
+        self._bucket = array('q', [-1]) * size
+        self._sum = array('d', [0.]) * size
+        self._min = array('d', [0.]) * size
+        self._max = array('d', [0.]) * size
+        self._count = array('q', [0]) * size
+
+    def add(self, timestamp, value):
+        bucket = int(timestamp // self.bucket_width)
+        slot = bucket % self.size
+
+        if self._bucket[slot] != bucket:
+            # Ignore values that are older than the bucket stored in the slot.
+            if self._bucket[slot] > bucket:
+                return
+            self._bucket[slot] = bucket
+            self._sum[slot] = value
+            self._min[slot] = value
+            self._max[slot] = value
+            self._count[slot] = 1
+        else:
+            self._sum[slot] += value
+            self._min[slot] = min(self._min[slot], value)
+            self._max[slot] = max(self._max[slot], value)
+            self._count[slot] += 1
+
+    def aggregate(self, now, window):
+        """
+        Return (sum, min, max, count) of the values of the buckets within the
+        given window (in seconds) before 'now', or None if there are none.
+        """
+        last = int(now // self.bucket_width)
+        first = last - min(self.size, max(1, int(window // self.bucket_width))) + 1
+
+        total, minimum, maximum, count = 0., math.inf, -math.inf, 0
+        for bucket in range(first, last + 1):
+            slot = bucket % self.size
+            if self._bucket[slot] == bucket:
+                total += self._sum[slot]
+                minimum = min(minimum, self._min[slot])
+                maximum = max(maximum, self._max[slot])
+                count += self._count[slot]
+
+        return (total, minimum, maximum, count) if count else None
+
+class ReportAggregator:
+    '''
+    Rolling aggregation of the reported values per VEN/resource and across
+    the fleet (per measurement). The aggregates are exported periodically as
+    Prometheus gauges, so that dashboards and the flex forecast do not need
+    to aggregate the individual report time series at query time.
+    '''
+
+    BUCKET_WIDTH = 15
+    WINDOWS = {'1m': 60, '5m': 300, '15m': 900}
+
+    # The per-VEN aggregates are exported for these windows only (cardinality).
+    PER_VEN_EXPORT_WINDOWS = ('5m',)
+
+    STATISTICS = ('sum', 'min', 'max', 'mean', 'count')
+
+    def __init__(self, bucket_width=None, windows=None):
+        self.bucket_width = bucket_width or self.BUCKET_WIDTH
+        self.windows = windows or self.WINDOWS
+        self._size = max(1, math.ceil(max(self.windows.values()) / self.bucket_width))
+
+        # Ring buffers per (ven_id, resource_id, measurement) and per measurement.
+        self._series = {}
+        self._fleet = {}
+
+    def add(self, ven_id, resource_id, measurement, timestamp, value):
+        """
+        Add a reported value. The time stamp (datetime or seconds since epoch)
+        is capped to the current time to protect the ring from clock skew.
+        """
+        if isinstance(timestamp, datetime):
+            timestamp = timestamp.timestamp()
+        timestamp = min(timestamp, time.time()) if timestamp else time.time()
+        value = float(value)
+
+        key = (ven_id, resource_id, measurement)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = RingBuffer(self.bucket_width, self._size)
+        series.add(timestamp, value)
+
+        fleet = self._fleet.get(measurement)
+        if fleet is None:
+            fleet = self._fleet[measurement] = RingBuffer(self.bucket_width, self._size)
+        fleet.add(timestamp, value)
+
+    def aggregate(self, ven_id, resource_id, measurement, window, now=None):
+        series = self._series.get((ven_id, resource_id, measurement))
+        return self._statistics(series, window, now)
+
+    def fleet_aggregate(self, measurement, window, now=None):
+        """
+        Aggregate across all VENs, incl. 'total' (sum of the per-resource means).
+        """
+        statistics = self._statistics(self._fleet.get(measurement), window, now)
+        if statistics is not None:
+            statistics['total'] = sum(
+                aggregate['mean'] for (_, _, series_measurement), series in self._series.items()
+                if series_measurement == measurement
+                for aggregate in [self._statistics(series, window, now)] if aggregate is not None)
+        return statistics
+
+    def remove_ven(self, ven_id):
+        for key in [key for key in self._series if key[0] == ven_id]:
+            del self._series[key]
+            for window in self.PER_VEN_EXPORT_WINDOWS:
+                for statistic in self.STATISTICS:
+                    try:
+                        REPORT_AGGREGATE.remove(*key, window, statistic)
+                    except KeyError:
+                        pass
+
+    def export(self, now=None):
+        """
+        Update the Prometheus gauges with the current aggregates.
+        """
+        now = now or time.time()
+
+        for key, series in self._series.items():
+            for window in self.PER_VEN_EXPORT_WINDOWS:
+                statistics = self._statistics(series, window, now)
+                if statistics is not None:
+                    for statistic in self.STATISTICS:
+                        REPORT_AGGREGATE.labels(*key, window, statistic).set(statistics[statistic])
+
+        for measurement in self._fleet:
+            for window in self.windows:
+                statistics = self.fleet_aggregate(measurement, window, now)
+                if statistics is not None:
+                    for statistic, value in statistics.items():
+                        FLEET_REPORT_AGGREGATE.labels(measurement, window, statistic).set(value)
+
+    async def run_export(self, lane=None):
+        """
+        Export the aggregates once per bucket (in the given priority lane, if any).
+        """
+        while True:
+            await asyncio.sleep(self.bucket_width)
+            async with (lane() if lane else nullcontext()):
+                try:
+                    self.export()
+                except Exception as e:
+                    LOGGER.error(f'Failed to export report aggregates: {e}')
+
+    def _statistics(self, series, window, now):
+        if series is None:
+            return None
+
+        aggregate = series.aggregate(now or time.time(), self.windows[window])
+        if aggregate is None:
+            return None
+
+        total, minimum, maximum, count = aggregate
+        return dict(sum=total, min=minimum, max=maximum, mean=total / count, count=count)
@@ -0,0 +1,65 @@
+import time
+from collections import OrderedDict
+from prometheus_client import Counter
+
+REPORT_DUPLICATES = Counter('vtn_report_duplicates', 'Retransmitted reports that were acknowledged without processing',
+                            ['level'])
+
+class DedupCache:
+    '''
+    Bounded cache of recently seen keys (e.g., of report messages), each key
+    is kept for a limited time. The oldest keys are dropped first.
+    '''
+
+    MAX_ENTRIES = 100000
+    TTL = 600.
+
+    def __init__(self, max_entries=None, ttl=None):
+        self.max_entries = max_entries or self.MAX_ENTRIES
+        self.ttl = ttl or self.TTL
+        self.hits = 0
+
+        # Key -> expiry time (in order of insertion, i.e., of expiry).
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        expires = self._entries.get(key)
+        return expires is not None and expires > time.monotonic()
+
+    def seen(self, key, now=None):
+        """
+        Return True if the key has been seen recently, otherwise add it.
+        """
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+
+        if key in self._entries:
+            self.hits += 1
+            return True
+
+        self._entries[key] = now + self.ttl
+        return False
+
+    def add(self, key, now=None):
+        """
+        Add a key (e.g., after the keyed data has been processed successfully).
+        """
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        self._entries.pop(key, None)
+        self._entries[key] = now + self.ttl
+
+    def _expire(self, now):
+        # Drop expired entries and make room for a new one.
+        entries = self._entries
+        while entries:
+            _, expires = next(iter(entries.items()))
+            if expires > now and len(entries) < self.max_entries:
+                break
+            entries.popitem(last=False)
+
+    def discard(self, key):
+        self._entries.pop(key, None)
@@ -0,0 +1,120 @@
+from .logger import *
+
+import asyncio
+import socket
+from aiohttp import TCPConnector
+from aiohttp.web import Application
+
+class RuntimeProfile:
+    '''
+    Runtime settings for the VTN entry points, i.e., the asyncio event loop,
+    the aiohttp server and the outbound HTTP connections.
+    '''
+
+    PROFILES = {
+        # Defaults of asyncio and aiohttp.
+        'default': dict(
+            use_uvloop=False,
+            keepalive_timeout=75.,
+            backlog=128,
+            access_log=True,
+            client_max_size=1024**2,
+            connector_limit=100,
+            connector_limit_per_host=0,
+            connector_keepalive_timeout=15.,
+            connector_dns_cache_ttl=10,
+        ),
+        # Settings for many VENs: keep connections open between two polls,
+        # accept reconnect storms, no access log, allow large reports.
+        'tuned': dict(
+            use_uvloop=True,
+            keepalive_timeout=300.,
+            backlog=4096,
+            access_log=False,
+            client_max_size=16 * 1024**2,
+            connector_limit=1000,
+            connector_limit_per_host=8,
+            connector_keepalive_timeout=60.,
+            connector_dns_cache_ttl=300,
+        ),
+    }
+
+    def __init__(self, name='default', **settings):
+        if name not in self.PROFILES:
+            raise ValueError(f'Unknown runtime profile "{name}", use one of: {", ".join(self.PROFILES)}')
+
+        self.name = name
+        self.settings = {**self.PROFILES[name], **settings}
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['settings'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def install_event_loop_policy(self):
+        """
+        Use uvloop (if requested and available). Call this before creating the event loop.
+        """
+        if not self.use_uvloop:
+            return
+
+        try:
+            import uvloop
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            LOGGER.info('USING UVLOOP EVENT LOOP')
+        except ImportError:
+            LOGGER.warning('uvloop is not available, using default asyncio event loop instead')
+
+    def create_application(self, **args):
+        """
+        Create an aiohttp application with the settings of this profile.
+        """
+        handler_args = dict(keepalive_timeout=self.keepalive_timeout)
+        if not self.access_log:
+            handler_args['access_log'] = None
+
+        return Application(client_max_size=self.client_max_size, handler_args=handler_args, **args)
+
+    def create_connector(self):
+        """
+        Create the connection pool for outbound requests (e.g., the push transport of the PUSH MODE VTN).
+        """
+        return TCPConnector(limit=self.connector_limit, limit_per_host=self.connector_limit_per_host,
+                            keepalive_timeout=self.connector_keepalive_timeout,
+                            ttl_dns_cache=self.connector_dns_cache_ttl)
+
+    def set_backlog(self, app_runner):
+        """
+        Apply the backlog to the listening sockets of an already started server.
+        """
+        for site in app_runner.sites:
+            server = getattr(site, '_server', None)
+            for sock in (server.sockets if server else []):
+                # Calling listen() on a duplicate of the listening socket updates its backlog.
+                with socket.fromfd(sock.fileno(), sock.family, sock.type) as listening_socket:
+                    listening_socket.listen(self.backlog)
+
+def patch_runtime_profile(vtn, profile):
+    """
+    This function rebuilds the VTN's aiohttp application with the settings of
+    the given runtime profile. Call it after all other patches that replace
+    the VTN's application (e.g., 'patch_update_report').
+    """
+    app = profile.create_application(middlewares=vtn.app.middlewares)
+
+    # Re-initialize the HTTP handlers for the services.
+    for route in vtn.app.router.routes():
+        app.router.add_route(route.method, route.resource.canonical, route.handler)
+
+    app['server'] = vtn
+
+    vtn.app = app
+    vtn.runtime_profile = profile
+
+    # Apply the backlog as soon as the server is running.
+    run = vtn.run
+    async def run_patched():
+        await run()
+        profile.set_backlog(vtn.app_runner)
+    vtn.run = run_patched
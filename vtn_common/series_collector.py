@@ -0,0 +1,76 @@
+from array import array
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+class SeriesHandle:
+    '''
+    Gauge-like handle of a single series of the collector.
+    '''
+
+    __slots__ = ('_collector', '_index')
+
+    def __init__(self, collector, index):
+        self._collector = collector
+        self._index = index
+
+    def set(self, value):
+        self._collector._values[self._index] = value
+
+    def get(self):
+        return self._collector._values[self._index]
+
+class SeriesCollector:
+    '''
+    Custom Prometheus collector for many single-value series (e.g., one per
+    VEN resource). The latest values are kept in a flat array indexed by the
+    series ID, so updates do not need a lock (they are done by the event
+    loop thread only) and a scrape walks all series in a single pass.
+    '''
+
+    CAPACITY = 1024
+
+    def __init__(self, registry=REGISTRY, capacity=None):
+        self._values = array('d', bytes(8 * (capacity or self.CAPACITY)))
+        self._names = []
+        self._documentation = []
+        self._index = {}
+
+        if registry is not None:
+            registry.register(self)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add_series(self, name, documentation, value=0.):
+        """
+        Add a series (or return the existing one with this name).
+        """
+        index = self._index.get(name)
+        if index is None:
+            index = self._index[name] = len(self._names)
+
+            # Grow the array by doubling its size.
+            if index >= len(self._values):
+                self._values.extend(array('d', bytes(8 * len(self._values))))
+
+            self._names.append(name)
+            self._documentation.append(documentation)
+            self._values[index] = value
+
+        return SeriesHandle(self, index)
+
+    def get_value(self, name):
+        """
+        Return the latest value of a series, or None if there is no series with this name.
+        """
+        index = self._index.get(name)
+        return None if index is None else self._values[index]
+
+    def describe(self):
+        # Avoid a collect() call on registration.
+        return []
+
+    def collect(self):
+        values = self._values
+        for index, (name, documentation) in enumerate(zip(self._names, self._documentation)):
+            yield GaugeMetricFamily(name, documentation, value=values[index])
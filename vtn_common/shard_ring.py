@@ -0,0 +1,63 @@
+from bisect import bisect, insort
+from hashlib import md5
+
+class ShardRing:
+    '''
+    Consistent hash ring for splitting VEN clients across several VTN instances.
+    Each instance (shard) is placed on the ring several times (virtual nodes),
+    so that VENs are spread evenly and only a small fraction of them changes
+    ownership when a shard joins or leaves.
+    '''
+
+    VIRTUAL_NODES = 64
+
+    def __init__(self, shards=(), virtual_nodes=None):
+        self._virtual_nodes = virtual_nodes or self.VIRTUAL_NODES
+        self._ring = []
+        self._ring_owners = {}
+        self._shards = set()
+
+        for shard_id in shards:
+            self.add(shard_id)
+
+    @property
+    def shards(self):
+        return sorted(self._shards)
+
+    def add(self, shard_id):
+        """
+        Add a shard to the ring.
+        """
+        if shard_id in self._shards:
+            return
+        self._shards.add(shard_id)
+
+        for node in range(self._virtual_nodes):
+            position = self._hash(f'{shard_id}#{node}')
+            self._ring_owners[position] = shard_id
+            insort(self._ring, position)
+
+    def remove(self, shard_id):
+        """
+        Remove a shard from the ring.
+        """
+        if shard_id not in self._shards:
+            return
+        self._shards.discard(shard_id)
+
+        self._ring = [position for position in self._ring if self._ring_owners[position] != shard_id]
+        self._ring_owners = {position: self._ring_owners[position] for position in self._ring}
+
+    def owner(self, key):
+        """
+        Return the ID of the shard owning the given key (e.g., a VEN name).
+        """
+        if not self._ring:
+            return None
+
+        index = bisect(self._ring, self._hash(key)) % len(self._ring)
+        return self._ring_owners[self._ring[index]]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(md5(key.encode('utf-8')).digest()[:8], 'big')
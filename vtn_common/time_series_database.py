@@ -1,7 +1,9 @@
 from .logger import LOGGER
 
-from prometheus_client import start_http_server as start_prometheus_client, Gauge
-from prometheus_api_client import PrometheusConnect
+from prometheus_client import start_http_server as start_prometheus_client
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .report_aggregator import ReportAggregator
+from .series_collector import SeriesCollector
 import re
 
 class TimeSeriesDatabase:
@@ -9,9 +11,18 @@ class TimeSeriesDatabase:
     PROMETHEUS_PREFIX_REPORT_TEMPLATE = '{}:REPORT'
     PROMETHEUS_PREFIX_EVENT_TEMPLATE = '{}:EVENT'
 
+    # Maximum number of metrics read with a single query (length of the query URL).
+    MAX_METRICS_PER_QUERY = 100
+
+    # Deadline of a query [s], failed queries are not retried. If Prometheus is
+    # unavailable, the circuit breaker opens and no values are found (degraded mode).
+    QUERY_TIMEOUT = 2.
+
     def __init__(self, vtn_id, db_host_url, db_client_port):
-        # Start Prometheus API client (for reading data from Prometheus time series database).
-        self._prometheus_api = PrometheusConnect(url=db_host_url, disable_ssl=True)
+        # Prometheus API client (for reading data from Prometheus time series database), created on first query.
+        self._db_host_url = db_host_url
+        self._prometheus_api_client = None
+        self._prometheus_breaker = CircuitBreaker('prometheus')
 
         # Start Prometheus client (for writing data to Prometheus time series database)
         start_prometheus_client(db_client_port)
@@ -22,6 +33,26 @@ class TimeSeriesDatabase:
         self._prometheus_gauges_reports = {}
         self._prometheus_gauges_events = {}
 
+        # The report and event time series are exported by a single custom collector.
+        self._series_collector = SeriesCollector()
+
+        # Rolling aggregates of the reported values (per VEN and fleet-wide).
+        self._report_aggregator = ReportAggregator()
+
+    @property
+    def _prometheus_api(self):
+        if self._prometheus_api_client is None:
+            # Deferred import (the API client and its dependencies are slow to import).
+            from prometheus_api_client import PrometheusConnect
+            from urllib3.util.retry import Retry
+            self._prometheus_api_client = PrometheusConnect(url=self._db_host_url, disable_ssl=True,
+                                                            retry=Retry(total=0), timeout=self.QUERY_TIMEOUT)
+        return self._prometheus_api_client
+
+    @property
+    def report_aggregator(self):
+        return self._report_aggregator
+
     @property
     def events_time_series(self):
         return self._prometheus_gauges_events
@@ -31,37 +62,42 @@ class TimeSeriesDatabase:
         return self._prometheus_gauges_reports
 
     def init_time_series(self, ven_id):
-        if ven_id not in self._prometheus_gauges_reports:
-            self._prometheus_gauges_reports[ven_id] = {}
-
         if ven_id not in self._prometheus_gauges_events:
             self._prometheus_gauges_events[ven_id] = {}
 
     def add_time_series(self, ven_id, resource_id, measurement, event_type):
-        if not resource_id in self._prometheus_gauges_reports[ven_id]:
-            self._prometheus_gauges_reports[ven_id][resource_id] = {}
-
-        if not measurement in self._prometheus_gauges_reports[ven_id][resource_id]:
+        # The report gauges are stored in a flat dict (key: VEN ID, resource ID and measurement).
+        report_key = (ven_id, resource_id, measurement)
+        report_gauge = self._prometheus_gauges_reports.get(report_key)
+        if report_gauge is None:
             report_gauge_name = '{}:{}:{}:{}'.format(self.prometheus_prefix_report, ven_id, resource_id, measurement)
             report_gauge_name = self._sanitize_prometheus_metric_name(report_gauge_name)
-            report_gauge = Gauge(report_gauge_name, measurement)
-            report_gauge.set(0)
-            self._prometheus_gauges_reports[ven_id][resource_id][measurement] = report_gauge
+            report_gauge = self._series_collector.add_series(report_gauge_name, measurement)
+            self._prometheus_gauges_reports[report_key] = report_gauge
 
         if not resource_id in self._prometheus_gauges_events[ven_id]:
             event_gauge_name = '{}:{}:{}:{}'.format(self.prometheus_prefix_event, ven_id, resource_id, event_type)
             event_gauge_name = self._sanitize_prometheus_metric_name(event_gauge_name)
-            event_gauge = Gauge(event_gauge_name, event_type)
-            event_gauge.set(0)
+            event_gauge = self._series_collector.add_series(event_gauge_name, event_type)
             self._prometheus_gauges_events[ven_id][resource_id] = event_gauge
 
-        report_gauge = self._prometheus_gauges_reports[ven_id][resource_id][measurement]
         event_gauge = self._prometheus_gauges_events[ven_id][resource_id]
         return (report_gauge, event_gauge)
 
     def get_latest_value(self, metric_name):
         metric_name = self._sanitize_prometheus_metric_name(metric_name)
-        data = self._prometheus_api.get_current_metric_value(metric_name=metric_name)
+
+        # The series written by this process are read from the local store (read-your-writes).
+        value = self._series_collector.get_value(metric_name)
+        if value is not None:
+            return value
+
+        try:
+            data = self._prometheus_breaker.call(self._prometheus_api.get_current_metric_value,
+                                                 metric_name=metric_name)
+        except Exception as e:
+            self._log_query_error(e)
+            return None
 
         if 1 == len(data) and 'value' in data[0]:
             LOGGER.info('FOUND FLEX FORECAST VALUE')
@@ -69,6 +105,45 @@ class TimeSeriesDatabase:
         else:
             return None
 
+    def get_latest_values(self, metric_names):
+        """
+        Read the latest values of many metrics with as few queries as possible
+        (only metrics not written by this process are queried from Prometheus).
+        Return a dict with the values of the metrics that were found.
+        """
+        sanitized_names = {}
+        for metric_name in metric_names:
+            sanitized_names.setdefault(self._sanitize_prometheus_metric_name(metric_name), []).append(metric_name)
+
+        found = {}
+        for name in sanitized_names:
+            value = self._series_collector.get_value(name)
+            if value is not None:
+                found[name] = value
+
+        names = [name for name in sanitized_names if name not in found]
+        for i in range(0, len(names), self.MAX_METRICS_PER_QUERY):
+            query = '{{__name__=~"{}"}}'.format('|'.join(names[i:i + self.MAX_METRICS_PER_QUERY]))
+            try:
+                result = self._prometheus_breaker.call(self._prometheus_api.custom_query, query=query)
+            except Exception as e:
+                # The metrics not found yet are missing (the remaining queries would fail as well).
+                self._log_query_error(e)
+                break
+            for data in result:
+                name = data.get('metric', {}).get('__name__')
+                if 'value' in data:
+                    # Metrics with more than one time series are ambiguous.
+                    found[name] = None if name in found else float(data['value'][1])
+
+        return {metric_name: value for name, value in found.items() if value is not None
+                for metric_name in sanitized_names.get(name, [])}
+
+    def _log_query_error(self, error):
+        # Queries rejected by the open circuit breaker are expected in degraded mode.
+        if not isinstance(error, CircuitOpenError):
+            LOGGER.warning(f'PROMETHEUS QUERY FAILED: {type(error).__name__}')
+
     def _sanitize_prometheus_metric_name(self, str_name):
         return ''.join(
             [str_name[0] if re.match('[a-zA-Z_:]', str_name[0]) else '_' + str_name[0]] +
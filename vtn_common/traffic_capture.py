@@ -0,0 +1,188 @@
+from .logger import *
+
+import itertools
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from aiohttp import TraceConfig
+from aiohttp import web
+from aiohttp.web import middleware
+
+# File header: magic bytes, format version.
+CAPTURE_MAGIC = b'VTNCAP'
+CAPTURE_VERSION = 1
+
+# Record header: wall-clock time, exchange ID (request / response pair), direction,
+# flags, HTTP status (responses), length of the path and of the (compressed) body.
+RECORD_HEADER = struct.Struct('<dIBBHHI')
+
+# Directions of the captured messages.
+INBOUND_REQUEST = 0
+OUTBOUND_RESPONSE = 1
+OUTBOUND_REQUEST = 2
+INBOUND_RESPONSE = 3
+
+FLAG_COMPRESSED = 1
+
+@dataclass(slots=True)
+class CapturedMessage:
+    '''
+    OpenADR message (HTTP body) read from a capture file.
+    '''
+
+    time: float
+    exchange_id: int
+    direction: int
+    status: int
+    path: str
+    body: bytes
+
+class TrafficCapture:
+    '''
+    Append-only capture file of the OpenADR messages of a VTN server: the
+    requests of the VENs and the responses of the VTN and, for the PUSH MODE
+    VTN, the requests sent via its push transport, i.e., the events pushed to
+    the VENs and the requests forwarded to other shards (incl. the response
+    status).
+    '''
+
+    # Bodies are compressed (zlib) with this level, 0 for no compression.
+    COMPRESSION_LEVEL = 1
+
+    # Size of the write buffer [bytes] (the file is flushed when the server stops).
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path, compression_level=None):
+        self.path = path
+        self.compression_level = self.COMPRESSION_LEVEL if compression_level is None else compression_level
+        self.messages = 0
+        self._exchange_ids = itertools.count(1)
+
+        self._file = open(path, 'ab', buffering=self.BUFFER_SIZE)
+        if 0 == self._file.tell():
+            self._file.write(CAPTURE_MAGIC + bytes((CAPTURE_VERSION,)))
+
+    def next_exchange_id(self):
+        return next(self._exchange_ids) & 0xffffffff
+
+    def record(self, direction, exchange_id, path, body, status=0, now=None):
+        path = path.encode('utf-8')
+        flags = 0
+        if self.compression_level and body:
+            body = zlib.compress(body, self.compression_level)
+            flags |= FLAG_COMPRESSED
+
+        self._file.write(RECORD_HEADER.pack(time.time() if now is None else now, exchange_id, direction, flags,
+                                            status, len(path), len(body)))
+        self._file.write(path)
+        self._file.write(body)
+        self.messages += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+            LOGGER.info(f'CAPTURED {self.messages} MESSAGES TO {self.path}')
+
+    def trace_config(self):
+        """
+        Trace config for client sessions, capturing the requests sent by the VTN.
+        """
+        trace_config = TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.capture_exchange_id = self.next_exchange_id()
+            context.capture_chunks = []
+
+        async def on_request_chunk_sent(session, context, params):
+            context.capture_chunks.append(params.chunk)
+
+        async def on_request_end(session, context, params):
+            # The response body is not captured (it may not be read by the caller).
+            self.record(OUTBOUND_REQUEST, context.capture_exchange_id, str(params.url),
+                        b''.join(context.capture_chunks))
+            self.record(INBOUND_RESPONSE, context.capture_exchange_id, str(params.url), b'',
+                        status=params.response.status)
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_chunk_sent.append(on_request_chunk_sent)
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+def read_capture(path):
+    """
+    Read the messages of a capture file (a truncated last record is skipped).
+    """
+    with open(path, 'rb') as file:
+        header = file.read(len(CAPTURE_MAGIC) + 1)
+        if not header.startswith(CAPTURE_MAGIC):
+            raise ValueError(f'Not a VTN capture file: {path}')
+        if header[-1] > CAPTURE_VERSION:
+            raise ValueError(f'Unsupported capture file version: {header[-1]}')
+
+        while True:
+            record_header = file.read(RECORD_HEADER.size)
+            if len(record_header) < RECORD_HEADER.size:
+                return
+            timestamp, exchange_id, direction, flags, status, path_length, body_length = \
+                RECORD_HEADER.unpack(record_header)
+            path = file.read(path_length)
+            body = file.read(body_length)
+            if len(body) < body_length:
+                return
+            if flags & FLAG_COMPRESSED:
+                body = zlib.decompress(body)
+            yield CapturedMessage(timestamp, exchange_id, direction, status, path.decode('utf-8'), body)
+
+def _response_body(response):
+    body = getattr(response, 'body', None)
+    return body if isinstance(body, bytes) else b''
+
+def patch_traffic_capture(vtn, path, compression_level=None):
+    """
+    This function records the OpenADR messages received and sent by the VTN
+    to a capture file (see 'benchmark/traffic_replay.py' for replaying it).
+    Call it after patches that replace the VTN's application (e.g.,
+    'patch_update_report'), but before 'patch_runtime_profile'.
+    """
+    vtn.traffic_capture = capture = TrafficCapture(path, compression_level)
+    service_names = {s.__service_name__ for s in vtn.services.values()}
+
+    @middleware
+    async def traffic_capture_middleware(request, handler):
+        service_name = request.path.rsplit('/', 1)[-1]
+        if service_name not in service_names:
+            return await handler(request)
+
+        exchange_id = capture.next_exchange_id()
+        capture.record(INBOUND_REQUEST, exchange_id, request.path, await request.read())
+        try:
+            response = await handler(request)
+        except web.HTTPException as error:
+            capture.record(OUTBOUND_RESPONSE, exchange_id, request.path, _response_body(error), status=error.status)
+            raise
+        except Exception:
+            # Answered with HTTP status 500 by aiohttp.
+            capture.record(OUTBOUND_RESPONSE, exchange_id, request.path, b'', status=500)
+            raise
+        capture.record(OUTBOUND_RESPONSE, exchange_id, request.path, _response_body(response),
+                       status=response.status)
+        return response
+
+    # The capture middleware is the outermost one (rejected requests are captured as well).
+    vtn.app.middlewares.insert(0, traffic_capture_middleware)
+
+    # Capture the requests sent via the push transport (PUSH MODE VTN: events pushed to the VENs, requests
+    # forwarded to other shards). The transport's session must not be created yet, i.e., the server not be running.
+    push_transport = getattr(vtn, 'push_transport', None)
+    if push_transport is not None:
+        push_transport.add_trace_config(capture.trace_config())
+
+    # Flush the capture file when the server stops.
+    stop = vtn.stop
+    async def stop_patched():
+        try:
+            await stop()
+        finally:
+            capture.close()
+    vtn.stop = stop_patched
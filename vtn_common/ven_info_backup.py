@@ -1,28 +1,52 @@
 from .logger import LOGGER
 
+import asyncio
 import redis
-import json
+from contextlib import nullcontext
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .ven_info_codec import decode_ven_info, encode_ven_info
+from .ven_records import VENRecord
 
 class VENInfoBackup:
     '''
-    Backup for VEN client information.
+    Backup for VEN client information (VEN ID -> VENRecord), stored as
+    snapshot encoded with the VEN info codec (see ven_info_codec).
     '''
 
     REDIS_VEN_INFO_KEY = 'ven_info'
 
+    # Codec of the snapshots written ('json' or 'msgpack'), snapshots of all codecs are read.
+    CODEC = 'json'
+
+    # Deadline of a Redis command [s], failed commands are not retried. If Redis is unavailable, the circuit breaker
+    # opens and the VEN info is kept in memory until Redis is available again.
+    REDIS_TIMEOUT = 0.5
+
+    # Period [s] of retrying to write VEN info that could not be written.
+    FLUSH_PERIOD = 5.
+
     def __init__(self, host, port):
         # Start redis API.
-        self._redis_api = redis.Redis(host=host, port=port)
+        self._redis_api = redis.Redis(host=host, port=port, socket_timeout=self.REDIS_TIMEOUT,
+                                      socket_connect_timeout=self.REDIS_TIMEOUT, retry=Retry(NoBackoff(), 0))
+        self._redis_breaker = CircuitBreaker('redis')
+
+        # True if the latest VEN info has not been written to Redis.
+        self.pending = False
 
         # Init redis backup.
         redis_ven_info = self._redis_api.get(self.REDIS_VEN_INFO_KEY)
         if redis_ven_info:
-            self._ven_info = json.loads(redis_ven_info)
+            self._ven_info = {ven_id: VENRecord.from_dict(data)
+                              for ven_id, data in decode_ven_info(redis_ven_info).items()}
             LOGGER.info('LOAD VEN INFO FROM REDIS')
             LOGGER.info(f'VEN INFO:\n{self._ven_info}')
         else:
             self._ven_info = {}
-            self._redis_api.set(self.REDIS_VEN_INFO_KEY, json.dumps(self._ven_info))
+            self._redis_api.set(self.REDIS_VEN_INFO_KEY, encode_ven_info(self._ven_info, self.CODEC))
             LOGGER.info('INIT VEN INFO IN REDIS')
 
     def get(self):
@@ -30,4 +54,32 @@ class VENInfoBackup:
 
     def update(self, ven_info):
         self._ven_info = ven_info
-        self._redis_api.set(self.REDIS_VEN_INFO_KEY, json.dumps(ven_info))
+        try:
+            self._redis_breaker.call(lambda: self._redis_api.set(self.REDIS_VEN_INFO_KEY,
+                                                                 encode_ven_info(ven_info, self.CODEC)))
+            self.pending = False
+        except Exception as e:
+            # The complete VEN info is written with the next successful update.
+            self.pending = True
+            if not isinstance(e, CircuitOpenError):
+                LOGGER.error(f'Failed to write VEN info to Redis: {e!r}')
+
+    def flush(self):
+        """
+        Write the VEN info if the latest update failed, return True if it is written.
+        """
+        if self.pending:
+            self.update(self._ven_info)
+        return not self.pending
+
+    async def run_flush(self, lane=None):
+        """
+        Retry writing the VEN info periodically (in the given priority lane, if any).
+        """
+        while True:
+            await asyncio.sleep(self.FLUSH_PERIOD)
+            if not self.pending:
+                continue
+            async with (lane() if lane else nullcontext()):
+                if self.flush():
+                    LOGGER.info('WROTE PENDING VEN INFO TO REDIS')
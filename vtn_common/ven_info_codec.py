@@ -0,0 +1,98 @@
+# Codec for the VEN info snapshots in Redis (shared by the VTN servers and the flex forecast service).
+# No dependencies on the rest of vtn_common / openleadr (the flex forecast service imports this module only).
+import json
+
+# Header of the envelope: magic bytes, envelope version, codec ID. Snapshots
+# without header are JSON (format written before the envelope was introduced).
+ENVELOPE_MAGIC = b'VENI'
+ENVELOPE_VERSION = 1
+HEADER_SIZE = len(ENVELOPE_MAGIC) + 2
+
+def _to_dict(obj):
+    # Records (e.g., VENRecord) are serialized with their dict representation.
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f'Type is not serializable: {type(obj)}')
+
+class JSONCodec:
+    '''
+    JSON, encoded and decoded with orjson if available (the standard library otherwise).
+    '''
+
+    ID = 1
+    NAME = 'json'
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        self._orjson = orjson
+
+    def dumps(self, obj):
+        if self._orjson:
+            # Dataclasses (incl. slots) are serialized natively by orjson.
+            return self._orjson.dumps(obj, default=_to_dict)
+        return json.dumps(obj, default=_to_dict, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        return self._orjson.loads(data) if self._orjson else json.loads(data)
+
+class MsgpackCodec:
+    '''
+    MessagePack (requires msgpack).
+    '''
+
+    ID = 2
+    NAME = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def dumps(self, obj):
+        return self._msgpack.packb(obj, default=_to_dict)
+
+    def loads(self, data):
+        return self._msgpack.unpackb(data)
+
+CODEC_CLASSES = {codec_class.NAME: codec_class for codec_class in (JSONCodec, MsgpackCodec)}
+CODEC_NAMES = {codec_class.ID: codec_class.NAME for codec_class in CODEC_CLASSES.values()}
+DEFAULT_CODEC = 'json'
+
+_codecs = {}
+
+def get_codec(name=None):
+    """
+    Return the codec with the given name (created on first use).
+    """
+    name = name or DEFAULT_CODEC
+    codec = _codecs.get(name)
+    if codec is None:
+        if name not in CODEC_CLASSES:
+            raise ValueError(f'Unknown VEN info codec: {name}')
+        codec = _codecs[name] = CODEC_CLASSES[name]()
+    return codec
+
+def encode_ven_info(ven_info, codec=None):
+    """
+    Encode the VEN info (VEN ID -> VENRecord or dict) as snapshot incl. envelope.
+    """
+    codec = get_codec(codec)
+    return ENVELOPE_MAGIC + bytes((ENVELOPE_VERSION, codec.ID)) + codec.dumps(ven_info)
+
+def decode_ven_info(data):
+    """
+    Decode a snapshot (with envelope or plain JSON) to a dict (VEN ID -> dict).
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if not data.startswith(ENVELOPE_MAGIC):
+        return get_codec(JSONCodec.NAME).loads(data)
+
+    version, codec_id = data[len(ENVELOPE_MAGIC)], data[len(ENVELOPE_MAGIC) + 1]
+    if version > ENVELOPE_VERSION:
+        raise ValueError(f'Unsupported VEN info envelope version: {version}')
+    if codec_id not in CODEC_NAMES:
+        raise ValueError(f'Unknown VEN info codec ID: {codec_id}')
+    return get_codec(CODEC_NAMES[codec_id]).loads(data[HEADER_SIZE:])
@@ -0,0 +1,64 @@
+from dataclasses import dataclass, field
+
+@dataclass(slots=True)
+class ReportBinding:
+    '''
+    Resource and measurement a report (report request ID / r_id) is bound to.
+    '''
+
+    resource_id: str
+    measurement: str
+
+    def to_dict(self):
+        return dict(resource_id=self.resource_id, measurement=self.measurement)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(resource_id=data['resource_id'], measurement=data['measurement'])
+
+@dataclass(slots=True)
+class VENRecord:
+    '''
+    Information about a registered VEN client (incl. its resources and report bindings).
+    '''
+
+    ven_id: str
+    ven_name: str
+    registration_id: str
+    resource_ids: list = field(default_factory=list)
+
+    # For each report request ID: r_id -> ReportBinding
+    report_callbacks: dict = field(default_factory=dict)
+
+    def to_dict(self):
+        return dict(ven_id=self.ven_id, ven_name=self.ven_name, registration_id=self.registration_id,
+                    resource_ids=self.resource_ids,
+                    report_callbacks={report_request_id: {r_id: binding.to_dict() for r_id, binding in bindings.items()}
+                                      for report_request_id, bindings in self.report_callbacks.items()})
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(ven_id=data['ven_id'], ven_name=data['ven_name'], registration_id=data['registration_id'],
+                   resource_ids=list(data.get('resource_ids', [])),
+                   report_callbacks={report_request_id: {r_id: ReportBinding.from_dict(binding)
+                                                         for r_id, binding in bindings.items()}
+                                     for report_request_id, bindings in data.get('report_callbacks', {}).items()})
+
+class ReportCallback:
+    '''
+    Report callback bound to a VEN resource and measurement (a more compact
+    replacement for functools.partial with keyword arguments).
+    '''
+
+    __slots__ = ('handler', 'ven_id', 'resource_id', 'measurement', 'time_series')
+
+    def __init__(self, handler, ven_id, resource_id, measurement, time_series):
+        self.handler = handler
+        self.ven_id = ven_id
+        self.resource_id = resource_id
+        self.measurement = measurement
+        self.time_series = time_series
+
+    def __call__(self, data):
+        return self.handler(data, ven_id=self.ven_id, resource_id=self.resource_id,
+                            measurement=self.measurement, time_series=self.time_series)
@@ -1,13 +1,18 @@
-import asyncio
 import aiomonitor
+import asyncio
 import logging
+import time
 from openleadr.utils import generate_id
 
+from .circuit_breaker import CIRCUIT_BREAKERS
+from .instrumentation import EVENT_LOOP_LAG_SAMPLES, VEN_STATISTICS, start_event_loop_lag_probe
+from .loop_profiler import SlowCallbackTracker, TimedProfiler
 from .logger import *
 
 class VTNMonitor(aiomonitor.Monitor):
 
-    HEART_BEAT_PERIOD = 5
+    # Maximum time [s] a command waits for the event loop (e.g., for starting the profiler).
+    LOOP_CALL_TIMEOUT = 5.
 
     def __init__(self, server, **args):
         super().__init__(**args, console_enabled=False)
@@ -21,9 +26,16 @@ class VTNMonitor(aiomonitor.Monitor):
         aiomonitor_logger.setLevel(level=logging.DEBUG)
         aiomonitor_logger.addHandler(handler)
 
-        # This keeps the event loop running, even if the server is
-        # idle (no incoming reports or pending events).
-        self._loop.create_task(self._heart_beat())
+        # This measures the event loop lag continuously. It also keeps the
+        # event loop running, even if the server is idle (no incoming reports
+        # or pending events).
+        start_event_loop_lag_probe(self._loop)
+
+        # Always keep track of the slowest callbacks.
+        self.slow_callbacks = SlowCallbackTracker()
+        self.slow_callbacks.start()
+
+        self.profiler = TimedProfiler()
 
     @aiomonitor.utils.alt_names('ape')
     def do_add_periodic_event(self, ven_id, period, value=None):
@@ -44,6 +56,44 @@ class VTNMonitor(aiomonitor.Monitor):
         self._loop.create_task(self.server.add_new_event(ven_id=ven_id, value=value, 
                                                          period=None, event_task_id=None))
 
+    @aiomonitor.utils.alt_names('afe')
+    def do_add_fleet_event(self, value=None):
+        """Define single events for all VEN clients at once."""
+        if value:
+            value = float(value)
+        self._loop.create_task(self.server.add_fleet_event(value=value))
+
+    @aiomonitor.utils.alt_names('sj')
+    def do_shard_join(self, shard_id, url):
+        """Add a shard (VTN instance) and hand over its VEN clients."""
+        self._loop.create_task(self.server.shard_join(shard_id=shard_id, url=url))
+
+    @aiomonitor.utils.alt_names('sl')
+    def do_shard_leave(self, shard_id):
+        """Remove a shard (VTN instance) and take over its VEN clients."""
+        self._loop.create_task(self.server.shard_leave(shard_id=shard_id))
+
+    @aiomonitor.utils.alt_names('ss')
+    def do_shard_status(self):
+        """List all shards (VTN instances) and the VEN clients owned by this shard."""
+        for shard_id, url in self.server.shard_members.items():
+            self._sout.write(f'{shard_id}: {url or "(this shard)"}\n')
+        self._sout.write(f'owned VENs: {", ".join(sorted(self.server.preregistered_vens))}\n')
+
+    @aiomonitor.utils.alt_names('pool')
+    def do_push_pool(self, n=10):
+        """Show the statistics of the outbound connection pool (push mode only)."""
+        if not hasattr(self.server, 'push_transport'):
+            self._sout.write('no outbound connection pool (push mode only)\n')
+            return
+        statistics = self.server.push_transport.pool_statistics()
+        hosts = statistics.pop('hosts')
+        for name, value in statistics.items():
+            self._sout.write(f'{name}: {value}\n')
+        self._sout.write(f'{"host":<40} {"idle":>6} {"active":>6}\n')
+        for host, (idle, active) in sorted(hosts.items(), key=lambda item: sum(item[1]), reverse=True)[:int(n)]:
+            self._sout.write(f'{host:<40} {idle:>6} {active:>6}\n')
+
     @aiomonitor.utils.alt_names('lld')
     def do_logger_level_debug(self):
         """Set logger level to DEBUG."""
@@ -54,7 +104,103 @@ class VTNMonitor(aiomonitor.Monitor):
         """Set logger level to INFO."""
         LOGGER.setLevel(level=logging.INFO)
 
-    async def _heart_beat(self):
-        while True:
-            await asyncio.sleep(VTNMonitor.HEART_BEAT_PERIOD)
+    @aiomonitor.utils.alt_names('lag')
+    def do_event_loop_lag(self):
+        """Show the event loop lag (latest, mean and maximum of the last 5 minutes)."""
+        if not EVENT_LOOP_LAG_SAMPLES:
+            self._sout.write('no event loop lag samples yet\n')
+            return
+        samples = sorted(EVENT_LOOP_LAG_SAMPLES)
+        self._sout.write(f'latest: {1e3 * EVENT_LOOP_LAG_SAMPLES[-1]:.2f} ms, '
+                         f'mean: {1e3 * sum(samples) / len(samples):.2f} ms, '
+                         f'p99: {1e3 * samples[int(0.99 * (len(samples) - 1))]:.2f} ms, '
+                         f'max: {1e3 * samples[-1]:.2f} ms ({len(samples)} samples)\n')
+
+    @aiomonitor.utils.alt_names('slow')
+    def do_slow_callbacks(self, n=10):
+        """List the slowest event loop callbacks."""
+        self._sout.write(f'{self.slow_callbacks.count} callbacks slower than '
+                         f'{1e3 * self.slow_callbacks.threshold:.0f} ms\n')
+        for duration, timestamp, description in self.slow_callbacks.slowest()[:int(n)]:
+            self._sout.write(f'{1e3 * duration:10.2f} ms  {time.strftime("%H:%M:%S", time.localtime(timestamp))}  '
+                             f'{description}\n')
+
+    @aiomonitor.utils.alt_names('slowr')
+    def do_slow_callbacks_reset(self):
+        """Reset the list of slowest event loop callbacks."""
+        self.slow_callbacks.reset()
+
+    def _call_in_loop(self, function, *args):
+        """
+        Call a function in the event loop's thread (the commands run in the
+        monitor's thread) and return its result.
+        """
+        async def call():
+            return function(*args)
+        return asyncio.run_coroutine_threadsafe(call(), self._loop).result(self.LOOP_CALL_TIMEOUT)
+
+    @aiomonitor.utils.alt_names('prof')
+    def do_profile(self, seconds, n=None):
+        """Run the profiler for some seconds (the report is shown with 'profr')."""
+        if n:
+            self.profiler.TOP_FUNCTIONS = int(n)
+        # The profiler must run in the event loop's thread (cProfile profiles the calling thread only).
+        if not self._call_in_loop(self.profiler.start, self._loop, float(seconds)):
+            self._sout.write('profiler is already running\n')
+            return
+        self._sout.write(f'profiling for {seconds} seconds\n')
+
+    @aiomonitor.utils.alt_names('profs')
+    def do_profile_stop(self):
+        """Stop the profiler before the time is up."""
+        self._call_in_loop(self.profiler.stop)
+
+    @aiomonitor.utils.alt_names('profr')
+    def do_profile_report(self):
+        """Show the report of the last profiler run."""
+        if self.profiler.running:
+            self._sout.write('profiler is still running\n')
+        self._sout.write(f'{self.profiler.report or "no profiler report available"}\n')
+
+    @aiomonitor.utils.alt_names('vens')
+    def do_ven_statistics(self, n=10):
+        """List VEN clients with the highest handler time (messages, bytes, handler time)."""
+        self._sout.write(f'{"VEN ID":<40} {"messages":>10} {"bytes in":>12} {"bytes out":>12} {"handler [s]":>12}\n')
+        vens = sorted(VEN_STATISTICS.items(), key=lambda item: item[1][3], reverse=True)
+        for ven_id, (messages, bytes_received, bytes_sent, handler_time) in vens[:int(n)]:
+            self._sout.write(f'{ven_id:<40} {messages:>10} {bytes_received:>12} {bytes_sent:>12} '
+                             f'{handler_time:>12.3f}\n')
+
+    @aiomonitor.utils.alt_names('adm')
+    def do_admission_control(self, n=10):
+        """List VEN clients with the most requests rejected by the admission control."""
+        admission_control = getattr(self.server, 'admission_control', None)
+        if admission_control is None:
+            self._sout.write('admission control is not enabled\n')
+            return
+        self._sout.write(f'rate: {admission_control.rate}/s, burst: {admission_control.burst}, '
+                         f'max. concurrent requests: {admission_control.max_concurrent_requests}, '
+                         f'per peer address: {admission_control.peer_rate}/s, burst: {admission_control.peer_burst}\n')
+        self._sout.write(f'{"VEN ID":<40} {"peer address":<40} {"rejected":>10}\n')
+        vens = sorted(admission_control.rejections.items(), key=lambda item: item[1], reverse=True)
+        for (peer, ven_id), rejected in vens[:int(n)]:
+            self._sout.write(f'{ven_id:<40} {peer or "":<40} {rejected:>10}\n')
+
+    @aiomonitor.utils.alt_names('cb')
+    def do_circuit_breakers(self):
+        """List the circuit breakers of the external dependencies (Prometheus, Redis)."""
+        self._sout.write(f'{"dependency":<12} {"state":>10} {"calls":>10} {"failures":>10} {"rejected":>10}  '
+                         f'last error\n')
+        for name, breaker in CIRCUIT_BREAKERS.items():
+            status = breaker.status()
+            self._sout.write(f'{name:<12} {status["state"]:>10} {status["calls"]:>10} {status["failures"]:>10} '
+                             f'{status["rejected"]:>10}  {status["last_error"] or ""}\n')
 
+    @aiomonitor.utils.alt_names('lanes')
+    def do_priority_lanes(self):
+        """List the priority lanes (running and waiting work)."""
+        self._sout.write(f'{"lane":<12} {"priority":>10} {"running":>10} {"waiting":>10} {"max. conc.":>10} '
+                         f'{"max. wait.":>10} {"deferred":>10}\n')
+        for name, status in self.server.priority_lanes.status().items():
+            self._sout.write(f'{name:<12} {status["priority"]:>10} {status["running"]:>10} {status["waiting"]:>10} '
+                             f'{status["max_concurrency"]:>10} {status["max_waiting"]:>10} {status["deferred"]:>10}\n')
@@ -1,13 +1,19 @@
 # VTN server implementation
 import asyncio
-from functools import partial
+import time
 from datetime import datetime, timezone, timedelta
+from functools import partial
 from openleadr import OpenADRServer
 from openleadr.objects import Target
 from openleadr.utils import find_by
-import random
 
+from .dispatch_planner import DispatchPlanner
+from .event_store import EventStore
+from .poll_schedule import PollSchedule
+from .priority_lanes import PriorityLanes
 from .ven_info_backup import VENInfoBackup
+from .ven_records import ReportBinding, ReportCallback, VENRecord
+from .instrumentation import EVENT_DISPATCH_LATENCY, track
 from .time_series_database import TimeSeriesDatabase
 from .logger import *
 
@@ -23,6 +29,15 @@ class VTNPollServer(OpenADRServer):
 
     MIN_REPORT_SAMPLING_TIME = timedelta(seconds=15)
 
+    # Range of random event values (used if there is no flex forecast).
+    EVENT_VALUE_RANGE = (0., 2.)
+
+    # Poll frequency per VEN: up to 40% above the requested one, polls of
+    # different VENs spread over the poll period, optionally limited rate.
+    POLL_FREQ_JITTER = PollSchedule.JITTER
+    POLL_PHASE_SPREADING = True
+    MAX_POLL_RATE = None
+
     def __init__(self, vtn_id, ven_lookup=None, **args):
         super().__init__(vtn_id=vtn_id, ven_lookup=(ven_lookup or self.ven_lookup), **args)
 
@@ -30,9 +45,20 @@ class VTNPollServer(OpenADRServer):
 
         self.on_created_report_base = self.services['report_service'].on_created_report
 
+        # Assign each VEN its own poll frequency and phase at registration.
+        registration_service = self.services['registration_service']
+        self.poll_schedule = PollSchedule(registration_service.poll_freq, jitter=self.POLL_FREQ_JITTER,
+                                          phase_spreading=self.POLL_PHASE_SPREADING,
+                                          max_poll_rate=self.MAX_POLL_RATE)
+        registration_service.handlers['oadrCreatePartyRegistration'] = self._with_poll_schedule(
+            registration_service.handlers['oadrCreatePartyRegistration'])
+
         self._time_series_db = TimeSeriesDatabase(vtn_id=vtn_id, db_host_url=self.TIME_SERIES_DB_HOST_URL, 
                                                   db_client_port=self.TIME_SERIES_DB_CLIENT_PORT)
 
+        self.dispatch_planner = DispatchPlanner(vtn_id=vtn_id, time_series_db=self._time_series_db,
+                                                event_type=self.EVENT_TYPE, fallback_range=self.EVENT_VALUE_RANGE)
+
         self._ven_info_backup = VENInfoBackup(host=self.VEN_INFO_BACKUP_HOST, 
                                               port=self.VEN_INFO_BACKUP_PORT)
 
@@ -40,9 +66,16 @@ class VTNPollServer(OpenADRServer):
 
         self.registered_vens = {}
         self.periodic_event_tasks = {}
+        self._report_aggregation_task = None
+
+        # Completed and cancelled events are removed from the event service.
+        self.event_store = EventStore(self.services['event_service'])
+        self._event_expiry_task = None
+        self._ven_info_flush_task = None
 
-        # Init random number generator.
-        random.seed(0)
+        # Priority lanes of event creation (high) and report post-processing (low), see
+        # 'patch_priority_lanes' for the requests.
+        self.priority_lanes = PriorityLanes()
 
     async def run(self):
         """
@@ -59,14 +92,38 @@ class VTNPollServer(OpenADRServer):
 
         await super().run()
 
+        # Create task for exporting the report aggregates (low priority lane)
+        self._report_aggregation_task = asyncio.create_task(
+            self._time_series_db.report_aggregator.run_export(lane=partial(self.priority_lanes.lane, 'low')))
+
+        # Create task for expiring events
+        self._event_expiry_task = asyncio.create_task(self.event_store.run_expiry())
+
+        # Create task for writing VEN info that could not be written (Redis unavailable)
+        self._ven_info_flush_task = asyncio.create_task(
+            self._ven_info_backup.run_flush(lane=partial(self.priority_lanes.lane, 'low')))
+
     async def stop(self):
         """
         Stop the VTN server.
         """
         for task in self.periodic_event_tasks.values():
             task.cancel()
+        if self._report_aggregation_task:
+            self._report_aggregation_task.cancel()
+        if self._event_expiry_task:
+            self._event_expiry_task.cancel()
+        if self._ven_info_flush_task:
+            self._ven_info_flush_task.cancel()
         await super().stop()
 
+    def cancel_event(self, ven_id, event_id):
+        """
+        Cancel an event (it is removed after the VEN has been informed).
+        """
+        super().cancel_event(ven_id, event_id)
+        self.event_store.cancel(event_id)
+
     async def add_new_event(self, ven_id, event_task_id, period, value=None, delay=1):
         """
         Add events to a VEN with a given delay and period.
@@ -81,43 +138,12 @@ class VTNPollServer(OpenADRServer):
 
         try:
             while True:
-                event_targets = self._time_series_db.events_time_series[ven_id]
-
-                for resoure_id, time_series in event_targets.items():
-
-                    if not value:
-                        time_series_name = '{}:FLEX:{}:{}'.format(self.vtn_id, ven_id, resoure_id)
-                        event_value = self._time_series_db.get_latest_value(time_series_name)
-
-                        if not event_value:
-                            LOGGER.info('NO FLEX FORECAST FOUND, USE RANDOM VALUE INSTEAD')
-                            event_value = round(random.uniform(0., 2.), 2)
-                    else:
-                        event_value = value
-                        LOGGER.info('USER-DEFINED FLEX FORECAST VALUE')
-
-                    id = super().add_event(
-                        ven_id=ven_id,
-                        target=Target(ven_id=ven_id, resource_id=resoure_id),
-                        signal_name=self.EVENT_TYPE,
-                        signal_type='setpoint',
-                        intervals=[{'dtstart': datetime.now(tz=timezone.utc) + timedelta(minutes=5),
-                                    'duration': timedelta(minutes=10),
-                                    'signal_payload': event_value}],
-                        market_context='oadr://my_market',
-                        callback=self.on_event_response
-                    )
-
-                    if id != None:
-                        LOGGER.info(f'Successfully added event with ID={id}')
-                        time_series.set(event_value)
-                    elif event_task_id:
-                        LOGGER.error(
-                            'Failed to add event, cancelling periodic event task ...')
-                        event_task = self.periodic_event_tasks.pop(event_task_id)
-                        event_task.cancel()
-                    else:
-                        LOGGER.error('Failed to add event ...')
+                async with self.priority_lanes.lane('high'):
+                    with track('add_new_event'):
+                        event_targets = self._time_series_db.events_time_series[ven_id]
+                        plan = self.dispatch_planner.plan([(ven_id, resource_id) for resource_id in event_targets],
+                                                          value)
+                        self._add_planned_events(plan, event_task_id)
 
                 if period:
                     await asyncio.sleep(period)
@@ -127,6 +153,67 @@ class VTNPollServer(OpenADRServer):
         except Exception as e:
             LOGGER.error('Error: {}'.format(e))
 
+    async def add_fleet_event(self, ven_ids=None, value=None):
+        """
+        Add events to all resources of several VENs (default: all registered VENs) at once.
+        """
+        async with self.priority_lanes.lane('high'):
+            with track('add_fleet_event'):
+                events_time_series = self._time_series_db.events_time_series
+                ven_ids = [ven_id for ven_id in (ven_ids or self.registered_vens.values())
+                           if ven_id in events_time_series]
+
+                plan = self.dispatch_planner.plan([(ven_id, resource_id) for ven_id in ven_ids
+                                                   for resource_id in events_time_series[ven_id]], value)
+                self._add_planned_events(plan)
+                LOGGER.info(f'ADDED FLEET EVENT FOR {len(ven_ids)} VENS ({len(plan)} RESOURCES)')
+
+    def _add_planned_events(self, plan, event_task_id=None):
+        """
+        Add the events of a dispatch plan.
+        """
+        dtstart = datetime.now(tz=timezone.utc) + timedelta(minutes=5)
+        created = time.perf_counter()
+
+        for ven_id, resource_id, event_value, _ in plan:
+            id = super().add_event(
+                ven_id=ven_id,
+                target=Target(ven_id=ven_id, resource_id=resource_id),
+                signal_name=self.EVENT_TYPE,
+                signal_type='setpoint',
+                intervals=[{'dtstart': dtstart,
+                            'duration': timedelta(minutes=10),
+                            'signal_payload': event_value}],
+                market_context='oadr://my_market',
+                callback=self.on_event_response,
+                delivery_callback=self._event_delivery_callback(created)
+            )
+
+            if id != None:
+                LOGGER.info(f'Successfully added event with ID={id}')
+                self.event_store.add(ven_id, id)
+                self._time_series_db.events_time_series[ven_id][resource_id].set(event_value)
+            elif event_task_id in self.periodic_event_tasks:
+                LOGGER.error(
+                    'Failed to add event, cancelling periodic event task ...')
+                event_task = self.periodic_event_tasks.pop(event_task_id)
+                event_task.cancel()
+            else:
+                LOGGER.error('Failed to add event ...')
+
+    def _event_delivery_callback(self, created):
+        """
+        Return a callback measuring the dispatch latency of an event (the event
+        is delivered with every distribution to the VEN, the first one counts).
+        """
+        delivered = False
+        def on_event_delivered():
+            nonlocal delivered
+            if not delivered:
+                delivered = True
+                EVENT_DISPATCH_LATENCY.observe(time.perf_counter() - created)
+        return on_event_delivered
+
     async def on_create_party_registration(self, registration_info):
         """
         Inspect the registration info and return a ven_id and registration_id.
@@ -136,12 +223,12 @@ class VTNPollServer(OpenADRServer):
 
         self._time_series_db.init_time_series(ven_id)
 
-        report_callbacks_info = self.ven_info[ven_id]['report_callbacks']
+        report_callbacks_info = self.ven_info[ven_id].report_callbacks
         for report_request_id, report_info in report_callbacks_info.items():
  
-            for r_id, callback_info in report_info.items():
-                resource_id = callback_info['resource_id']
-                measurement = callback_info['measurement']
+            for r_id, binding in report_info.items():
+                resource_id = binding.resource_id
+                measurement = binding.measurement
 
                 self._create_report_callback(ven_id=ven_id, report_request_id=report_request_id, r_id=r_id,
                                              resource_id=resource_id, measurement=measurement)
@@ -151,6 +238,25 @@ class VTNPollServer(OpenADRServer):
 
         return ven_id, registration_id
 
+    def _with_poll_schedule(self, create_party_registration):
+        """
+        Wrap the registration handler, so that the response contains the VEN's
+        own poll frequency and is delayed by the VEN's registration delay
+        (short, the request is held open meanwhile).
+        """
+        async def create_party_registration_scheduled(payload):
+            response_type, response_payload = await create_party_registration(payload)
+
+            ven_name = payload.get('ven_name')
+            if ven_name and response_payload.get('ven_id'):
+                poll_freq = self.poll_schedule.poll_freq(ven_name, len(self.registered_vens))
+                response_payload['requested_oadr_poll_freq'] = poll_freq
+                await asyncio.sleep(self.poll_schedule.registration_delay(ven_name, poll_freq))
+
+            return response_type, response_payload
+
+        return create_party_registration_scheduled
+
     async def on_register_report(self, ven_id, resource_id, measurement, unit, scale,
                                  min_sampling_interval, max_sampling_interval):
         callback = self._create_report_callback(ven_id=ven_id, resource_id=resource_id, measurement=measurement)
@@ -171,7 +277,7 @@ class VTNPollServer(OpenADRServer):
         created_reports = self.services['report_service'].created_reports[ven_id]
 
         report_callbacks = self.services['report_service'].report_callbacks
-        report_callbacks_info = self.ven_info[ven_id]['report_callbacks']
+        report_callbacks_info = self.ven_info[ven_id].report_callbacks
 
         resource_ids = set()
 
@@ -182,18 +288,18 @@ class VTNPollServer(OpenADRServer):
 
             for (rr_id, r_id), callback in report_callbacks.items():
                 if report_request_id == rr_id:
-                    measurement = callback.keywords['measurement']
-                    resource_id = callback.keywords['resource_id']
+                    measurement = callback.measurement
+                    resource_id = callback.resource_id
 
                     resource_ids.add(resource_id)
 
                     if not r_id in report_callbacks_info[report_request_id]:
                         report_callbacks_info[report_request_id][r_id] = \
-                            dict(resource_id=resource_id, measurement=measurement)
+                            ReportBinding(resource_id=resource_id, measurement=measurement)
 
         for resource_id in resource_ids:
-            if not resource_id in self.ven_info[ven_id]['resource_ids']:
-                self.ven_info[ven_id]['resource_ids'].append(resource_id)
+            if not resource_id in self.ven_info[ven_id].resource_ids:
+                self.ven_info[ven_id].resource_ids.append(resource_id)
 
         self._ven_info_backup.update(self.ven_info)
 
@@ -201,9 +307,11 @@ class VTNPollServer(OpenADRServer):
         """
         Callback that receives report data from the VEN and handles it.
         """
-        for time, value in data:
-            time_series.set(value)
-            LOGGER.info(f'VEN {ven_id} reported {measurement} = {value} at time {time} for resource {resource_id}')
+        with track('on_update_report'):
+            for time, value in data:
+                time_series.set(value)
+                self._time_series_db.report_aggregator.add(ven_id, resource_id, measurement, time, value)
+                LOGGER.info(f'VEN {ven_id} reported {measurement} = {value} at time {time} for resource {resource_id}')
 
     async def on_event_response(self, ven_id, event_id, opt_type):
         """
@@ -216,16 +324,16 @@ class VTNPollServer(OpenADRServer):
         LOGGER.debug(f'VEN LOOKUP CALLED FOR {ven_id}')
 
         if ven_id in self.ven_info:
-            ven_name = self.ven_info[ven_id]['ven_name']
+            ven_name = self.ven_info[ven_id].ven_name
             if ven_name in self.registered_vens:
-                return {'registration_id': self.ven_info[ven_id]['registration_id']}
+                return {'registration_id': self.ven_info[ven_id].registration_id}
         return None
 
     def _create_report_callback(self, ven_id, resource_id, measurement, report_request_id=None, r_id=None):
         report_ts, _ = self._time_series_db.add_time_series(ven_id, resource_id, measurement, self.EVENT_TYPE)
 
-        callback = partial(self.on_update_report, ven_id=ven_id, resource_id=resource_id,
-                           measurement=measurement, time_series=report_ts)
+        callback = ReportCallback(self.on_update_report, ven_id=ven_id, resource_id=resource_id,
+                                  measurement=measurement, time_series=report_ts)
 
         # Append the callback to our list of known callbacks
         if report_request_id and r_id:
@@ -236,23 +344,21 @@ class VTNPollServer(OpenADRServer):
     def _get_ven_info(self, ven_name):
         if ven_name in self.registered_vens:
             ven_id = self.registered_vens[ven_name]
-            registration_id = self.ven_info[ven_id]['registration_id']
+            registration_id = self.ven_info[ven_id].registration_id
         else:
             ven_info = find_by(self.ven_info, 'ven_name', ven_name)
 
             if ven_info:
-                ven_id = ven_info['ven_id']
-                registration_id = ven_info['registration_id']
+                ven_id = ven_info.ven_id
+                registration_id = ven_info.registration_id
             else:
                 ven_id = 'VEN_ID_{}'.format(ven_name)
                 registration_id = 'REG_ID_{}'.format(ven_name)
 
-                self.ven_info[ven_id] = dict(
+                self.ven_info[ven_id] = VENRecord(
                     ven_id=ven_id,
                     ven_name=ven_name,
                     registration_id=registration_id,
-                    resource_ids=[],
-                    report_callbacks={},
                 )
 
             self.registered_vens[ven_name] = ven_id
@@ -1,13 +1,32 @@
 import asyncio
-from functools import partial
+import dataclasses
+import hmac
+import json
+import time
 from datetime import datetime, timezone, timedelta
+from functools import partial
+from hashlib import sha256
+from aiohttp import ClientError, ClientTimeout
+from aiohttp.web import json_response, middleware, Response
 from openleadr_push_mode import OpenADRServerPushMode
+from openleadr import enums, objects, utils
 from openleadr.enums import SI_SCALE_CODE
-import random
-
+from prometheus_client import Counter
+
+from .dispatch_planner import DispatchPlanner
+from .priority_lanes import PriorityLanes
+from .push_transport import PushTransport
+from .raw_message import find_response_code, find_ven_identifier
+from .runtime_profile import RuntimeProfile
+from .ven_records import ReportCallback
+from .shard_ring import ShardRing
+from .instrumentation import EVENT_DISPATCH_LATENCY, track
 from .time_series_database import TimeSeriesDatabase
 from .logger import *
 
+SHARD_FORWARD_FAILURES = Counter('vtn_shard_forward_failures',
+                                 'Requests that could not be forwarded to their shard (handled locally)', ['shard_id'])
+
 class VTNPushServerWithPreregistration(OpenADRServerPushMode):
 
     EVENT_TYPE = 'LOAD_DISPATCH'
@@ -20,18 +39,67 @@ class VTNPushServerWithPreregistration(OpenADRServerPushMode):
     TIME_SERIES_DB_HOST_URL = 'http://prometheus:9090'
     TIME_SERIES_DB_CLIENT_PORT = 8000
 
-    def __init__(self, vtn_id, ven_preregistration_list, **args):
+    # Range of random event values (used if there is no flex forecast).
+    EVENT_VALUE_RANGE = (0., 10.)
+
+    # Timeout [s] of a push to a VEN.
+    PUSH_TIMEOUT = 10.
+
+    # Maximum number of concurrent pushes if the connection pool is not limited.
+    MAX_CONCURRENT_PUSHES = 100
+
+    DEFAULT_SHARD_ID = 'vtn'
+    SHARD_FORWARDED_HEADER = 'X-VTN-Shard-Forwarded'
+    SHARD_MEMBERSHIP_PATH = '/shard_membership'
+
+    def __init__(self, vtn_id, ven_preregistration_list, shard_id=None, shard_members=None, shard_secret=None,
+                 **args):
         super().__init__(vtn_id=vtn_id, **args)
 
+        self.vtn_id = vtn_id
         self.ven_preregistration_list = ven_preregistration_list
+        self.preregistered_vens = set()
+
+        # Split the VEN pre-registration list across all shards (VTN instances).
+        # Shard members map the shard IDs to their internal base URLs, which are
+        # used for forwarding requests from VENs owned by other shards.
+        self.shard_id = shard_id or self.DEFAULT_SHARD_ID
+        self.shard_members = dict(shard_members or {})
+        self.shard_members.setdefault(self.shard_id, None)
+        self._shard_ring = ShardRing(self.shard_members.keys())
+
+        # Membership changes are sent to all shards, the latest change (by time) wins.
+        self._shard_membership_time = 0.
+
+        # Forwarded requests are signed with a secret shared by all shards, so that
+        # VENs cannot bypass the routing by sending the forwarding header.
+        self._shard_secret = shard_secret.encode('utf-8') if shard_secret else None
+        if len(self.shard_members) > 1 and not self._shard_secret:
+            raise ValueError('A shard secret is required for more than one shard.')
+
+        # Outbound HTTP connections (events pushed to VENs, requests forwarded to shards) share a single
+        # connection pool.
+        self.runtime_profile = RuntimeProfile()
+        self.push_transport = PushTransport(self.runtime_profile)
+
+        self._ven_names = {info['ven_id']: ven_name for ven_name, info in ven_preregistration_list.items()}
+
+        self.app.middlewares.append(self._shard_routing_middleware)
+        self.app.router.add_post(self.SHARD_MEMBERSHIP_PATH, self._on_shard_membership)
 
         self._time_series_db = TimeSeriesDatabase(vtn_id=vtn_id, db_host_url=self.TIME_SERIES_DB_HOST_URL,
                                                   db_client_port=self.TIME_SERIES_DB_CLIENT_PORT)
 
+        self.dispatch_planner = DispatchPlanner(vtn_id=vtn_id, time_series_db=self._time_series_db,
+                                                event_type=self.EVENT_TYPE, fallback_range=self.EVENT_VALUE_RANGE,
+                                                with_current_values=True)
+
         self.periodic_event_tasks = {}
+        self._report_aggregation_task = None
 
-        # Init random number generator.
-        random.seed(0)
+        # Priority lanes of event creation (high) and report post-processing (low), see
+        # 'patch_priority_lanes' for the requests.
+        self.priority_lanes = PriorityLanes()
 
     async def run(self):
         """
@@ -43,8 +111,15 @@ class VTNPushServerWithPreregistration(OpenADRServerPushMode):
         # Add the handler for report pre-registration
         self.add_handler('on_register_report', self.on_preregister_report)
 
+        # Use the connection pool settings of the runtime profile (see 'patch_runtime_profile').
+        self.push_transport.runtime_profile = self.runtime_profile
+
         await super().run()
 
+        # Create task for exporting the report aggregates (low priority lane)
+        self._report_aggregation_task = asyncio.create_task(
+            self._time_series_db.report_aggregator.run_export(lane=partial(self.priority_lanes.lane, 'low')))
+
         # Create task for VEN pre-registration
         await self.preregister_vens()
 
@@ -54,7 +129,118 @@ class VTNPushServerWithPreregistration(OpenADRServerPushMode):
         """
         for task in self.periodic_event_tasks.values():
             task.cancel()
+        if self._report_aggregation_task:
+            self._report_aggregation_task.cancel()
         await super().stop()
+        await self.push_transport.close()
+
+    def owns_ven(self, ven_name):
+        """
+        Check if a VEN is owned by this shard.
+        """
+        return self._shard_ring.owner(ven_name) == self.shard_id
+
+    async def shard_join(self, shard_id, url):
+        """
+        Add a shard (VTN instance) and hand over the VENs it owns from now on.
+        """
+        if not self._shard_secret:
+            LOGGER.error(f'Shard {shard_id} cannot join: no shard secret configured.')
+            return
+        LOGGER.info(f'SHARD {shard_id} JOINED ({url})')
+        self.shard_members[shard_id] = url
+        self._shard_ring.add(shard_id)
+        self._shard_membership_time = time.time()
+        await self.rebalance_shards()
+        await self._announce_shard_membership()
+
+    async def shard_leave(self, shard_id):
+        """
+        Remove a shard (VTN instance) and take over the VENs it owned so far.
+        """
+        if shard_id == self.shard_id:
+            LOGGER.error('A shard cannot remove itself.')
+            return
+        LOGGER.info(f'SHARD {shard_id} LEFT')
+        url = self.shard_members.pop(shard_id, None)
+        self._shard_ring.remove(shard_id)
+        self._shard_membership_time = time.time()
+        await self.rebalance_shards()
+        # The shard that left releases its VENs as well.
+        await self._announce_shard_membership(extra_members={shard_id: url})
+
+    async def _announce_shard_membership(self, extra_members=None):
+        """
+        Send the shard membership to all other shards (signed like forwarded requests).
+        """
+        content = json.dumps(dict(time=self._shard_membership_time, members=self.shard_members)).encode('utf-8')
+        headers = {'Content-Type': 'application/json',
+                   self.SHARD_FORWARDED_HEADER: f'{self.shard_id} {self._shard_signature(self.shard_id, content)}'}
+
+        async def announce(shard_id, url):
+            try:
+                async with self.push_transport.session.post(url.rstrip('/') + self.SHARD_MEMBERSHIP_PATH,
+                                                            data=content, headers=headers) as response:
+                    if 200 != response.status:
+                        LOGGER.error(f'Shard {shard_id} rejected the shard membership (HTTP status {response.status})')
+            except (ClientError, asyncio.TimeoutError) as e:
+                LOGGER.error(f'Failed to send the shard membership to shard {shard_id}: {e!r}')
+
+        members = {**self.shard_members, **(extra_members or {})}
+        await asyncio.gather(*[announce(shard_id, url) for shard_id, url in members.items()
+                               if shard_id != self.shard_id and url])
+
+    async def _on_shard_membership(self, request):
+        """
+        Apply a shard membership sent by another shard and rebalance the VENs.
+        """
+        content = await request.read()
+        if not self._is_signed_by_shard(request.headers.get(self.SHARD_FORWARDED_HEADER, ''), content,
+                                        known_shard=False):
+            LOGGER.warning(f'REJECTED SHARD MEMBERSHIP WITH INVALID SIGNATURE FROM {request.remote}')
+            return Response(status=403)
+
+        membership = json.loads(content)
+        if membership['time'] <= self._shard_membership_time:
+            return json_response(dict(applied=False))
+
+        # Keep the known URLs of shards that do not know their own URL.
+        members = {shard_id: url or self.shard_members.get(shard_id)
+                   for shard_id, url in membership['members'].items()}
+        if self.shard_id not in members:
+            LOGGER.info(f'SHARD {self.shard_id} LEFT, RELEASING ALL VENS')
+        members[self.shard_id] = self.shard_members.get(self.shard_id)
+        LOGGER.info(f'SHARD MEMBERSHIP CHANGED: {", ".join(sorted(membership["members"]))}')
+
+        self._shard_membership_time = membership['time']
+        self.shard_members = members
+        self._shard_ring = ShardRing(membership['members'].keys())
+        await self.rebalance_shards()
+        return json_response(dict(applied=True))
+
+    async def rebalance_shards(self):
+        """
+        Release VENs that are now owned by other shards and pre-register VENs
+        that are now owned by this shard.
+        """
+        for ven_name in [ven_name for ven_name in self.preregistered_vens if not self.owns_ven(ven_name)]:
+            ven_id = self.ven_preregistration_list[ven_name]['ven_id']
+            LOGGER.info(f'HAND OVER {ven_id} TO SHARD {self._shard_ring.owner(ven_name)}')
+
+            for event_task_id in [id for id in self.periodic_event_tasks if id.startswith(ven_id + '_')]:
+                self.periodic_event_tasks.pop(event_task_id).cancel()
+
+            # Stop ingesting reports of the VEN (its report callbacks are keyed by report request ID and r_id).
+            report_request_ids = {report['report_request_id']
+                                  for report in self.ven_preregistration_list[ven_name]['reports']}
+            report_callbacks = self.services['report_service'].report_callbacks
+            for key in [key for key in report_callbacks if key[0] in report_request_ids]:
+                del report_callbacks[key]
+
+            self._time_series_db.report_aggregator.remove_ven(ven_id)
+            self.preregistered_vens.discard(ven_name)
+
+        await self.preregister_vens()
 
     async def on_party_preregistration(self, registration_info):
         """
@@ -84,9 +270,15 @@ class VTNPushServerWithPreregistration(OpenADRServerPushMode):
         """
         Callback that receives report data from the VEN and handles it.
         """
-        for time, value in data:
-            time_series.set(value)
-            LOGGER.info(f'VEN {ven_id} reported {measurement} = {value} at time {time} for resource {resource_id}')
+        # Ignore reports of VENs that have been handed over to another shard.
+        if self._ven_names.get(ven_id) not in self.preregistered_vens:
+            return
+
+        with track('on_update_report'):
+            for time, value in data:
+                time_series.set(value)
+                self._time_series_db.report_aggregator.add(ven_id, resource_id, measurement, time, value)
+                LOGGER.info(f'VEN {ven_id} reported {measurement} = {value} at time {time} for resource {resource_id}')
 
     async def preregister_vens(self):
         """
@@ -98,7 +290,12 @@ class VTNPushServerWithPreregistration(OpenADRServerPushMode):
 
         for ven_name, ven_info in self.ven_preregistration_list.items():
 
+            # Only pre-register VENs owned by this shard.
+            if ven_name in self.preregistered_vens or not self.owns_ven(ven_name):
+                continue
+
             ven_id, _ = await self.pre_register_ven(ven_name=ven_name, transport_address=ven_info['url'])
+            self.preregistered_vens.add(ven_name)
 
             report_info = ven_info['reports']
             for report in report_info:
@@ -119,55 +316,19 @@ class VTNPushServerWithPreregistration(OpenADRServerPushMode):
         """
         await asyncio.sleep(delay)
 
+        if self._ven_names.get(ven_id) not in self.preregistered_vens:
+            LOGGER.error(f'VEN ID = "{ven_id}" is unknown or owned by another shard')
+            return
+
         try:
             while True:
 
-                event_targets = self._time_series_db.events_time_series[ven_id]
-
-                for resoure_id, time_series in event_targets.items():
-
-                    if not value:
-                        time_series_name = '{}:FLEX:{}:{}'.format(self.vtn_id, ven_id, resoure_id)
-                        event_value = self._time_series_db.get_latest_value(time_series_name)
-
-                        if not event_value:
-                            LOGGER.info('NO FLEX FORECAST FOUND, USE RANDOM VALUE INSTEAD')
-                            event_value = round(random.uniform(0., 10.), 2)
-                    else:
-                        event_value = value
-                        LOGGER.info('USER-DEFINED FLEX FORECAST VALUE')
-
-                    time_series_name = '{}:EVENT:{}:{}:{}'.format(self.vtn_id, ven_id, resoure_id, self.EVENT_TYPE)
-                    current_value = self._time_series_db.get_latest_value(time_series_name)
-                    LOGGER.info(f'TIME_SERIES_NAME: {time_series_name}')
-                    LOGGER.info(f'CURRENT VALUE: {current_value}')
-
-                    id = await self.push_event(
-                        ven_id=ven_id,
-                        priority=1,
-                        signal_name=self.EVENT_TYPE,
-                        signal_type='delta',
-                        measurement_name='REAL_POWER',
-                        scale='k',
-                        intervals=[{'dtstart': datetime.now(tz=timezone.utc) + timedelta(minutes=5),
-                                    'duration': timedelta(minutes=10),
-                                    'signal_payload': event_value}],
-                        market_context='oadr://my_market',
-                        current_value=current_value,
-                        response_required='never',
-                        callback=self.event_response_callback
-                        )
-
-                    if id != None:
-                        LOGGER.info(f'Successfully added event with ID={id}')
-                        time_series.set(event_value)
-                    elif event_task_id:
-                        LOGGER.error(
-                            'Failed to add event, cancelling periodic event task ...')
-                        event_task = self.periodic_event_tasks.pop(event_task_id)
-                        event_task.cancel()
-                    else:
-                        LOGGER.error('Failed to add event ...')
+                async with self.priority_lanes.lane('high'):
+                    with track('add_new_event'):
+                        event_targets = self._time_series_db.events_time_series[ven_id]
+                        plan = self.dispatch_planner.plan([(ven_id, resource_id) for resource_id in event_targets],
+                                                          value)
+                        await self._push_planned_events(plan, event_task_id)
 
                 if period:
                     # await asyncio.sleep(period)
@@ -178,8 +339,196 @@ class VTNPushServerWithPreregistration(OpenADRServerPushMode):
         except Exception as e:
             LOGGER.error('Error: {}'.format(e))
 
+    async def add_fleet_event(self, ven_ids=None, value=None):
+        """
+        Push events to all resources of several VENs (default: all VENs owned by this shard) at once.
+        """
+        async with self.priority_lanes.lane('high'):
+            with track('add_fleet_event'):
+                events_time_series = self._time_series_db.events_time_series
+                ven_ids = ven_ids or [self.ven_preregistration_list[ven_name]['ven_id']
+                                      for ven_name in self.preregistered_vens]
+                ven_ids = [ven_id for ven_id in ven_ids
+                           if self._ven_names.get(ven_id) in self.preregistered_vens and ven_id in events_time_series]
+
+                plan = self.dispatch_planner.plan([(ven_id, resource_id) for ven_id in ven_ids
+                                                   for resource_id in events_time_series[ven_id]], value)
+                await self._push_planned_events(plan)
+                LOGGER.info(f'PUSHED FLEET EVENT TO {len(ven_ids)} VENS ({len(plan)} RESOURCES)')
+
+    async def _push_planned_events(self, plan, event_task_id=None):
+        """
+        Push the events of a dispatch plan (concurrently, at most as many pushes
+        as the connection pool has connections, see the runtime profile).
+        """
+        dtstart = datetime.now(tz=timezone.utc) + timedelta(minutes=5)
+        created = time.perf_counter()
+        concurrency = min(len(plan), self.runtime_profile.connector_limit or self.MAX_CONCURRENT_PUSHES)
+        planned_events = iter(plan)
+
+        async def push_planned_events():
+            for ven_id, resource_id, event_value, current_value in planned_events:
+                await self._push_planned_event(ven_id, resource_id, event_value, current_value, dtstart,
+                                               event_task_id, created)
+
+        await asyncio.gather(*[push_planned_events() for _ in range(concurrency)])
+
+    async def _push_planned_event(self, ven_id, resource_id, event_value, current_value, dtstart, event_task_id,
+                                  created):
+        LOGGER.info(f'CURRENT VALUE OF {ven_id}:{resource_id}: {current_value}')
+
+        id = await self.push_event(
+            ven_id=ven_id,
+            priority=1,
+            signal_name=self.EVENT_TYPE,
+            signal_type='delta',
+            measurement_name='REAL_POWER',
+            scale='k',
+            intervals=[{'dtstart': dtstart,
+                        'duration': timedelta(minutes=10),
+                        'signal_payload': event_value}],
+            market_context='oadr://my_market',
+            current_value=current_value,
+            response_required='never',
+            callback=self.event_response_callback
+            )
+
+        if id != None:
+            EVENT_DISPATCH_LATENCY.observe(time.perf_counter() - created)
+            LOGGER.info(f'Successfully added event with ID={id}')
+            self._time_series_db.events_time_series[ven_id][resource_id].set(event_value)
+        elif event_task_id in self.periodic_event_tasks:
+            LOGGER.error(
+                'Failed to add event, cancelling periodic event task ...')
+            event_task = self.periodic_event_tasks.pop(event_task_id)
+            event_task.cancel()
+        else:
+            LOGGER.error('Failed to add event ...')
+
+    async def push_event(self, ven_id, signal_name, signal_type, intervals, priority=0, measurement_name=None,
+                         scale=None, market_context='oadr://unknown.context', current_value=None,
+                         response_required='always', callback=None):
+        """
+        Push an event to a VEN via the shared connection pool (replaces the
+        push-mode library's method, which opens a client session per push).
+        Return the event ID, or None if the VEN did not accept the event.
+        """
+        ven_name = self._ven_names.get(ven_id)
+        if ven_name not in self.ven_preregistration_list:
+            LOGGER.error(f'Cannot push event to unknown VEN {ven_id}')
+            return None
+
+        event = self._create_event(ven_id, signal_name, signal_type, intervals, priority, measurement_name, scale,
+                                   market_context, current_value, response_required)
+        event_id = event.event_descriptor.event_id
+
+        # The event service handles the VEN's response to the event (oadrCreatedEvent).
+        if callback is not None and 'always' == response_required:
+            self.event_callbacks[event_id] = (event, callback)
+
+        message = self.services['event_service']._create_message(
+            'oadrDistributeEvent', request_id=utils.generate_id(), vtn_id=self.vtn_id, events=[event])
+        url = self.ven_preregistration_list[ven_name]['url'].rstrip('/') + '/EiEvent'
+        try:
+            async with self.push_transport.session.post(url, data=message,
+                                                        headers={'Content-Type': 'application/xml'},
+                                                        timeout=ClientTimeout(total=self.PUSH_TIMEOUT)) as response:
+                content = await response.read()
+                status = response.status
+        except (ClientError, asyncio.TimeoutError) as e:
+            LOGGER.error(f'Failed to push event to VEN {ven_id}: {e!r}')
+            status, content = None, b''
+
+        response_code = find_response_code(content)
+        if 200 != status or (response_code is not None and not response_code.startswith('2')):
+            LOGGER.error(f'VEN {ven_id} did not accept event {event_id} (HTTP status {status}, '
+                         f'response code {response_code})')
+            self.event_callbacks.pop(event_id, None)
+            return None
+        return event_id
+
+    def _create_event(self, ven_id, signal_name, signal_type, intervals, priority=0, measurement_name=None,
+                      scale=None, market_context='oadr://unknown.context', current_value=None,
+                      response_required='always'):
+        measurement = None
+        if measurement_name is not None:
+            measurement = dataclasses.replace(getattr(enums.MEASUREMENTS, measurement_name), scale=scale)
+
+        return objects.Event(
+            event_descriptor=objects.EventDescriptor(event_id=utils.generate_id(), modification_number=0,
+                                                     market_context=market_context, event_status='far',
+                                                     created_date_time=datetime.now(timezone.utc),
+                                                     priority=priority),
+            event_signals=[objects.EventSignal(intervals=intervals, signal_name=signal_name,
+                                               signal_type=signal_type, signal_id=utils.generate_id(),
+                                               current_value=current_value, measurement=measurement)],
+            targets=[objects.Target(ven_id=ven_id)],
+            active_period=utils.get_active_period_from_intervals(intervals, False),
+            response_required=response_required)
+
     def _create_report_callback(self, ven_id, resource_id, measurement, report_request_id=None, r_id=None):
         report_ts, _ = self._time_series_db.add_time_series(ven_id, resource_id, measurement, self.EVENT_TYPE)
 
-        return partial(self.on_update_report, ven_id=ven_id, resource_id=resource_id,
-                       measurement=measurement, time_series=report_ts)
+        return ReportCallback(self.on_update_report, ven_id=ven_id, resource_id=resource_id,
+                              measurement=measurement, time_series=report_ts)
+
+    @middleware
+    async def _shard_routing_middleware(self, request, handler):
+        """
+        Forward requests from VENs owned by another shard to that shard, so
+        that all shards are reachable via the same OpenADR-facing URL.
+        """
+        forwarded_by = request.headers.get(self.SHARD_FORWARDED_HEADER)
+        if (len(self.shard_members) < 2 and not forwarded_by) or self.SHARD_MEMBERSHIP_PATH == request.path:
+            return await handler(request)
+
+        content = await request.read()
+        if forwarded_by:
+            # Only requests signed by a known shard skip the routing.
+            if not self._is_signed_by_shard(forwarded_by, content):
+                LOGGER.warning(f'REJECTED REQUEST WITH INVALID SHARD FORWARDING HEADER FROM {request.remote}')
+                return Response(status=403)
+            return await handler(request)
+
+        identifier = find_ven_identifier(content)
+        if identifier is None:
+            return await handler(request)
+
+        kind, identifier = identifier
+        ven_name = self._ven_names.get(identifier) if 'venID' == kind else identifier
+        shard_id = self._shard_ring.owner(ven_name) if ven_name in self.ven_preregistration_list else None
+
+        if shard_id in (None, self.shard_id):
+            return await handler(request)
+
+        try:
+            return await self._forward_to_shard(shard_id, request, content)
+        except (ClientError, asyncio.TimeoutError) as e:
+            # Handle this request locally; the shard keeps its VENs until it leaves
+            # explicitly (see 'shard_leave'), otherwise two shards would own them.
+            LOGGER.error(f'Failed to forward request to shard {shard_id}: {e!r}')
+            SHARD_FORWARD_FAILURES.labels(shard_id).inc()
+            return await handler(request)
+
+    def _shard_signature(self, shard_id, content):
+        return hmac.new(self._shard_secret, shard_id.encode('utf-8') + b'\n' + content, sha256).hexdigest()
+
+    def _is_signed_by_shard(self, forwarded_by, content, known_shard=True):
+        """
+        Check the forwarding header ('<shard ID> <signature>') of a request.
+        """
+        shard_id, _, signature = forwarded_by.partition(' ')
+        if not self._shard_secret or shard_id == self.shard_id:
+            return False
+        if known_shard and shard_id not in self.shard_members:
+            return False
+        return hmac.compare_digest(self._shard_signature(shard_id, content), signature)
+
+    async def _forward_to_shard(self, shard_id, request, content):
+        url = self.shard_members[shard_id].rstrip('/') + request.path_qs
+        headers = {'Content-Type': request.headers.get('Content-Type', 'application/xml'),
+                   self.SHARD_FORWARDED_HEADER: f'{self.shard_id} {self._shard_signature(self.shard_id, content)}'}
+
+        async with self.push_transport.session.post(url, data=content, headers=headers) as response:
+            return Response(body=await response.read(), status=response.status,
+                            content_type=response.content_type)
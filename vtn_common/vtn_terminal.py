@@ -1,39 +1,139 @@
+import asyncio
 import socket
 
 TERMINAL = None
 TERMINAL_PROMPT = 'monitor >>> '
 
+# Maximum number of commands sent ahead of their responses in batch mode. This
+# avoids a deadlock when both socket buffers are full (the monitor blocks on
+# writing the output, the terminal on writing further commands).
+BATCH_WINDOW = 64
+
 class Netcat:
     ''' 
     Python "netcat like" module.
     Based on: https://gist.github.com/leonjza/f35a7252babdf77c8421
     '''
 
+    RECV_SIZE = 65536
+
     def __init__(self, ip, port):
-        self.buff = ''
+        self.buff = bytearray()
+        self._scan_pos = 0
+        self._chunk = memoryview(bytearray(self.RECV_SIZE))
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.connect((ip, port))
 
     def write(self, data):
-        self.socket.send(data)
+        self.socket.sendall(data)
 
     def read_until(self, data):
         '''
         Read data into the buffer until we have data 
         '''
-        while not data in self.buff:
-            self.buff += self.socket.recv(1024).decode('utf-8')
- 
-        pos = self.buff.find(data)
-        rval = self.buff[:pos + len(data)]
-        self.buff = self.buff[pos + len(data):]
- 
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+
+        # Only the new data (plus a possibly split separator) is searched.
+        pos = self.buff.find(data, self._scan_pos)
+        while pos < 0:
+            self._scan_pos = max(0, len(self.buff) - len(data) + 1)
+            n = self.socket.recv_into(self._chunk)
+            if not n:
+                raise ConnectionError('Connection closed by the monitor')
+            self.buff += self._chunk[:n]
+            pos = self.buff.find(data, self._scan_pos)
+
+        end = pos + len(data)
+        rval = self.buff[:end].decode('utf-8')
+        del self.buff[:end]
+        self._scan_pos = 0
+
         return rval
- 
+
+    def batch(self, commands, window=BATCH_WINDOW):
+        '''
+        Send many commands over the connection without waiting for each
+        response (pipelining). Return the outputs in the order of the commands.
+        '''
+        commands = list(commands)
+        outputs = []
+        sent = 0
+        while len(outputs) < len(commands):
+            # Keep up to 'window' commands in flight.
+            if sent < len(commands) and sent - len(outputs) < window:
+                end = min(len(commands), len(outputs) + window)
+                self.write(''.join(command + '\n' for command in commands[sent:end]).encode('utf-8'))
+                sent = end
+            outputs.append(_strip_prompt(self.read_until(TERMINAL_PROMPT)))
+        return outputs
+
+class AsyncTerminal:
+    '''
+    Asyncio variant of the terminal, to be used from scripts and tools that
+    run an event loop.
+    '''
+
+    STREAM_LIMIT = 2 ** 24
+
+    def __init__(self, host='localhost', port=5001):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port, limit=self.STREAM_LIMIT)
+        await self._reader.readuntil(TERMINAL_PROMPT.encode('utf-8'))
+        return self
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def cmd(self, str_cmd):
+        return (await self.batch([str_cmd]))[0]
+
+    async def batch(self, commands, window=BATCH_WINDOW):
+        '''
+        Pipeline commands, see 'Netcat.batch'.
+        '''
+        commands = list(commands)
+        outputs = []
+        prompt = TERMINAL_PROMPT.encode('utf-8')
+        async with self._lock:
+            sent = 0
+            while len(outputs) < len(commands):
+                if sent < len(commands) and sent - len(outputs) < window:
+                    end = min(len(commands), len(outputs) + window)
+                    self._writer.write(''.join(command + '\n' for command in commands[sent:end]).encode('utf-8'))
+                    await self._writer.drain()
+                    sent = end
+                output = await self._reader.readuntil(prompt)
+                outputs.append(_strip_prompt(output.decode('utf-8')))
+        return outputs
+
+def _strip_prompt(output):
+    return output[:-len(TERMINAL_PROMPT)] if output.endswith(TERMINAL_PROMPT) else output
+
 def _cmd(str_cmd):
     TERMINAL.write(bytes(str_cmd + '\n', 'utf-8'))
     ret = TERMINAL.read_until(TERMINAL_PROMPT)
-    print(ret.rstrip(TERMINAL_PROMPT))
+    print(_strip_prompt(ret).rstrip())
+
+def batch(commands, quiet=False):
+    outputs = TERMINAL.batch(commands)
+    if not quiet:
+        for output in outputs:
+            print(output.rstrip())
+    return outputs
 
 def ps():
     _cmd('ps')
@@ -62,12 +162,96 @@ def ase(ven_id):
 def add_single_event(ven_id):
     _cmd(f'ase {ven_id}')
 
+def ases(ven_ids):
+    add_single_events(ven_ids)
+
+def add_single_events(ven_ids):
+    batch([f'ase {ven_id}' for ven_id in ven_ids], quiet=True)
+
+def afe(value=None):
+    add_fleet_event(value)
+
+def add_fleet_event(value=None):
+    _cmd(f'afe {value}' if value is not None else 'afe')
+
 def ape(ven_id, period):
     add_periodic_event(period, ven_id)
 
 def add_periodic_event(ven_id, period):
     _cmd(f'ape {ven_id} {period}')
 
+def sj(shard_id, url):
+    shard_join(shard_id, url)
+
+def shard_join(shard_id, url):
+    _cmd(f'sj {shard_id} {url}')
+
+def sl(shard_id):
+    shard_leave(shard_id)
+
+def shard_leave(shard_id):
+    _cmd(f'sl {shard_id}')
+
+def ss():
+    shard_status()
+
+def shard_status():
+    _cmd('ss')
+
+def pool(n=10):
+    push_pool(n)
+
+def push_pool(n=10):
+    _cmd(f'pool {n}')
+
+def lag():
+    event_loop_lag()
+
+def event_loop_lag():
+    _cmd('lag')
+
+def slow(n=10):
+    slow_callbacks(n)
+
+def slow_callbacks(n=10):
+    _cmd(f'slow {n}')
+
+def prof(seconds, n=20):
+    profile(seconds, n)
+
+def profile(seconds, n=20):
+    _cmd(f'prof {seconds} {n}')
+
+def profr():
+    profile_report()
+
+def profile_report():
+    _cmd('profr')
+
+def vens(n=10):
+    ven_statistics(n)
+
+def ven_statistics(n=10):
+    _cmd(f'vens {n}')
+
+def adm(n=10):
+    admission_control(n)
+
+def admission_control(n=10):
+    _cmd(f'adm {n}')
+
+def cb():
+    circuit_breakers()
+
+def circuit_breakers():
+    _cmd('cb')
+
+def lanes():
+    priority_lanes()
+
+def priority_lanes():
+    _cmd('lanes')
+
 def start_terminal(port=5001):
     global TERMINAL
     TERMINAL = Netcat('localhost', port)
@@ -1,9 +1,16 @@
 import asyncio
+import os
 import socket
 from datetime import timedelta
 from vtn_common import VTNPollServer, VTNMonitor
 from vtn_common.patch_report_request import patch_report_request
 from vtn_common.patch_update_report import patch_update_report
+from vtn_common.message_fast_path import patch_message_fast_path
+from vtn_common.admission_control import patch_admission_control
+from vtn_common.priority_lanes import patch_priority_lanes
+from vtn_common.instrumentation import patch_instrumentation
+from vtn_common.traffic_capture import patch_traffic_capture
+from vtn_common.runtime_profile import RuntimeProfile, patch_runtime_profile
 
 VTN_ID = 'VTN_AIT'
 VTN_HOST = socket.gethostbyname(socket.gethostname())
@@ -11,6 +18,12 @@ VTN_HOST = socket.gethostbyname(socket.gethostname())
 VTN_PORT = 8082
 VTN_MONITOR_PORT = 5001
 
+# Runtime profile for event loop and HTTP server ('default' or 'tuned').
+VTN_RUNTIME_PROFILE = os.environ.get('VTN_RUNTIME_PROFILE', 'default')
+
+# Optional: file for capturing the OpenADR messages (e.g., for replaying them against a dev build).
+VTN_TRAFFIC_CAPTURE = os.environ.get('VTN_TRAFFIC_CAPTURE', '')
+
 REQUESTED_POLL_FREQ = timedelta(seconds=5)
 
 # Run the server and the monitor in the asyncio event loop.
@@ -20,6 +33,10 @@ if __name__ == '__main__':
     # import logging
     # LOGGER.setLevel(logging.DEBUG)
 
+    # Select the runtime profile (must be done before creating the event loop).
+    runtime_profile = RuntimeProfile(VTN_RUNTIME_PROFILE)
+    runtime_profile.install_event_loop_policy()
+
     # Create the server object
     vtn_server = VTNPollServer(vtn_id=VTN_ID, http_host=VTN_HOST, http_port=VTN_PORT,
                                requested_poll_freq=REQUESTED_POLL_FREQ)
@@ -29,6 +46,30 @@ if __name__ == '__main__':
     # report interval.
     patch_update_report(vtn=vtn_server, vtn_id=VTN_ID)
 
+    # This function adds fast paths for constant responses (pre-rendered per
+    # VEN) and for parsing large report updates.
+    patch_message_fast_path(vtn=vtn_server)
+
+    # This function adds per-VEN rate and concurrency limits, so that a
+    # misbehaving VEN cannot slow down the VTN for all other VENs.
+    patch_admission_control(vtn=vtn_server)
+
+    # This function schedules the requests in priority lanes, so that event
+    # dispatch is not delayed by report ingestion.
+    patch_priority_lanes(vtn=vtn_server)
+
+    # This function adds latency histograms for all OpenADR services and a
+    # probe for the event loop lag.
+    patch_instrumentation(vtn=vtn_server)
+
+    # This function records the OpenADR messages received and sent by the VTN
+    # to a capture file (see 'benchmark/traffic_replay.py').
+    if VTN_TRAFFIC_CAPTURE:
+        patch_traffic_capture(vtn=vtn_server, path=VTN_TRAFFIC_CAPTURE)
+
+    # This function applies the runtime profile to the VTN's HTTP server.
+    patch_runtime_profile(vtn=vtn_server, profile=runtime_profile)
+
     # Create the asyncio event loop.
     loop = asyncio.new_event_loop()
 
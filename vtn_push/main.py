@@ -1,7 +1,14 @@
 import asyncio
+import os
 import socket
 import openleadr_drpg_messages
 from vtn_common import VTNPushServerWithPreregistration, VTNMonitor
+from vtn_common.message_fast_path import patch_message_fast_path
+from vtn_common.admission_control import patch_admission_control
+from vtn_common.priority_lanes import patch_priority_lanes
+from vtn_common.instrumentation import patch_instrumentation
+from vtn_common.traffic_capture import patch_traffic_capture
+from vtn_common.runtime_profile import RuntimeProfile, patch_runtime_profile
 
 VTN_ID = 'VTN_AIT'
 VTN_HOST = socket.gethostbyname(socket.gethostname())
@@ -9,6 +16,21 @@ VTN_HOST = socket.gethostbyname(socket.gethostname())
 VTN_PORT = 8081
 VTN_MONITOR_PORT = 5000
 
+# Runtime profile for event loop and HTTP server ('default' or 'tuned').
+VTN_RUNTIME_PROFILE = os.environ.get('VTN_RUNTIME_PROFILE', 'default')
+
+# Optional: file for capturing the OpenADR messages (e.g., for replaying them against a dev build).
+VTN_TRAFFIC_CAPTURE = os.environ.get('VTN_TRAFFIC_CAPTURE', '')
+
+# Optional: split the VEN pre-registration list across several VTN instances.
+# VTN_SHARD_MEMBERS is a comma-separated list of '<shard ID>=<internal URL>',
+# e.g. 'vtn-hpt-1=http://vtn-hpt-1:8081,vtn-hpt-2=http://vtn-hpt-2:8081'.
+VTN_SHARD_ID = os.environ.get('VTN_SHARD_ID', socket.gethostname())
+VTN_SHARD_MEMBERS = dict(member.split('=', 1) for member in
+                         os.environ.get('VTN_SHARD_MEMBERS', '').split(',') if member)
+# Secret shared by all shards for signing forwarded requests (required for more than one shard).
+VTN_SHARD_SECRET = os.environ.get('VTN_SHARD_SECRET', '')
+
 VEN_NAME_001 = 'HOUSE_001'
 VEN_NAME_002 = 'HOUSE_002'
 
@@ -49,11 +71,42 @@ if __name__ == '__main__':
     # Use alternative XML templates for OpenADR messages.
     openleadr_drpg_messages.enable()
 
+    # Select the runtime profile (must be done before creating the event loop).
+    runtime_profile = RuntimeProfile(VTN_RUNTIME_PROFILE)
+    runtime_profile.install_event_loop_policy()
+
     # Create the server object
     vtn_server = VTNPushServerWithPreregistration(vtn_id=VTN_ID, auto_register_report=False,
                                                   ven_preregistration_list=VEN_PREREGISTRATION_LIST,
+                                                  shard_id=VTN_SHARD_ID, shard_members=VTN_SHARD_MEMBERS,
+                                                  shard_secret=VTN_SHARD_SECRET,
                                                   http_host=VTN_HOST, http_port=VTN_PORT)
 
+    # This function adds fast paths for constant responses (pre-rendered per
+    # VEN) and for parsing large report updates.
+    patch_message_fast_path(vtn=vtn_server)
+
+    # This function adds per-VEN rate and concurrency limits, so that a
+    # misbehaving VEN cannot slow down the VTN for all other VENs.
+    patch_admission_control(vtn=vtn_server)
+
+    # This function schedules the requests in priority lanes, so that event
+    # dispatch is not delayed by report ingestion.
+    patch_priority_lanes(vtn=vtn_server)
+
+    # This function adds latency histograms for all OpenADR services and a
+    # probe for the event loop lag.
+    patch_instrumentation(vtn=vtn_server)
+
+    # This function records the OpenADR messages received and sent by the VTN
+    # to a capture file (see 'benchmark/traffic_replay.py').
+    if VTN_TRAFFIC_CAPTURE:
+        patch_traffic_capture(vtn=vtn_server, path=VTN_TRAFFIC_CAPTURE)
+
+    # This function applies the runtime profile to the VTN's HTTP server and
+    # outbound connections.
+    patch_runtime_profile(vtn=vtn_server, profile=runtime_profile)
+
     # Create the asyncio event loop.
     loop = asyncio.get_event_loop()
 